@@ -0,0 +1,48 @@
+"""
+Compares avg_board_brightness with estimate_board_brightness on the Raspberry Pi test image, once in its original
+size and once upscaled to the 3264x2448 resolution of the BufferlessVideoCapture.
+
+Run from the repository root with:
+    PYTHONPATH=src python benchmarks/board_brightness.py
+"""
+import json
+import os
+import timeit
+
+import cv2
+import numpy as np
+
+from BSP.BoardOrientation import BoardOrientation
+from BSP.detection.luminance_detection import avg_board_brightness, estimate_board_brightness
+
+RESOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "resources", "Pi")
+REPETITIONS = 20
+
+
+def benchmark(img, corners):
+    orientation = BoardOrientation(None, corners)
+    reference = avg_board_brightness(img, corners)
+    reference_time = timeit.timeit(lambda: avg_board_brightness(img, corners), number=REPETITIONS) / REPETITIONS
+    print("{}x{} avg_board_brightness: {:.2f} in {:.2f} ms".format(img.shape[1], img.shape[0], reference,
+                                                                    reference_time * 1000))
+
+    for stride in (1, 2, 4, 8):
+        estimate_board_brightness(img, orientation, stride)  # creates the cached mask
+        value = estimate_board_brightness(img, orientation, stride)
+        duration = timeit.timeit(lambda: estimate_board_brightness(img, orientation, stride),
+                                 number=REPETITIONS) / REPETITIONS
+        print("    stride {}: {:.2f} (error {:.2f}) in {:.2f} ms, {:.1f}x faster".format(
+            stride, value, abs(value - reference), duration * 1000, reference_time / duration))
+
+
+if __name__ == "__main__":
+    image = cv2.imread(os.path.join(RESOURCES, "pi_test.jpg"))
+    with open(os.path.join(RESOURCES, "pi_test.json")) as file:
+        board_corners = json.load(file)["corners"]
+
+    benchmark(image, board_corners)
+
+    scale = 3264 / image.shape[1]
+    large_image = cv2.resize(image, (3264, 2448))
+    large_corners = (np.array(board_corners) * [scale, 2448 / image.shape[0]]).astype(int).tolist()
+    benchmark(large_image, large_corners)
@@ -0,0 +1,63 @@
+"""
+Compares the encodings of the changes published by MQTTConnector: the JSON message per led of publish_changes, the
+JSON message per board of the batch mode and the compact binary message per board.
+For boards with an increasing number of leds that all change in the same frame, the encode cost per change and the
+bytes per change of the MQTT PUBLISH packets (QoS 0, fixed header, topic and payload) are printed.
+
+Run from the repository root with:
+    PYTHONPATH=src python benchmarks/change_encoding.py
+"""
+import timeit
+
+from publisher.connection.message.change_msg import BoardChanges
+from publisher.connection.mqtt.mqtt_connector import MQTTConnector
+
+CONFIG = {"topics": {"changes": "changes", "avail": "avail", "config": "config"}}
+LED_COUNTS = [4, 32, 256]
+REPETITIONS = 200
+
+
+class MeasuringConnector(MQTTConnector):
+    """Counts the bytes of the PUBLISH packets instead of sending them"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.bytes = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        payload = payload.encode() if isinstance(payload, str) else payload
+        remaining = 2 + len(topic.encode()) + len(payload)
+        length_bytes = 1
+        while remaining >= 128 ** length_bytes:
+            length_bytes += 1
+        self.bytes += 1 + length_bytes + remaining
+
+
+def measure(connector, publish, changes):
+    publish(changes)  # the compact encoder learns the schema
+    connector.bytes = 0
+    publish(changes)
+    size = connector.bytes / len(changes)
+    duration = timeit.timeit(lambda: publish(changes), number=REPETITIONS) / REPETITIONS
+    return duration / len(changes) * 1e6, size
+
+
+def per_led(connector):
+    def publish(changes):
+        for change in changes:
+            connector.publish_changes(change)
+    return publish
+
+
+if __name__ == "__main__":
+    json_connector = MeasuringConnector(CONFIG)
+    compact_connector = MeasuringConnector(dict(CONFIG, encoding="compact"))
+    for led_count in LED_COUNTS:
+        changes = [BoardChanges("raspberrypi", "LED_{}".format(i), "on" if i % 2 else "off", "green" if i % 2 else "",
+                                1.5, 1700000000.0 + i / 1000) for i in range(led_count)]
+        print("{} leds".format(led_count))
+        for name, connector, publish in [("json per led", json_connector, per_led(json_connector)),
+                                         ("json per board", json_connector, json_connector.publish_board_changes),
+                                         ("compact", compact_connector, compact_connector.publish_board_changes)]:
+            duration, size = measure(connector, publish, changes)
+            print("    {:15} {:6.2f} us and {:6.1f} bytes per change".format(name + ":", duration, size))
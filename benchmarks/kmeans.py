@@ -0,0 +1,38 @@
+"""
+Compares the scikit-learn based k_means with fast_k_means on the LED ROIs of the tests.
+fast_k_means is measured once without and once with centroids of a previous call for the same LED.
+
+Run from the repository root with:
+    PYTHONPATH=src python benchmarks/kmeans.py
+"""
+import os
+import timeit
+import warnings
+
+import cv2
+import numpy as np
+
+from BSP.LED.ColorDetection.KMeans import k_means, fast_k_means
+
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")
+ROIS = ["led_roi_yellow.jpg", "resources/red_led_roi.png", "resources/Pi/led_green.png", "resources/Pi/led_red.png"]
+REPETITIONS = 5
+
+
+def measure(function):
+    return timeit.timeit(function, number=REPETITIONS) / REPETITIONS * 1000
+
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore", FutureWarning)  # default n_init of scikit-learn
+    for path in ROIS:
+        img = cv2.imread(os.path.join(TESTS, path))
+        reference = k_means(img)
+        fast = fast_k_means(img)
+        fast_k_means(img, key=path)
+        warm = fast_k_means(img, key=path)
+
+        print("{} {}x{}".format(path, img.shape[1], img.shape[0]))
+        print("    sklearn:    {} in {:.2f} ms".format(np.round(reference), measure(lambda: k_means(img))))
+        print("    fast:       {} in {:.2f} ms".format(np.round(fast), measure(lambda: fast_k_means(img))))
+        print("    fast, warm: {} in {:.2f} ms".format(np.round(warm), measure(lambda: fast_k_means(img, key=path))))
@@ -1,5 +1,8 @@
 from time import time
 import cv2
+import numpy as np
+
+from BSP.detection.image_preprocessing import create_mask, subsample
 
 class BoardOrientation:
     """
@@ -22,6 +25,7 @@ class BoardOrientation:
         self.validity_seconds = validity_seconds
         # The corners are stored as a list of tuples.
         self.corners = corners
+        self._board_masks = {}
 
     def check_if_outdated(self):
         """
@@ -30,3 +34,23 @@ class BoardOrientation:
         :return: True if since the creation time more than validity_seconds elapsed
         """
         return time() - self.timestamp >= self.validity_seconds
+
+    def get_board_mask(self, width, height, stride=1):
+        """
+        Returns a mask of the board spanned by the corners. The mask is only created once per frame size and stride
+        and reused as long as this orientation is in use.
+
+        :param width: The width of the frame.
+        :param height: The height of the frame.
+        :param stride: The factor the mask is downscaled by, so it matches a frame downscaled with
+            subsample(frame, stride).
+        :return: A mask with the (downscaled) size, which is 255 inside of the board and 0 outside.
+        """
+        mask = self._board_masks.get((width, height, stride))
+        if mask is None:
+            if stride == 1:
+                mask = create_mask(np.array(self.corners, dtype=int), width, height)
+            else:
+                mask = subsample(self.get_board_mask(width, height), stride)
+            self._board_masks[(width, height, stride)] = mask
+        return mask
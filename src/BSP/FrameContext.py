@@ -0,0 +1,98 @@
+from typing import List
+import time
+
+import cv2
+import numpy as np
+
+from BSP.BoardOrientation import BoardOrientation
+from BSP.LED.ColorDetection import HueHistograms
+
+
+class FrameContext:
+    """
+    Wraps a single BGR frame together with the views derived from it.
+    The gray and HSV views are computed on first access and memoized, so every stage of the pipeline working
+    on the same frame shares one conversion.
+    The ROIs of the LEDs are stored as FrameContexts themselves, therefore the same holds for each LED.
+    """
+
+    def __init__(self, frame: np.array, orientation: BoardOrientation = None, timestamp: float = None):
+        """
+        :param frame: The BGR frame.
+        :param orientation: The orientation of the board in this frame, if known.
+        :param timestamp: The time the frame has been captured or None if time.time() should be used.
+        """
+        self.frame = frame
+        self.orientation = orientation
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.rois: List[FrameContext] = []
+        self.roi_boxes = None
+        self._views = {}
+        self._parent: FrameContext = None
+        self._index = None
+
+    @property
+    def gray(self) -> np.array:
+        """
+        :return: The frame in grayscale.
+        """
+        return self._view(cv2.COLOR_BGR2GRAY)
+
+    @property
+    def hsv(self) -> np.array:
+        """
+        :return: The frame in the HSV color space.
+        """
+        return self._view(cv2.COLOR_BGR2HSV)
+
+    @property
+    def hue_histogram(self) -> np.array:
+        """
+        :return: The hue histogram of the frame with 180 bins. For the rois of the LEDs it is taken from the hue
+            histograms of all LEDs which are calculated at once, if the boxes of the rois are known.
+        """
+        if self._parent is not None and self._parent.roi_boxes is not None:
+            return self._parent.hue_histograms[self._index]
+        hist = self._views.get("hue_histogram")
+        if hist is None:
+            hist = cv2.calcHist([self.hsv], [0], None, [180], [0, 180])[:, 0]
+            self._views["hue_histogram"] = hist
+        return hist
+
+    @property
+    def hue_histograms(self) -> np.array:
+        """
+        :return: The hue histograms of all LED rois with shape (leds, 180). Requires the boxes of the rois.
+        """
+        hists = self._views.get("hue_histograms")
+        if hists is None:
+            hists = HueHistograms.hue_histograms(self.frame, self.roi_boxes)
+            self._views["hue_histograms"] = hists
+        return hists
+
+    def set_rois(self, rois: List[np.array], boxes=None) -> None:
+        """
+        Sets the regions of interest of the LEDs in this frame.
+
+        :param rois: all regions of interest for the LEDs in order.
+        :param boxes: the upper left and lower right corners (x0, y0, x1, y1) of the rois in this frame, if known.
+        :return: None.
+        """
+        self.rois = [FrameContext(roi, timestamp=self.timestamp) for roi in rois]
+        self.roi_boxes = boxes
+        for idx, roi in enumerate(self.rois):
+            roi._parent = self
+            roi._index = idx
+
+    def _view(self, code: int) -> np.array:
+        """
+        Returns the frame converted with the given cv2 color conversion code, converting it on the first call only.
+
+        :param code: The cv2 color conversion code, e.g. cv2.COLOR_BGR2GRAY.
+        :return: The converted frame.
+        """
+        view = self._views.get(code)
+        if view is None:
+            view = cv2.cvtColor(self.frame, code)
+            self._views[code] = view
+        return view
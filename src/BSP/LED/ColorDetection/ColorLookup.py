@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from BSP.LED import ColorDetection
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "led-detection")
+
+
+class ColorLookupTable:
+    """
+    Classifies every pixel of an image with a single lookup in a quantized BGR table.
+    The table maps each BGR bin to the closest of the given colors by its hue (like Util.get_closest_color). Pixels
+    that are overexposed (like DominantColor.mask_over_expose) map to no color and pixels with a low saturation to a
+    separate id per color, which is only used if an image has no saturated pixels at all.
+    Tables are built once per set of colors and cached in memory as well as on disk.
+    """
+
+    _tables = {}
+
+    def __init__(self, colors: [str], bits: int = 5, min_saturation: int = 40, max_luminance: int = 250,
+                 cache_dir: str = DEFAULT_CACHE_DIR):
+        """
+        :param colors: the names of the colors a pixel can be classified as.
+        :param bits: the number of bits per channel of the quantized BGR values.
+        :param min_saturation: pixels with a lower saturation are treated as unsaturated.
+        :param max_luminance: pixels with a luminance (Y) of at least this value are overexposed.
+        :param cache_dir: the directory the table is cached in or None if it should not be cached on disk.
+        """
+        self.colors = list(colors) if colors is not None else []
+        self.bits = bits
+        self.min_saturation = min_saturation
+        self.max_luminance = max_luminance
+        self.table = self._load_or_build(cache_dir)
+
+    @classmethod
+    def for_colors(cls, colors: [str]):
+        """
+        Returns the table for the given colors with the default settings, building it only once per process.
+
+        :param colors: the names of the colors.
+        :return: the ColorLookupTable.
+        """
+        key = tuple(colors) if colors is not None else ()
+        table = cls._tables.get(key)
+        if table is None:
+            table = cls(colors)
+            cls._tables[key] = table
+        return table
+
+    def color_counts(self, img: np.array) -> np.array:
+        """
+        Counts the pixels of the given image per color id.
+
+        :param img: a BGR image.
+        :return: the counts with length 2 * colors + 1. Index 0 counts overexposed pixels, 1 to colors the saturated
+            and the remaining ones the unsaturated pixels of each color.
+        """
+        shift = 8 - self.bits
+        quantized = (img >> shift).astype(np.intp)
+        indices = (quantized[..., 0] << (2 * self.bits)) | (quantized[..., 1] << self.bits) | quantized[..., 2]
+        return np.bincount(self.table[indices].ravel(), minlength=2 * len(self.colors) + 1)
+
+    def dominant_color(self, img: np.array) -> str:
+        """
+        Returns the color most pixels of the given image are classified as.
+
+        :param img: a BGR image.
+        :return: the name of the color or an empty string if no colors are known.
+        """
+        if len(self.colors) == 0:
+            return ""
+
+        counts = self.color_counts(img)
+        saturated = counts[1:len(self.colors) + 1]
+        unsaturated = counts[len(self.colors) + 1:]
+        if saturated.any():
+            return self.colors[int(np.argmax(saturated))]
+        if unsaturated.any():
+            return self.colors[int(np.argmax(unsaturated))]
+        # Same as the dominant hue of an image without valid pixels
+        return self.colors[int(np.argmax(np.cos(self._hue_means())))]
+
+    def _hue_means(self) -> np.array:
+        return np.array([ColorDetection.COLOR_HUE_MEANS[color] for color in self.colors])
+
+    def _build(self) -> np.array:
+        """
+        Builds the table by classifying the center of every BGR bin.
+
+        :return: the table with one color id per bin.
+        """
+        size = 1 << self.bits
+        centers = (np.arange(size) << (8 - self.bits)) + (1 << (7 - self.bits))
+        b, g, r = np.meshgrid(centers, centers, centers, indexing="ij")
+        bgr = np.stack([b.ravel(), g.ravel(), r.ravel()], axis=1).astype(np.uint8).reshape(-1, 1, 3)
+
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV).reshape(-1, 3)
+        luminance = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV).reshape(-1, 3)[:, 0]
+
+        hue = hsv[:, 0].astype(np.float64) * 2 * np.pi / 180
+        closest = np.argmax(np.cos(np.abs(hue[:, None] - self._hue_means()[None, :])), axis=1)
+
+        table = np.where(hsv[:, 1] >= self.min_saturation, closest + 1, closest + 1 + len(self.colors))
+        table[luminance >= self.max_luminance] = 0
+        return table.astype(np.uint8)
+
+    def _load_or_build(self, cache_dir: str) -> np.array:
+        """
+        Loads the table from the cache directory or builds and stores it there.
+
+        :param cache_dir: the cache directory or None.
+        :return: the table.
+        """
+        if len(self.colors) == 0:
+            return np.zeros(1 << (3 * self.bits), dtype=np.uint8)
+        if cache_dir is None:
+            return self._build()
+
+        key = repr((self.colors, [ColorDetection.COLOR_HUE_MEANS[c] for c in self.colors], self.bits,
+                    self.min_saturation, self.max_luminance))
+        path = os.path.join(cache_dir, "color_lut_{}.npy".format(hashlib.sha1(key.encode()).hexdigest()))
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            pass
+
+        table = self._build()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(path, table)
+        except OSError as e:
+            logging.debug("Could not cache the color lookup table: %s", e)
+        return table
@@ -1,9 +1,8 @@
 import cv2
 import numpy as np
 
-from operator import itemgetter
-
 from BSP.LED.ColorDetection.Util import get_closest_color
+from BSP.LED.ColorDetection import HueHistograms
 from BSP.LED import ColorDetection
 
 
@@ -19,20 +18,43 @@ class Comparison:
         self._off_histogram = None
         self._on_histogram = None
 
-    def color_detection(self, frame, is_on) -> str:
+    @property
+    def allowed(self) -> np.array:
+        """
+        :return: A boolean vector over ColorDetection.COLOR_NAMES which is True for the colors to check for.
+        """
+        return HueHistograms.allowed_colors(self._colors)
+
+    def color_detection(self, roi, is_on) -> str:
         """
         Helper function using a naive attempt at detecting the LED's color by comparing the color changes
         from an off-state and an on-state. The difference in color should be the LED's color.
 
-        :param frame: A BGR frame of the led.
+        :param roi: The FrameContext of the led.
         :param is_on: True if the LED is on. False if LED is off. None if LED state is unknown.
         :return: Name of the color or an empty string for no color.
         """
         if len(self._colors) == 0:
             return ""
 
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        hist = cv2.calcHist([hsv], [0], None, [180], [0, 179])
+        diff = self.hue_difference(roi, is_on)
+        if diff is not None:
+            return self._color(diff)
+
+    def hue_difference(self, roi, is_on):
+        """
+        Stores the hue histogram of the roi for the given state and returns the difference between the on- and the
+        off-state, which color_detection classifies. Used to classify the colors of all LEDs of a frame at once.
+
+        :param roi: The FrameContext of the led.
+        :param is_on: True if the LED is on. False if LED is off. None if LED state is unknown.
+        :return: The difference of the histograms if the LED is on and its off-state is known, None otherwise or if
+            the LED has no colors.
+        """
+        if len(self._colors) == 0:
+            return None
+
+        hist = roi.hue_histogram
         # undefined led state
         if is_on is None:
             self._on_histogram = hist
@@ -40,10 +62,10 @@ class Comparison:
         elif is_on:
             self._on_histogram = hist
             if self._off_histogram is not None:
-                diff = self._on_histogram[:, 0] - self._off_histogram[:, 0]
-                return self._color(diff)
+                return self._on_histogram - self._off_histogram
         else:
             self._off_histogram = hist
+        return None
 
     def _color(self, hist: [int]) -> str:
         """
@@ -52,12 +74,7 @@ class Comparison:
         :param hist: the histogram with flattened shape
         :return: returns the color with the greatest integral
         """
-        values = []
-        for color in self._colors:
-            lower, upper = ColorDetection.COLOR_RANGE.get(color)
-            i = integral(hist, lower, upper)
-            values.append((i, color))
-        return max(values, key=itemgetter(0))[1]
+        return HueHistograms.classify(hist, self.allowed[None])[0]
 
 
 def integral(hist: [int], lower: int, upper: int):
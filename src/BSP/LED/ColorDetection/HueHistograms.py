@@ -0,0 +1,92 @@
+import functools
+
+import cv2
+import numpy as np
+
+from BSP.LED import ColorDetection
+
+
+@functools.lru_cache(maxsize=4)
+def roi_layout(boxes: tuple, width: int, height: int):
+    """
+    Calculates the region of the frame covering all LED rois and a label for every pixel of it, which is the index
+    of the LED the pixel belongs to or the number of LEDs if it belongs to none. A pixel can only have one label, so
+    the LEDs whose rois overlap are returned separately. Cached, as the boxes only change with the board orientation.
+
+    :param boxes: the upper left and lower right corners (x0, y0, x1, y1) of the rois as tuple of tuples.
+    :param width: the width of the frame.
+    :param height: the height of the frame.
+    :return: the region as (x0, y0, x1, y1), the flattened labels of the region and the indices of the LEDs whose rois
+        overlap with another roi.
+    """
+    boxes = np.clip(np.array(boxes, dtype=int).reshape(-1, 4), 0, [width, height, width, height])
+    x0, y0 = boxes[:, 0].min(), boxes[:, 1].min()
+    x1, y1 = boxes[:, 2].max(), boxes[:, 3].max()
+
+    labels = np.full((y1 - y0, x1 - x0), len(boxes), dtype=np.intp)
+    overlapping = set()
+    for idx, (bx0, by0, bx1, by1) in enumerate(boxes):
+        box_labels = labels[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0]
+        covered = np.unique(box_labels[box_labels < len(boxes)])
+        if len(covered) > 0:
+            overlapping.update(covered.tolist())
+            overlapping.add(idx)
+        box_labels[:] = idx
+    return (x0, y0, x1, y1), labels.ravel(), sorted(overlapping)
+
+
+def hue_histograms(frame: np.array, boxes, bins: int = 180) -> np.array:
+    """
+    Calculates the hue histograms of all LED rois at once. The region covering all rois is converted to HSV
+    once and the histograms are counted in a single bincount over the labeled pixels. The histograms of LEDs with
+    overlapping rois are counted per roi instead, so every roi keeps all of its pixels.
+
+    :param frame: the BGR frame.
+    :param boxes: the upper left and lower right corners (x0, y0, x1, y1) of the rois.
+    :param bins: the number of hue bins.
+    :return: the histograms with shape (leds, bins).
+    """
+    (x0, y0, x1, y1), labels, overlapping = roi_layout(tuple(map(tuple, boxes)), frame.shape[1], frame.shape[0])
+    hue = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)[:, :, 0]
+    counts = np.bincount(labels * bins + hue.ravel(), minlength=(len(boxes) + 1) * bins)
+    hists = counts[:len(boxes) * bins].reshape(len(boxes), bins).astype(np.float32)
+    for idx in overlapping:
+        bx0, by0, bx1, by1 = np.clip(boxes[idx], 0, [frame.shape[1], frame.shape[0]] * 2)
+        hists[idx] = np.bincount(hue[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0].ravel(), minlength=bins)[:bins]
+    return hists
+
+
+def range_integrals(hists: np.array) -> np.array:
+    """
+    Calculates the integrals of the histograms over the hue ranges of all colors in COLOR_NAMES using a cumulative
+    sum lookup.
+
+    :param hists: the hue histograms with shape (leds, 180).
+    :return: the integrals with shape (leds, colors).
+    """
+    hists = np.atleast_2d(hists)
+    cumsum = np.zeros((hists.shape[0], hists.shape[1] + 1))
+    np.cumsum(hists, axis=1, out=cumsum[:, 1:])
+    segments = cumsum[:, ColorDetection.COLOR_BIN_ENDS] - cumsum[:, ColorDetection.COLOR_BIN_STARTS]
+    return segments.sum(axis=2)
+
+
+def classify(hists: np.array, allowed: np.array) -> list:
+    """
+    Returns for every histogram the allowed color with the greatest integral.
+
+    :param hists: the hue histograms with shape (leds, 180).
+    :param allowed: a boolean matrix with shape (leds, colors) which is True for the colors of each LED.
+    :return: the name of the color for each histogram, an empty string if no color is allowed.
+    """
+    integrals = np.where(allowed, range_integrals(hists), -np.inf)
+    best = np.argmax(integrals, axis=1)
+    return [ColorDetection.COLOR_NAMES[b] if allowed[i].any() else "" for i, b in enumerate(best)]
+
+
+def allowed_colors(colors: [str]) -> np.array:
+    """
+    :param colors: the names of the colors.
+    :return: a boolean vector over COLOR_NAMES which is True for the given colors.
+    """
+    return np.isin(ColorDetection.COLOR_NAMES, colors)
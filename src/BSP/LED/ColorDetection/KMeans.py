@@ -1,11 +1,13 @@
 import cv2
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
 import numpy as np
 
 # 3 clusters gave the most reliable results in testing
 clusters = 3
 
+# centroids of the last fast_k_means call per key, used as starting point of the next call
+_centroids = {}
+
 
 # Code from https://www.pyimagesearch.com/2014/05/26/opencv-python-k-means-color-clustering/
 def _centroid_histogram(clt):
@@ -48,6 +50,8 @@ def k_means(img, title: str = None):
 
     img = img.reshape((img.shape[0] * img.shape[1], 3))
 
+    # imported here, as scikit-learn is only required for this reference implementation
+    from sklearn.cluster import KMeans
     clt = KMeans(clusters)
     clt.fit(img)
 
@@ -64,3 +68,55 @@ def k_means(img, title: str = None):
 
     hist_list = hist.tolist()
     return clt.cluster_centers_[hist_list.index(max(hist_list))]
+
+
+def fast_k_means(img, key=None, sample_size: int = 256, iterations: int = 5, title: str = None):
+    """
+    A fast alternative to k_means using Lloyd's algorithm in NumPy on a subsample of the pixels with a fixed
+    iteration budget. If a key is given, e.g. the name of the LED, the centroids of the last call with the same
+    key are used as starting point, so usually a few iterations suffice.
+
+    :param img: A BGR image.
+    :param key: The key the centroids are stored under or None to start from scratch.
+    :param sample_size: The approximate number of pixels used for the clustering.
+    :param iterations: The maximum number of iterations.
+    :param title: A title for the plot used for debugging.
+    :return: The dominant cluster.
+    """
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    pixels = img.reshape((img.shape[0] * img.shape[1], 3))
+    pixels = pixels[::max(1, len(pixels) // sample_size)].astype(np.float32)
+
+    centroids = _centroids.get(key) if key is not None else None
+    if centroids is None:
+        # start with pixels spread over the range of the brightness
+        order = np.argsort(pixels.sum(axis=1))
+        centroids = pixels[order[(np.arange(clusters) * 2 + 1) * len(order) // (2 * clusters)]]
+
+    labels = None
+    for _ in range(iterations):
+        distances = ((pixels[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        new_labels = np.argmin(distances, axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+
+        counts = np.bincount(labels, minlength=clusters)
+        sums = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=clusters) for c in range(3)], axis=1)
+        # empty clusters keep their centroid
+        centroids = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centroids)
+
+    if key is not None:
+        _centroids[key] = centroids
+
+    hist = np.bincount(labels, minlength=clusters) / len(labels)
+
+    if title is not None:
+        bar = _plot_colors(hist, centroids)
+        plt.figure()
+        plt.title(title)
+        plt.axis("off")
+        plt.imshow(bar)
+        plt.show()
+
+    return centroids[np.argmax(hist)]
@@ -17,3 +17,31 @@ COLOR_HUE_MEANS = {
     "cyan": 4 / 3 * np.pi,
     "purple": 5 / 3 * np.pi
 }
+
+
+def compile_color_ranges(color_range: dict, bins: int = 180):
+    """
+    Compiles the hue ranges of the colors into bin indices of a hue histogram.
+    Every range is split into at most two segments [start, end), so ranges wrapping around 0 such as red are
+    covered as well. The integral of a histogram over a color is then the sum over its segments of
+    cumsum[end] - cumsum[start] with cumsum starting at 0.
+
+    :param color_range: the ranges of the colors as in COLOR_RANGE.
+    :param bins: the number of bins of the hue histogram.
+    :return: the names of the colors and the start and end indices of the segments, both with shape (colors, 2).
+    """
+    names = list(color_range.keys())
+    starts = np.zeros((len(names), 2), dtype=np.intp)
+    ends = np.zeros((len(names), 2), dtype=np.intp)
+    for i, name in enumerate(names):
+        lower, upper = color_range[name]
+        if lower < 0 < upper:
+            starts[i] = [bins + lower, 0]
+            ends[i] = [bins, upper]
+        else:
+            starts[i, 0] = lower
+            ends[i, 0] = upper
+    return names, starts, ends
+
+
+COLOR_NAMES, COLOR_BIN_STARTS, COLOR_BIN_ENDS = compile_color_ranges(COLOR_RANGE)
@@ -3,11 +3,12 @@ import time
 from BSP.LED.StateDetection.BrightnessComparison import BrightnessComparison
 from BSP.LED.ColorDetection.HueComparison import Comparison
 from BSP.LED.ColorDetection.Util import create_new_cmap
+from BSP.LED.ColorDetection.ColorLookup import ColorLookupTable
 
 
 class LedStateDetector:
 
-    def __init__(self, name: str, colors: [str] = None):
+    def __init__(self, name: str, colors: [str] = None, hysteresis: int = 0):
         """
         Current LED state can be checked with is_on.
         Current LED color can be checked with color.
@@ -16,8 +17,9 @@ class LedStateDetector:
         :param id: the identification for this LED.
         :param: name: the name of this LED for Human readable output.
         :param colors: all colors that should be checked for on this LED.
+        :param hysteresis: the additional brightness deviation required to detect a LED that is on as off.
         """
-        self._brightness_comparison = BrightnessComparison()
+        self._brightness_comparison = BrightnessComparison(hysteresis=hysteresis)
         self._hue_comparison = Comparison(colors)
 
         self.name: str = name
@@ -25,39 +27,101 @@ class LedStateDetector:
         self.last_state_time = None
         self.color: str = ""
         self.cmap = create_new_cmap(colors)
+        self.color_lookup = ColorLookupTable.for_colors(colors)
 
-    def detect_change(self, image):
+    def detect_change(self, roi, gain: float = 1.0):
         """
-        Checks if the LED in the given image changes it's state.
+        Checks if the LED in the given roi changes it's state.
         If the LED changed it's state, the color will be checked.
         Returns True if the LED has changed it's state i.e. from on to off.
 
-        :param image: The BGR image of the board that should be checked.
+        :param roi: The FrameContext of the LED's roi that should be checked.
+        :param gain: The factor the brightness of the roi is rescaled by to compensate lighting changes.
         :return: True if the led has changed it's state.
         """
-        on = self._brightness_comparison.detect(image)
+        on = self.detect(roi, gain)
 
         change = on is not None and (self.is_on is None or on is not self.is_on)
         if change:
-            self._state_change(on, image)
-        elif self.is_on is None:
-            self._hue_comparison.color_detection(image, self.is_on)
+            self.commit(on, roi)
         return change
 
-    def _state_change(self, on: bool, image) -> None:
+    def detect(self, roi, gain: float = 1.0):
         """
-        Function that is called when the LED changed it's state.
+        Detects the state of the LED in the given roi without changing the state of this LED.
+        The detected state only becomes the state of the LED with commit.
+
+        :param roi: The FrameContext of the LED's roi that should be checked.
+        :param gain: The factor the brightness of the roi is rescaled by to compensate lighting changes.
+        :return: True if the LED is on, False if it is off or None if undefined.
+        """
+        on = self._brightness_comparison.detect(roi, gain=gain, is_on=self.is_on)
+        if on is None and self.is_on is None:
+            self._hue_comparison.color_detection(roi, self.is_on)
+        return on
+
+    def commit(self, on: bool, roi, timestamp: float = None) -> None:
+        """
+        Changes the state of this LED to the given detected state.
 
         :param on: True if the LED is on.
-        :param image: The roi image of this LED.
+        :param roi: The FrameContext of this LED's roi.
+        :param timestamp: The time the state has been detected first or None for the current time.
         :return: None.
         """
-        self.is_on = on
-        self.last_state_time = time.time()
+        self._state_change(on, roi, timestamp)
+
+    def hue_difference(self, roi, on: bool):
+        """
+        Stores the hue histogram of the roi for the detected state, see Comparison.hue_difference.
+
+        :param roi: The FrameContext of this LED's roi.
+        :param on: True if the LED is on.
+        :return: The hue difference to classify the color from or None.
+        """
+        return self._hue_comparison.hue_difference(roi, on)
+
+    @property
+    def allowed_colors(self):
+        """
+        :return: A boolean vector over ColorDetection.COLOR_NAMES which is True for the colors of this LED.
+        """
+        return self._hue_comparison.allowed
+
+    def commit_color(self, on: bool, color: str, timestamp: float = None) -> None:
+        """
+        Changes the state of this LED to the given detected state like commit, with the color already classified from
+        the hue difference.
 
-        comparison_name = self._hue_comparison.color_detection(image, on)
+        :param on: True if the LED is on.
+        :param color: The classified color, only used if the LED is on.
+        :param timestamp: The time the state has been detected first or None for the current time.
+        :return: None.
+        """
+        self.is_on = on
+        self.last_state_time = timestamp if timestamp is not None else time.time()
         if on:
-            self.color = comparison_name
+            self.color = color
+
+    def keep_state(self, brightness: int) -> None:
+        """
+        Function that is called instead of detect_change if the LED's roi did not change, so the LED keeps its state.
+
+        :param brightness: The average brightness of the LED's roi.
+        :return: None.
+        """
+        self._brightness_comparison.track(brightness, self.is_on)
+
+    def _state_change(self, on: bool, roi, timestamp: float = None) -> None:
+        """
+        Function that is called when the LED changed it's state.
+
+        :param on: True if the LED is on.
+        :param roi: The FrameContext of this LED's roi.
+        :param timestamp: The time of the state change or None for the current time.
+        :return: None.
+        """
+        self.commit_color(on, self._hue_comparison.color_detection(roi, on), timestamp)
 
     def invalidate(self) -> None:
         """
@@ -0,0 +1,119 @@
+import numpy as np
+
+
+class BlinkFrequencyEstimator:
+    """
+    Estimates the blink frequency, duty cycle and a confidence for all LEDs of a board at once.
+    Keeps a ring buffer of timestamped brightness samples (one row per frame, one column per LED). The samples within
+    the sliding window are resampled onto a uniform time grid and the frequency is taken from the peak of the
+    periodogram, so it does not depend on single state transitions.
+    """
+
+    def __init__(self, led_count: int, capacity: int = 256, window_seconds: float = 5.0, min_amplitude: float = 10,
+                 min_samples: int = 16):
+        """
+        :param led_count: the number of LEDs, i.e. the number of brightness values per sample.
+        :param capacity: the maximum number of samples kept per LED.
+        :param window_seconds: only samples younger than this are used for the estimation.
+        :param min_amplitude: LEDs whose brightness varies less than this are considered steady.
+        :param min_samples: the minimum number of samples within the window required for an estimation.
+        """
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._values = np.zeros((capacity, led_count), dtype=np.float32)
+        self._index = 0
+        self._count = 0
+        self._capacity = capacity
+        self._led_count = led_count
+        self.window_seconds = window_seconds
+        self.min_amplitude = min_amplitude
+        self.min_samples = min_samples
+
+    def add_sample(self, timestamp: float, brightnesses) -> None:
+        """
+        Adds the brightness of all LEDs measured at the given time.
+
+        :param timestamp: the time the frame has been captured.
+        :param brightnesses: the brightness of every LED in order.
+        :return: None.
+        """
+        self._times[self._index] = timestamp
+        self._values[self._index] = brightnesses
+        self._index = (self._index + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def clear(self) -> None:
+        """
+        Removes all samples.
+
+        :return: None.
+        """
+        self._index = 0
+        self._count = 0
+
+    def samples(self):
+        """
+        Returns the samples within the sliding window in chronological order.
+
+        :return: a tuple of the timestamps with shape (n,) and the brightnesses with shape (n, leds).
+        """
+        indices = (self._index - self._count + np.arange(self._count)) % self._capacity
+        times = self._times[indices]
+        values = self._values[indices]
+        if self._count > 0:
+            in_window = times >= times[-1] - self.window_seconds
+            times = times[in_window]
+            values = values[in_window]
+        return times, values
+
+    def estimate(self):
+        """
+        Estimates the blink frequency of all LEDs.
+        Steady LEDs and LEDs without a clear periodic signal get a frequency of 0 and a confidence of 0.
+        The duty cycle is NaN as long as it cannot be determined from the samples.
+
+        :return: a tuple of arrays with one value per LED: the frequency in Hz, the duty cycle as fraction of the time
+            the LED is on and the confidence in [0, 1] of the frequency, i.e. the share of the signal's power around
+            the detected frequency.
+        """
+        frequency = np.zeros(self._led_count)
+        duty_cycle = np.full(self._led_count, np.nan)
+        confidence = np.zeros(self._led_count)
+
+        times, values = self.samples()
+        n = len(times)
+        if n < self.min_samples or times[-1] <= times[0]:
+            return frequency, duty_cycle, confidence
+
+        # resample onto a uniform grid, all LEDs share the same timestamps
+        dt = (times[-1] - times[0]) / (n - 1)
+        grid = times[0] + np.arange(n) * dt
+        left = np.clip(np.searchsorted(times, grid, side="right") - 1, 0, n - 2)
+        spacing = times[left + 1] - times[left]
+        weight = np.divide(grid - times[left], spacing, out=np.zeros(n), where=spacing > 0).clip(0, 1)[:, None]
+        resampled = values[left] * (1 - weight) + values[left + 1] * weight
+
+        low = resampled.min(axis=0)
+        high = resampled.max(axis=0)
+        blinking = high - low >= self.min_amplitude
+        duty_cycle[blinking] = np.mean(resampled > (low + high) / 2, axis=0)[blinking]
+
+        signal = (resampled - resampled.mean(axis=0)) * np.hanning(n)[:, None]
+        power = np.abs(np.fft.rfft(signal, axis=0)) ** 2
+        power[0] = 0
+        peak = np.argmax(power, axis=0)
+        columns = np.arange(self._led_count)
+
+        # parabolic interpolation between the neighbouring bins of the peak
+        before = power[np.maximum(peak - 1, 0), columns]
+        at = power[peak, columns]
+        after = power[np.minimum(peak + 1, len(power) - 1), columns]
+        curvature = before - 2 * at + after
+        offset = np.divide(0.5 * (before - after), curvature, out=np.zeros(self._led_count), where=curvature != 0)
+        total = power.sum(axis=0)
+        share = np.divide(before + at + after, total, out=np.zeros(self._led_count), where=total > 0)
+
+        # at least two periods have to be within the window
+        valid = blinking & (peak >= 2)
+        frequency[valid] = ((peak + offset.clip(-0.5, 0.5)) / (n * dt))[valid]
+        confidence[valid] = share.clip(0, 1)[valid]
+        return frequency, duty_cycle, confidence
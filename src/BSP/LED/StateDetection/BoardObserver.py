@@ -5,9 +5,13 @@ import cv2
 import time
 import numpy as np
 
-from BSP.LED.ColorDetection import DominantColor, Util
+from BSP.FrameContext import FrameContext
+from BSP.LED.ColorDetection import HueHistograms
 from BSP.LED.LedStateDetector import LedStateDetector
 from BSP.LED.StateDetection import Brightness
+from BSP.LED.StateDetection.BlinkFrequencyEstimator import BlinkFrequencyEstimator
+from BSP.LED.StateDetection.ChangeGate import ChangeGate
+from BSP.LED.StateDetection.TransitionDebouncer import TransitionDebouncer, UNKNOWN
 
 
 class BoardObserver:
@@ -16,7 +20,27 @@ class BoardObserver:
 
     """
 
-    def __init__(self, board_leds, debug=False):
+    def __init__(self, board_leds, debug=False, min_blink_confidence=0.5, change_threshold=2.0,
+                 normalize_brightness=False, max_gain=2.0, confirm_frames=1, confirm_seconds=None, hysteresis=0,
+                 frequency_tolerance=0.1):
+        """
+        :param board_leds: the LEDs of the board.
+        :param debug: if True the LEDs and the frame are shown in cv2 windows.
+        :param min_blink_confidence: the confidence the blink frequency estimation requires to be reported.
+        :param change_threshold: the change of a LED's roi required to run the state detection for a LED with a known
+            state, see ChangeGate. None evaluates all LEDs on every frame.
+        :param normalize_brightness: if True, the brightness of the LEDs is rescaled by the change of the board
+            brightness instead of invalidating all LEDs when the lighting changes.
+        :param max_gain: the largest factor the brightness is rescaled by, larger lighting changes still invalidate
+            all LEDs.
+        :param confirm_frames: the number of consecutive frames a state change has to be detected in before it is
+            reported, see TransitionDebouncer.
+        :param confirm_seconds: the time after which a state change is reported regardless of confirm_frames, which
+            bounds the latency added by the debouncing. None only confirms by frames.
+        :param hysteresis: the additional brightness deviation required to detect a LED that is on as off.
+        :param frequency_tolerance: the relative change of a confident blink frequency estimate, compared to the last
+            reported one, after which the frequency is reported without a state change.
+        """
         self.leds: List[LedStateDetector] = []
         self.debug = debug
 
@@ -24,81 +48,273 @@ class BoardObserver:
 
         for i in range(len(board_leds)):
             led = board_leds[i]
-            self.leds.append(LedStateDetector(led.id, led.colors))
+            self.leds.append(LedStateDetector(led.id, led.colors, hysteresis))
+
+        self.blink_estimator = BlinkFrequencyEstimator(len(self.leds))
+        self.min_blink_confidence = min_blink_confidence
+        self.frequencies = np.zeros(len(self.leds))
+        self.duty_cycles = np.full(len(self.leds), np.nan)
+        self.blink_confidences = np.zeros(len(self.leds))
+        self.frequency_tolerance = frequency_tolerance
+        self.reported_frequencies = [None] * len(self.leds)
+        self.frequency_updates = 0
+        self.roi_brightnesses = [0.0] * len(self.leds)
+        self.change_gate = ChangeGate(len(self.leds), change_threshold) if change_threshold is not None else None
+        self.debouncer = TransitionDebouncer(len(self.leds), confirm_frames, confirm_seconds)
+
+        self.normalize_brightness = normalize_brightness
+        self.max_gain = max_gain
+        self.gain = 1.0
+        self._reference_brightness = None
+        self.invalidations = 0
+        self.invalidations_avoided = 0
 
-    def check(self, frame: np.array, rois: List[np.array], avg_brightness, on_change)-> None:
+    def check(self, context: FrameContext, avg_brightness, on_change, on_frequency=None) -> None:
         """
         Checks if brightness changed substantially in the image. Invalidates the LEDs if necessary and checks
         all LED states.
         A LED that changed it's state will be passed into the on_change function.
 
-        :param frame: the current frame of the camera stream.
-        :param rois: all regions of interest for the LEDs in order.
+        :param context: the FrameContext of the current frame, containing the regions of interest for the LEDs in order.
         :param on_change: the function that should be called when a LED has changed it's state.
         :param avg_brightness:
+        :param on_frequency: the function that is called with the name of a LED with a known state, its frequency,
+            duty cycle and confidence, when the confident blink frequency estimate has changed by more than frequency_tolerance since it has been
+            reported last, or None.
         :return: None.
         """
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         brightness = avg_brightness
 
         self._check_invalidation(brightness)
+        self.sample_brightness(context)
 
+        detected = np.full(len(self.leds), UNKNOWN, dtype=np.int8)
+        reported = np.full(len(self.leds), UNKNOWN, dtype=np.int8)
+        evaluated = np.zeros(len(self.leds), dtype=bool)
         for i in range(len(self.leds)):
             led = self.leds[i]
-            led_img = rois[i]
+            roi = context.rois[i]
+            if led.is_on is not None:
+                reported[i] = led.is_on
 
-            if led.detect_change(led_img):
-                on_change(led.name, led.is_on, led.color, led.last_state_time)
+            # the gate is asked last, so it only counts and updates the LEDs it decides about
+            if self.change_gate is not None and led.is_on is not None and not self.debouncer.is_pending(i) \
+                    and not self.change_gate.should_evaluate(i, roi):
+                led.keep_state(int(round(min(self.roi_brightnesses[i] * self.gain, 255))))
+                detected[i] = led.is_on
+                continue
+
+            evaluated[i] = True
+            on = led.detect(roi, self.gain)
+            if on is not None:
+                detected[i] = on
+
+        confirmed, since = self.debouncer.update(detected, reported, context.timestamp)
+        colors = self._classify_colors(context, np.flatnonzero(evaluated & confirmed), detected)
+
+        for i in np.flatnonzero(evaluated):
+            led = self.leds[i]
+            roi = context.rois[i]
+
+            if confirmed[i]:
+                led.commit_color(bool(detected[i]), colors[i], float(since[i]))
+                on_change(led.name, led.is_on, led.color, led.last_state_time, self._reported_frequency(i),
+                          *self.blink_details(i))
 
             if led.is_on is None:
-                self._detect_initial_state(led_img, i, led,brightness, on_change)
-            else:
+                self._detect_initial_state(roi, i, led, brightness, on_change)
+            elif self.debug:
                 # Debug show LEDs
-                if self.debug:
-                    cv2.imshow(str(i), led_img)
-                    if led.is_on:
-                        led_img[:] = (0, 255, 0)
-                    else:
-                        led_img[:] = (0, 0, 255)
+                cv2.imshow(str(i), roi.frame)
 
-        if self.debug:
-            height, width, channels = frame.shape
-            if width > 3000:
-                frame = cv2.resize(frame, (int(width / 3), int(height / 3)))
+        if on_frequency is not None:
+            self._report_frequencies(on_frequency)
 
-            cv2.imshow("Frame", frame)
+        if self.debug:
+            cv2.imshow("Frame", self.debug_frame(context))
             cv2.waitKey(10)
 
+    def _classify_colors(self, context: FrameContext, indices, detected) -> dict:
+        """
+        Stores the hue histograms of the LEDs that change their state and classifies the colors of all LEDs turning on
+        at once from their hue differences.
+
+        :param context: the FrameContext of the current frame.
+        :param indices: the indices of the LEDs that change their state.
+        :param detected: the detected state of every LED.
+        :return: the color of each of the LEDs by index, an empty string for a LED without colors and None if the
+            off-state of the LED is not known yet.
+        """
+        colors = {}
+        rows = []
+        diffs = []
+        for i in indices:
+            led = self.leds[i]
+            colors[i] = None if led.allowed_colors.any() else ""
+            diff = led.hue_difference(context.rois[i], bool(detected[i]))
+            if diff is not None:
+                rows.append(i)
+                diffs.append(diff)
+        if len(rows) > 0:
+            allowed = np.array([self.leds[i].allowed_colors for i in rows])
+            for i, color in zip(rows, HueHistograms.classify(np.array(diffs), allowed)):
+                colors[i] = color
+        return colors
+
+    def debug_frame(self, context: FrameContext):
+        """
+        Draws the states of the LEDs onto a copy of the frame, the rois are views of the frame and stay untouched for
+        the detection.
+
+        :param context: the FrameContext of the current frame.
+        :return: the annotated copy, downscaled by 3 for frames wider than 3000 pixels.
+        """
+        frame = context.frame
+        height, width = frame.shape[:2]
+        scale = 1 / 3 if width > 3000 else 1
+        if scale != 1:
+            frame = cv2.resize(frame, (int(width * scale), int(height * scale)))
+        else:
+            frame = frame.copy()
+        if context.roi_boxes is not None:
+            for led, box in zip(self.leds, context.roi_boxes):
+                if led.is_on is None:
+                    continue
+                color = (0, 255, 0) if led.is_on else (0, 0, 255)
+                x0, y0, x1, y1 = (int(value * scale) for value in box)
+                cv2.rectangle(frame, (x0, y0), (x1, y1), color, 2)
+        return frame
+
+    def sample_brightness(self, context: FrameContext) -> None:
+        """
+        Adds the brightness of all LED rois to the blink frequency estimation and updates the estimated frequencies,
+        duty cycles and confidences.
+
+        :param context: the FrameContext of the current frame, containing the regions of interest for the LEDs in order.
+        :return: None.
+        """
+        self.roi_brightnesses = [cv2.mean(roi.gray)[0] for roi in context.rois]
+        self.blink_estimator.add_sample(context.timestamp, self.roi_brightnesses)
+        self.frequencies, self.duty_cycles, self.blink_confidences = self.blink_estimator.estimate()
+
+    def blink_frequency(self, idx: int):
+        """
+        Returns the estimated blink frequency of the given LED.
+
+        :param idx: the index of the LED.
+        :return: the frequency in Hz or None if the estimation is not confident enough.
+        """
+        if self.blink_confidences[idx] >= self.min_blink_confidence:
+            return float(self.frequencies[idx])
+        return None
+
+    def blink_details(self, idx: int):
+        """
+        Returns the estimated duty cycle and the confidence of the blink frequency of the given LED.
+
+        :param idx: the index of the LED.
+        :return: a tuple of the duty cycle, None if it cannot be determined, and the confidence or (None, None) if the
+            estimation is not confident enough, like blink_frequency.
+        """
+        confidence = self.blink_confidences[idx]
+        if confidence < self.min_blink_confidence:
+            return None, None
+        duty_cycle = self.duty_cycles[idx]
+        return (None if np.isnan(duty_cycle) else float(duty_cycle)), float(confidence)
+
+    def _reported_frequency(self, idx: int):
+        """
+        Returns the estimated blink frequency of the given LED and remembers it as reported.
+
+        :param idx: the index of the LED.
+        :return: the frequency in Hz or None if the estimation is not confident enough.
+        """
+        frequency = self.blink_frequency(idx)
+        if frequency is not None:
+            self.reported_frequencies[idx] = frequency
+        return frequency
+
+    def _report_frequencies(self, on_frequency) -> None:
+        """
+        Reports the confident blink frequency of every LED with a known state that has changed by more than
+        frequency_tolerance since it has been reported last, so a LED whose transitions are not reported, e.g.
+        because they are suppressed by the debouncing, still publishes its frequency.
+
+        :param on_frequency: the function that is called with the name of the LED, the frequency, its duty cycle and
+            confidence.
+        :return: None.
+        """
+        for i, led in enumerate(self.leds):
+            if led.is_on is None:
+                continue
+            frequency = self.blink_frequency(i)
+            reported = self.reported_frequencies[i]
+            if frequency is None or \
+                    (reported is not None and abs(frequency - reported) <= self.frequency_tolerance * reported):
+                continue
+            self.reported_frequencies[i] = frequency
+            self.frequency_updates += 1
+            on_frequency(led.name, frequency, *self.blink_details(i))
+
     def _check_invalidation(self, brightness: int) -> None:
         """
         Checks if brightness changed substantially in the image, invalidating all LEDs in this case.
         Large brightness shifts could indicate that the lighting conditions changed which could influence
-        the LED state detection.
+        the LED state detection. With normalize_brightness, these shifts are compensated by the gain instead, and the
+        LEDs are invalidated as soon as the gain leaves [1 / max_gain, max_gain], also after a slow drift.
 
         :param brightness: the new brightness that should be checked
         :return: None
         """
         deviation = 5
-        if len(self._brightnesses) > 0:
+        if self.normalize_brightness:
+            if self._reference_brightness is None:
+                self._reference_brightness = brightness
+            self.gain = self._reference_brightness / max(brightness, 1)
+
+        if self.normalize_brightness and not 1 / self.max_gain <= self.gain <= self.max_gain:
+            # checked on every frame, as a slow drift never deviates from the rolling average
+            self._invalidate(brightness)
+        elif len(self._brightnesses) > 0:
             avg_brightness = int(sum(self._brightnesses) / len(self._brightnesses))
             if abs(brightness - avg_brightness) > deviation:
-                for led in self.leds:
-                    led.invalidate()
+                if self.normalize_brightness:
+                    self.invalidations_avoided += 1
+                else:
+                    self._invalidate(brightness)
         self._brightnesses.append(brightness)
 
-    def _detect_initial_state(self, led_img: np.array, idx: int, led: LedStateDetector, board_brightness, on_change,
+    def _invalidate(self, brightness) -> None:
+        """
+        Invalidates all LEDs, restarting their state detection under the current lighting conditions.
+
+        :param brightness: the current brightness of the board.
+        :return: None
+        """
+        self.invalidations += 1
+        for led in self.leds:
+            led.invalidate()
+        if self.change_gate is not None:
+            self.change_gate.reset()
+        self.debouncer.reset()
+        if self.normalize_brightness:
+            self._reference_brightness = brightness
+            self.gain = 1.0
+
+    def _detect_initial_state(self, roi: FrameContext, idx: int, led: LedStateDetector, board_brightness, on_change,
                               fixed_threshold: int = -1) -> None:
         """
         Tries to determine the given LEDs status by comparing the LEDs brightness with the brightness of the full image.
         Only used to determine the initial state up to the point where the BrightnessComparison of the LED itself works.
 
-        :param led_img: the LEDs roi.
+        :param roi: the FrameContext of the LEDs roi.
         :param idx: the current Index for this LED in the StateTable.
         :param led: the LED.
         :param board_brightness
         :param on_change: the function that should be called with the current LEDs state.
         :return: None.
         """
+        led_img = roi.frame
         led_on: bool
         if fixed_threshold in range(0, 256):
             led_brightness = Brightness.avg_brightness(led_img)
@@ -111,14 +327,10 @@ class BoardObserver:
             led_on = led_brightness > avg_brightness + deviation
 
         if led_on:
-            dominant = DominantColor.get_dominant_color(led_img)
-            dominant_name = Util.get_closest_color(dominant, led.cmap)
-            on_change(led.name, True, dominant_name, time.time())
-            if self.debug:
-                led_img[:] = (0, 255, 0)
+            dominant_name = led.color_lookup.dominant_color(led_img)
+            on_change(led.name, True, dominant_name, time.time(), self._reported_frequency(idx),
+                      *self.blink_details(idx))
         else:
-            on_change(led.name, False, "", time.time())
-            if self.debug:
-                led_img[:] = (0, 0, 255)
+            on_change(led.name, False, "", time.time(), self._reported_frequency(idx), *self.blink_details(idx))
 
 
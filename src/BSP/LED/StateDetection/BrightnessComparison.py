@@ -9,31 +9,37 @@ class BrightnessComparison:
     Detects with the brightness on/off for the LEDs
 
     """
-    def __init__(self, deviation: int = 10):
+    def __init__(self, deviation: int = 10, hysteresis: int = 0):
         """
         :param deviation: the deviation of the average on value.
+        :param hysteresis: the additional deviation a LED that is on may have before it is detected as off. With a
+            hysteresis, switching on and off use two different thresholds.
         """
         self._last_brightness = -1
         self._on_values = collections.deque(maxlen=20)
         self._deviation = deviation
+        self._hysteresis = hysteresis
 
-    def detect(self, img, window_name: str = None):
+    def detect(self, roi, window_name: str = None, gain: float = 1.0, is_on: bool = None):
         """
         True - LED is powered on.
         False - LED is powered off.
         None - LED is in an undefined state.
 
-        :param img: The BGR image of this LED.
+        :param roi: The FrameContext of this LED.
         :param window_name: Set a name, to display a cv2 window with the given img in grayscale.
+        :param gain: The factor the brightness is rescaled by to compensate lighting changes.
+        :param is_on: The current state of the LED, selects the threshold if a hysteresis is used.
         :return: True if LED is powered on or None if undefined.
         """
-        img = cv2.GaussianBlur(img, (3, 3), 0)
-        gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray_img = cv2.GaussianBlur(roi.gray, (3, 3), 0)
         if window_name is not None:
             cv2.imshow(window_name, gray_img)
 
         # get the average brightness in the given image
         brightness = Brightness.avg_brightness(gray_img)
+        if gain != 1.0:
+            brightness = int(min(brightness * gain, 255))
 
         # if no known brightness values for on
         if len(self._on_values) == 0:
@@ -49,11 +55,26 @@ class BrightnessComparison:
                 return False
         else:
             on_avg = int(sum(self._on_values) / len(self._on_values))
-            if brightness in range(on_avg - self._deviation, 256):
+            deviation = self._deviation + self._hysteresis if is_on else self._deviation
+            if brightness in range(on_avg - deviation, 256):
                 self._on_values.append(brightness)
                 return True
             return False
 
+    def track(self, brightness: int, is_on: bool) -> None:
+        """
+        Updates the known brightnesses for a frame in which the LED is known to keep its state, without evaluating
+        the image of the LED again.
+
+        :param brightness: The average brightness of the LED in this frame.
+        :param is_on: The current state of the LED.
+        :return: None.
+        """
+        if len(self._on_values) == 0:
+            self._last_brightness = brightness
+        elif is_on:
+            self._on_values.append(brightness)
+
     def invalidate(self) -> None:
         """
         Clears all known brightnesses therefore restarting the state detection.
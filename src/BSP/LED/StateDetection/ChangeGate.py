@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+
+
+class ChangeGate:
+    """
+    Decides for every LED whether its roi changed enough to run the state and color detection again.
+    Each roi is reduced to a tiny grayscale signature which is compared with the signature of the last evaluated frame
+    of this LED. Comparing with the last evaluated frame instead of the previous one ensures that slow drifts are
+    not skipped forever. In addition, a LED is evaluated at least every max_skipped_frames frames, as a change just
+    below the threshold can still cross the threshold of the state detection.
+    """
+
+    def __init__(self, led_count: int, threshold: float = 2.0, signature_size: int = 4, max_skipped_frames: int = 10):
+        """
+        :param led_count: the number of LEDs.
+        :param threshold: the mean absolute difference in gray levels the signature has to move to be evaluated.
+        :param signature_size: the width and height of the signature.
+        :param max_skipped_frames: the maximum number of consecutive frames a LED is skipped.
+        """
+        self.threshold = threshold
+        self.signature_size = signature_size
+        self.max_skipped_frames = max_skipped_frames
+        self._signatures = [None] * led_count
+        self._skipped_frames = [0] * led_count
+
+        self.evaluated = 0
+        self.skipped = 0
+
+    def should_evaluate(self, idx: int, roi) -> bool:
+        """
+        Checks whether the roi of the given LED changed since it has been evaluated the last time.
+        Counts the evaluated and skipped LEDs.
+
+        :param idx: the index of the LED.
+        :param roi: the FrameContext of the LED's roi.
+        :return: True if the LED should be evaluated.
+        """
+        signature = cv2.resize(roi.gray, (self.signature_size, self.signature_size),
+                               interpolation=cv2.INTER_AREA).astype(np.float32)
+        last_signature = self._signatures[idx]
+
+        if last_signature is not None and self._skipped_frames[idx] < self.max_skipped_frames \
+                and np.mean(np.abs(signature - last_signature)) <= self.threshold:
+            self._skipped_frames[idx] += 1
+            self.skipped += 1
+            return False
+
+        self._signatures[idx] = signature
+        self._skipped_frames[idx] = 0
+        self.evaluated += 1
+        return True
+
+    def reset(self) -> None:
+        """
+        Forgets all signatures, so every LED is evaluated on the next check.
+
+        :return: None.
+        """
+        self._signatures = [None] * len(self._signatures)
+        self._skipped_frames = [0] * len(self._skipped_frames)
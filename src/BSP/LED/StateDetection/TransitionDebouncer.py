@@ -0,0 +1,89 @@
+import numpy as np
+
+UNKNOWN = -1
+OFF = 0
+ON = 1
+
+
+class TransitionDebouncer:
+    """
+    Confirms the state transitions of all LEDs of a board at once before they are reported.
+    A detected state that differs from the reported one is pending until it has been detected in confirm_frames
+    consecutive frames or for confirm_seconds, so a single noisy frame does not cause two state changes. The first
+    state of a LED is confirmed immediately.
+    States are encoded as -1 (unknown), 0 (off) and 1 (on).
+    """
+
+    def __init__(self, led_count: int, confirm_frames: int = 1, confirm_seconds: float = None):
+        """
+        :param led_count: the number of LEDs.
+        :param confirm_frames: the number of consecutive frames a new state has to be detected in. 1 reports every
+            transition immediately.
+        :param confirm_seconds: the time after which a new state is confirmed, even if it has been detected in less
+            than confirm_frames frames. None only confirms by frames.
+        """
+        self.confirm_frames = max(confirm_frames, 1)
+        self.confirm_seconds = confirm_seconds
+        self._pending = np.full(led_count, UNKNOWN, dtype=np.int8)
+        self._count = np.zeros(led_count, dtype=np.int32)
+        self._since = np.zeros(led_count, dtype=np.float64)
+        self.confirmed = 0
+        self.suppressed = 0
+
+    @property
+    def max_latency(self):
+        """
+        :return: the longest time in seconds a transition is delayed by, or None if it depends on the frame rate.
+        """
+        if self.confirm_frames == 1:
+            return 0.0
+        return self.confirm_seconds
+
+    def update(self, detected: np.array, reported: np.array, timestamp: float):
+        """
+        Adds the states detected in a frame and returns the transitions that are confirmed with it.
+
+        :param detected: the detected state of every LED in this frame.
+        :param reported: the state of every LED that has been reported so far.
+        :param timestamp: the time the frame has been captured.
+        :return: a tuple of a boolean mask of the LEDs with a confirmed transition and the time each transition has
+            first been detected.
+        """
+        detected = np.asarray(detected, dtype=np.int8)
+        reported = np.asarray(reported, dtype=np.int8)
+
+        differs = (detected != UNKNOWN) & (detected != reported)
+        continued = differs & (detected == self._pending)
+
+        # pending transitions that are not detected anymore have been noise
+        self.suppressed += int(np.count_nonzero((self._pending != UNKNOWN) & ~continued))
+
+        self._count = np.where(continued, self._count + 1, np.where(differs, 1, 0))
+        self._since = np.where(continued, self._since, timestamp)
+        self._pending = np.where(differs, detected, UNKNOWN).astype(np.int8)
+
+        confirmed = differs & ((reported == UNKNOWN) | (self._count >= self.confirm_frames))
+        if self.confirm_seconds is not None:
+            confirmed |= differs & (timestamp - self._since >= self.confirm_seconds)
+
+        since = self._since.copy()
+        self._pending[confirmed] = UNKNOWN
+        self._count[confirmed] = 0
+        self.confirmed += int(np.count_nonzero(confirmed))
+        return confirmed, since
+
+    def is_pending(self, idx: int) -> bool:
+        """
+        :param idx: the index of the LED.
+        :return: True if a transition of the LED is waiting for its confirmation.
+        """
+        return self._pending[idx] != UNKNOWN
+
+    def reset(self) -> None:
+        """
+        Discards all pending transitions.
+
+        :return: None.
+        """
+        self._pending[:] = UNKNOWN
+        self._count[:] = 0
@@ -40,4 +40,15 @@ def mask_background(frame, contours):
     return img
 
 
-
+def subsample(img, stride):
+    """
+    downscales the image by keeping only one pixel out of every stride x stride block (nearest neighbour)
+    :param img: is the image
+    :param stride: is the downscaling factor, 1 returns the image itself
+    :return: the downscaled image
+    """
+    if stride == 1:
+        return img
+    width = (img.shape[1] + stride - 1) // stride
+    height = (img.shape[0] + stride - 1) // stride
+    return cv2.resize(img, (width, height), interpolation=cv2.INTER_NEAREST)
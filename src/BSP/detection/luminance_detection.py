@@ -1,7 +1,7 @@
 import cv2
 
 import matplotlib.pyplot as plt
-from .image_preprocessing import convert_to_yuv, mask_background
+from .image_preprocessing import convert_to_yuv, mask_background, subsample
 
 
 def get_most_frequent_luminance(img, is_yuv=False):
@@ -60,3 +60,18 @@ def avg_board_brightness(img, board_corner_points, is_yuv=False):
     y_channel = img[:, :, 0]
     y_channel = y_channel[y_channel > 0]
     return y_channel.mean()
+
+
+def estimate_board_brightness(img, board_orientation, stride=4):
+    """
+    Estimate the average luminance of the board on a downscaled Y plane.
+    Uses the same conversion as avg_board_brightness, but only on the frame downscaled by stride and with the
+    board mask cached in the board orientation, so neither the mask nor the full frame has to be processed.
+    :param img: is an image in bgr color space
+    :param board_orientation: is the BoardOrientation of the board in the image
+    :param stride: the downscaling factor of the frame, 1 uses all pixels
+    :return: the average luminance (Y) of the board
+    """
+    mask = board_orientation.get_board_mask(img.shape[1], img.shape[0], stride)
+    y_channel = convert_to_yuv(subsample(img, stride))[:, :, 0]
+    return cv2.mean(y_channel, mask=mask)[0]
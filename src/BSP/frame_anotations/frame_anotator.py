@@ -1,9 +1,8 @@
-from BSP.state_handler.state_table import get_led_ids, get_current_state, get_led_ids, \
-    get_led_as_time_series, get_last_entry
+from BSP.state_handler.state_store import StateStore
+from BSP.state_handler.state_table import get_led_ids, get_led_as_time_series
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
-# current_state = get_current_state()
 # | led_id  |   state   |   color   |   time    |   last_time_off   |   last_time_on |  frequency   |
 # |---------|-----------|-----------|-----------|-------------------|----------------|--------------|
 # |    led_1|  off      |  "red"    |   123456  |            123456 |                |             1|
@@ -11,32 +10,35 @@ import matplotlib.pyplot as plt
 fig = axs = None
 
 
-def plot_all_led_time_series(led_ids=None):
+def plot_all_led_time_series(store: StateStore, led_ids=None):
     """
     Plots all leds as time series.
+    :param store: the StateStore of the leds
+    :param led_ids: the leds to plot
     :return:
     """
     global axs
     assert axs is not None
 
     for id, val in enumerate(led_ids):
-        table = get_led_as_time_series(val)
+        table = get_led_as_time_series(store, val)
         table["state"] = table["state"].map({"on": 1, "off": 0})
         axs[id].step(table.index, table["state"], where="post")
         axs[id].set_title(val)
         axs[id].set_ylim([-0.3, 1.3])
 
 
-def draw_plot():
+def draw_plot(store: StateStore):
     """
     draws the state over time plot for all leds and converts the plot it to a frame eg np.array
+    :param store: the StateStore of the leds, e.g. the state_store of a StateDetector
     :return: a np.array of the plot
     """
     global fig, axs
-    led_ids = get_led_ids()
+    led_ids = get_led_ids(store)
     if fig == None:
         fig, axs = plt.subplots(len(led_ids))
-    plot_all_led_time_series(led_ids)
+    plot_all_led_time_series(store, led_ids)
     fig.canvas.draw()
     img_plot = np.fromstring(fig.canvas.tostring_rgb(), dtype=np.uint8,
                              sep='')
@@ -46,13 +48,14 @@ def draw_plot():
     return img
 
 
-def draw_plot_in_frame(frame):
+def draw_plot_in_frame(frame, store: StateStore):
     """
     draws the plot and draws it next to the frame
     :param frame:
+    :param store: the StateStore of the leds
     :return:
     """
-    plot = draw_plot()
+    plot = draw_plot(store)
     width = frame.shape[1] + plot.shape[1]
     height = max(frame.shape[0], plot.shape[0])
     canvas = np.zeros((height, width, 3), dtype=np.uint8)
@@ -61,23 +64,6 @@ def draw_plot_in_frame(frame):
     return canvas
 
 
-def draw_bounding_boxes(frame, boxes):
-    """
-    draws the bounding boxes as well as the labels on the frame
-    :param frame:
-    :param boxes:
-    :return:
-    """
-    labels = get_led_ids()
-    for idx, box in enumerate(boxes):
-        label = labels[idx]
-        entry = get_last_entry(label)
-        color = (0, 255, 0) if entry["state"] == "on" else (0, 0, 255)
-        cv2.putText(frame, label, (box[0] - 20, box[1] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-        cv2.rectangle(frame, (box[0], box[1]), (box[2], box[3]), color, 2)
-    return frame
-
-
 def draw_frame_rate(frame, fps):
     """
     draws the frame rate on the frame
@@ -89,15 +75,44 @@ def draw_frame_rate(frame, fps):
     return frame
 
 
-def annotate_frame(frame, boxes, fps):
+def preview_shape(shape, width):
+    """
+    :param shape: the shape of the frame.
+    :param width: the maximum width of the preview or None to keep the size of the frame.
+    :return: the shape of the preview, the frame is only downscaled keeping its aspect ratio.
+    """
+    height, frame_width = shape[:2]
+    if width is not None and frame_width > width:
+        height = max(1, round(height * width / frame_width))
+        frame_width = width
+    return (height, frame_width) + tuple(shape[2:])
+
+
+def annotate_preview(frame, boxes, led_ids, fps, snapshot, width=None, out=None):
     """
-    annotates the frame with the plot and the bounding boxes
+    annotates a downscaled copy of the frame, the frame itself is not changed
     :param frame: the frame to annotate
-    :param boxes: the regions of interest
+    :param boxes: the regions of interest [x0, y0, x1, y1] in the coordinates of the frame
+    :param led_ids: the ids of the leds in the order of the boxes
     :param fps: the frame rate
-    :return: the annotated frame
+    :param snapshot: the last entries of the leds by id, a led without entry is drawn as off
+    :param width: the maximum width of the preview or None to keep the size of the frame
+    :param out: the array to render the preview into, with the shape of preview_shape, or None to allocate it
+    :return: the annotated preview
     """
-    frame = draw_bounding_boxes(frame, boxes)
-    frame = draw_frame_rate(frame, fps)
-    #frame = draw_plot_in_frame(frame)
-    return frame
+    shape = preview_shape(frame.shape, width)
+    if shape == frame.shape:
+        if out is None:
+            out = frame.copy()
+        else:
+            np.copyto(out, frame)
+    else:
+        out = cv2.resize(frame, (shape[1], shape[0]), dst=out, interpolation=cv2.INTER_AREA)
+    scale = shape[1] / frame.shape[1]
+    boxes = np.rint(np.asarray(boxes, dtype=np.float32) * scale).astype(int)
+    for led_id, box in zip(led_ids, boxes):
+        entry = snapshot.get(led_id)
+        color = (0, 255, 0) if entry is not None and entry["state"] == "on" else (0, 0, 255)
+        cv2.putText(out, led_id, (int(box[0]) - 20, int(box[1]) - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        cv2.rectangle(out, (int(box[0]), int(box[1])), (int(box[2]), int(box[3])), color, 2)
+    return draw_frame_rate(out, fps)
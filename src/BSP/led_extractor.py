@@ -25,17 +25,14 @@ def get_transformed_borders(leds: List[Led], board_orientation: BoardOrientation
     return list(map(lambda x: [int(round(x[0][0])), int(round(x[0][1])), int(round(x[1][0])), int(round(x[1][1]))], zip(upper_borders_transformed, lower_borders_transformed)))
 
 
-def get_led_roi(frame: np.array, leds: List[Led], board_orientation: BoardOrientation) -> List[np.array]:
+def get_led_roi_boxes(leds: List[Led], board_orientation: BoardOrientation) -> List[List[int]]:
     """
-    Returns the LEDs in the target image based on the homography matrix
+    Returns the squares around the LEDs in the target image based on the homography matrix
 
     :param leds: A list with the LED objects which shall be evaluated
-    :param frame: The frame where the LEDs will be cut out
     :param board_orientation: The orientation of the board in a BoardOrientation object
-    :return: The LEDs in the target image as a list
+    :return: The upper left and lower right corner coordinates [x0, y0, x1, y1] of the LED squares as a list
     """
-
-
     # Transforms the center points
     led_centers = np.float32(list(map(lambda x: x.position, leds)))
     led_borders = np.float32(list(map(lambda x: [x.position[0] + x.radius, x.position[1] + x.radius], leds)))
@@ -49,7 +46,23 @@ def get_led_roi(frame: np.array, leds: List[Led], board_orientation: BoardOrient
         radius.append(int(round(max(abs(led_centers_transformed[i][0] - led_radius_transformed[i][0]), abs(led_centers_transformed[i][1] - led_radius_transformed[i][1])))))
 
     #radius = list(map(lambda led: round(led.radius * max(scale_x, scale_y)), leds))
-    led_rois: List[np.array] = _led_by_circle_coordinates(frame, led_centers_transformed.astype(int), radius)
+    return _boxes_by_circle_coordinates(led_centers_transformed.astype(int), radius)
+
+
+def get_led_roi(frame: np.array, leds: List[Led], board_orientation: BoardOrientation,
+                boxes: List[List[int]] = None) -> List[np.array]:
+    """
+    Returns the LEDs in the target image based on the homography matrix
+
+    :param leds: A list with the LED objects which shall be evaluated
+    :param frame: The frame where the LEDs will be cut out
+    :param board_orientation: The orientation of the board in a BoardOrientation object
+    :param boxes: The boxes returned by get_led_roi_boxes for the same orientation, calculated if None
+    :return: The LEDs in the target image as a list
+    """
+    if boxes is None:
+        boxes = get_led_roi_boxes(leds, board_orientation)
+    led_rois: List[np.array] = [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in boxes]
 
     assert len(led_rois) == len(leds), "Not all LEDs have been detected."
 
@@ -60,18 +73,28 @@ def get_led_roi(frame: np.array, leds: List[Led], board_orientation: BoardOrient
     return led_rois
 
 
-def _led_by_circle_coordinates(frame: np.array, circle_centers: List[np.array], r: List[int]):
+def clip_boxes(boxes: List[List[int]], width: int, height: int) -> List[List[int]]:
+    """
+    Clips the boxes to the frame
+
+    :param boxes: The boxes returned by get_led_roi_boxes
+    :param width: The width of the frame
+    :param height: The height of the frame
+    :return: The boxes [x0, y0, x1, y1] with all coordinates inside the frame
+    """
+    return [[min(max(x0, 0), width), min(max(y0, 0), height), min(max(x1, 0), width), min(max(y1, 0), height)]
+            for x0, y0, x1, y1 in boxes]
+
+
+def _boxes_by_circle_coordinates(circle_centers: List[np.array], r: List[int]) -> List[List[int]]:
     """
-    Returns a list of circles with radius r around the center points
+    Returns a list of squares with radius r around the center points
 
     :param circle_centers:
     :param r:
-    :return:
+    :return: the upper left and lower right corner coordinates of the squares
     """
-    leds = []
+    boxes = []
     for (center, radius) in zip(circle_centers, r):
-        top_left = (center[0] - radius, center[1] - radius)
-        bottom_right = (center[0] + radius, center[1] + radius)
-        led = frame[top_left[1]:bottom_right[1], top_left[0]:bottom_right[0]]
-        leds.append(led)
-    return leds
+        boxes.append([center[0] - radius, center[1] - radius, center[0] + radius, center[1] + radius])
+    return boxes
@@ -1,6 +1,5 @@
 import asyncio
 from logging import debug, error, warning, info
-from queue import Queue
 import logging
 from threading import Thread
 from typing import List
@@ -18,18 +17,22 @@ from BSP.frame_anotations import frame_anotator
 from publisher.connection.message.change_msg import BoardChanges
 from publisher.connection.mqtt import MQTTConnector
 from publisher.connection.mqtt.mqtt_connector import publish_heartbeat
+from publisher.change_queue import ChangeQueue
+from publisher.frame_slot import FrameSlot
 from BSP.BoardOrientation import BoardOrientation
 from BSP.BufferlessVideoCapture import BufferlessVideoCapture
 from BSP.DetectionException import DetectionException
 from BSP.homographyProvider import homography_by_sift
-from BSP.led_extractor import get_led_roi, get_transformed_borders
+from BSP.led_extractor import clip_boxes, get_led_roi, get_led_roi_boxes, get_transformed_borders
 from BSP.led_state import LedState
 from BSP.state_table_entry import StateTableEntry
 from BSP.state_handler.state_table import insert_state_entry
+from BSP.state_handler.state_store import StateStore
+from BSP.state_handler.state_log import StateLog
+from BSP.FrameContext import FrameContext
 
 
-from BSP.detection.image_preprocessing import mask_background
-from BSP.detection.luminance_detection import plot_luminance, avg_board_brightness
+from BSP.detection.luminance_detection import plot_luminance, estimate_board_brightness
 
 class StateDetector:
     """
@@ -47,35 +50,98 @@ class StateDetector:
         logging_level = "DEFAULT": The logging level
         visualizer = FALSE: Visualise the results with the BIP
         validity_seconds = 300: The time until a new homography matrix is calculated
+        brightness_stride = 4: The factor the frame is downscaled by to estimate the board brightness
+        delay_in_seconds = 0.05: The time between two full detections
+        fast_sampling = False: If True, the brightness of the LEDs is sampled from every frame in between two full
+            detections, skipping the full detection pipeline for these frames
+        normalize_brightness = False: If True, lighting changes are compensated by rescaling the LED brightness
+            instead of invalidating all LEDs
+        confirm_frames = 1: The number of consecutive frames a state change has to be detected in before it is reported
+        confirm_seconds = None: The time after which a detected state change is reported regardless of confirm_frames,
+            this bounds the latency added by confirm_frames
+        hysteresis = 0: The additional brightness deviation required to detect a LED that is on as off
+        history_max_rows = 4096: The number of state entries kept in memory per LED
+        history_max_age = None: The age in seconds after which state entries are removed from memory
+        history_interval = None: The length in seconds of the intervals removed state entries are compacted into
+        state_log = None: The directory of a binary log all state entries are appended to. The state table is rebuilt
+            from the log on start
+        state_log_max_size = 16 MiB: The size in bytes after which a new log file is started
+        state_log_max_files = 64: The number of log files kept, the oldest files are removed. None keeps all files
         debug = False: If True shows the windows with the LEDs and the current frame otherwise shows nothing
+        preview_width = 1280: The maximum width of the annotated preview put into the frame slot. The preview is only
+            rendered while a consumer of the frame slot is active, None keeps the size of the frame
         """
         self.board = kwargs["reference"].get_cropped_board()
         self.webcam_id = kwargs["webcam_id"]
-        self.delay_in_seconds = 0.05
+        self.delay_in_seconds = kwargs.get("delay_in_seconds", 0.05)
+        self.fast_sampling = kwargs.get("fast_sampling", False)
         # self.state_table: List[StateTableEntry] = []
         self.timer: sched.scheduler = sched.scheduler(time.time, time.sleep)
         self.current_orientation: BoardOrientation = None
         self.bufferless_video_capture: BufferlessVideoCapture = None
+        self._roi_boxes = None
+        self._roi_boxes_orientation: BoardOrientation = None
+        self._led_borders = None
+        self._led_borders_orientation: BoardOrientation = None
+        self._led_ids = [led.id for led in self.board.led]
 
         self._board_observer = BoardObserver(self.board.led)
 
         self.validity_seconds = kwargs.get("validity_seconds", 300)
         self.debug = kwargs.get("debug", False)
-        self._board_observer = BoardObserver(self.board.led, self.debug)
+        self.brightness_stride = kwargs.get("brightness_stride", 4)
+        self.preview_width = kwargs.get("preview_width", 1280)
+        self._board_observer = BoardObserver(self.board.led, self.debug,
+                                             normalize_brightness=kwargs.get("normalize_brightness", False),
+                                             confirm_frames=kwargs.get("confirm_frames", 1),
+                                             confirm_seconds=kwargs.get("confirm_seconds", None),
+                                             hysteresis=kwargs.get("hysteresis", 0))
+
+        # the states of this detector's board, written by the detection thread only
+        self.state_store = StateStore(kwargs.get("history_max_rows", 4096), kwargs.get("history_max_age", None),
+                                      kwargs.get("history_interval", None))
+        if kwargs.get("state_log", None) is not None:
+            state_log = StateLog(kwargs["state_log"], kwargs.get("state_log_max_size", 16 * 1024 * 1024),
+                                 kwargs.get("state_log_max_files", 64))
+            # fail on start instead of on the first change of a LED that does not fit into the log
+            for led in self.board.led:
+                for color in list(led.colors or []) + [""]:
+                    StateLog.validate(led.id, color)
+            state_log.replay(self.state_store)
+            self.state_store.log = state_log
 
         self._closed = False
 
         self.prev_frame_time = time.time()
         self.new_frame_time = time.time()
 
-        self.state_queue = Queue()
+        # lossless queue of the changes and slot of the latest annotated preview, see MasterPublisher
+        self.state_queue = ChangeQueue()
+        self.frame_slot = FrameSlot()
+        self._frame_changes: List[BoardChanges] = None
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         logging.info("Closing StateDetector")
+        if self._board_observer.normalize_brightness:
+            logging.info("Lighting compensation avoided %d invalidations, %d invalidations were necessary",
+                         self._board_observer.invalidations_avoided, self._board_observer.invalidations)
+        change_gate = self._board_observer.change_gate
+        if change_gate is not None:
+            logging.info("Change gate evaluated %d and skipped %d LED checks", change_gate.evaluated,
+                         change_gate.skipped)
+        debouncer = self._board_observer.debouncer
+        if self._board_observer.frequency_updates > 0:
+            logging.info("Published %d blink frequency updates without a state change",
+                         self._board_observer.frequency_updates)
+        if debouncer.confirm_frames > 1:
+            logging.info("Debouncing confirmed %d and suppressed %d state changes", debouncer.confirmed,
+                         debouncer.suppressed)
         self._closed = True
+        if self.state_store.log is not None:
+            self.state_store.log.close()
         if self.bufferless_video_capture is not None:
             self.bufferless_video_capture.close()
         cv2.destroyAllWindows()
@@ -85,11 +151,46 @@ class StateDetector:
         """
         Starts the detection. Waits the number of seconds configured in the StateDetector, afterwards
         detects the current state. Repeats itself, blocking.
+        If fast sampling is enabled, the brightness of the LEDs is sampled from every frame while waiting.
         """
         while not self._closed:
-            time.sleep(self.delay_in_seconds)
+            if self.fast_sampling and self._roi_boxes is not None:
+                next_detection = time.time() + self.delay_in_seconds
+                while not self._closed and time.time() < next_detection:
+                    if not self._sample_led_rois():
+                        return  # Video capture is closed
+            else:
+                time.sleep(self.delay_in_seconds)
             self._detect_current_state()
 
+    def _sample_led_rois(self) -> bool:
+        """
+        Reads the next frame and only adds the brightness of the LED ROIs, which are cached from the last full
+        detection, to the brightness history of the LEDs. The homography check, the board brightness, the state
+        detection, the annotation and publishing are skipped.
+
+        :return: False if the video capture is closed, True otherwise.
+        """
+        frame = self.bufferless_video_capture.read()
+        timestamp = time.time()
+
+        if frame is None:
+            return False
+
+        # The full detection works on the frame rotated by 180 degrees. Instead of rotating the whole frame, the
+        # boxes are mirrored. The ROIs are then rotated as well, which does not matter for their brightness. The boxes
+        # are clipped first, as mirrored coordinates outside the frame would wrap around.
+        height, width = frame.shape[:2]
+        boxes = clip_boxes(self._roi_boxes, width, height)
+        if any(x1 <= x0 or y1 <= y0 for x0, y0, x1, y1 in boxes):
+            return True  # The next full detection checks the homography
+        rois = [frame[height - y1:height - y0, width - x1:width - x0] for x0, y0, x1, y1 in boxes]
+
+        context = FrameContext(frame, None, timestamp)
+        context.set_rois(rois)
+        self._board_observer.sample_brightness(context)
+        return True
+
     def _detect_current_state(self):
         """
         Detects the current state of the LEDs, updates the StateTable.
@@ -98,6 +199,7 @@ class StateDetector:
         assert self.bufferless_video_capture is not None, "Video_capture is None. Has the open_stream method been called before?"
 
         frame = self.bufferless_video_capture.read()
+        timestamp = time.time()
 
         if frame is None:
             return  # Indicates that video capture is closed and state detector stopped
@@ -108,34 +210,52 @@ class StateDetector:
             self.current_orientation = homography_by_sift(self.board.image, frame, display_result=False,
                                                           validity_seconds=self.validity_seconds)
 
-        masked_frame = mask_background(frame, self.current_orientation.corners)
-        #plot_luminance(masked_frame, title="Masked frame")
-        avg_brightness = avg_board_brightness(frame, self.current_orientation.corners)
+        context = FrameContext(frame, self.current_orientation, timestamp)
+        avg_brightness = estimate_board_brightness(frame, self.current_orientation, self.brightness_stride)
 
         #plot_luminance(frame, title="Original frame")
-        leds_roi = get_led_roi(frame, self.board.led, self.current_orientation)
+        if self._roi_boxes_orientation is not self.current_orientation:
+            self._roi_boxes = get_led_roi_boxes(self.board.led, self.current_orientation)
+            self._roi_boxes_orientation = self.current_orientation
+        leds_roi = get_led_roi(frame, self.board.led, self.current_orientation, self._roi_boxes)
         for index, roi in enumerate(leds_roi):
             if roi.shape[0] <= 0 or roi.shape[1] <= 0:
                 self.current_orientation = None
+                self._roi_boxes = None
                 warning("One ROI's size is 0. Assuming the homography matrix is wrong, retry on next frame.")
                 return
+        context.set_rois(leds_roi, self._roi_boxes)
 
-
-        # Check LED states
-        self._board_observer.check(frame, leds_roi,avg_brightness, self.on_change)
-
-
-
-        # Publish frame
-        leds_borders = get_transformed_borders(self.board.led, self.current_orientation)
+        # Check LED states, the changes of this frame are published together
+        self._frame_changes = []
+        self._board_observer.check(context, avg_brightness, self.on_change, self.on_frequency)
+        if len(self._frame_changes) > 0:
+            self.state_queue.put({"changes": self._frame_changes})
+        self._frame_changes = None
 
         # Calculate FPS
         self.new_frame_time = time.time()
         fps = int(1 / (self.new_frame_time - self.prev_frame_time))
         self.prev_frame_time = self.new_frame_time
 
-        frame_anotator.annotate_frame(frame, leds_borders, fps)
-        self.state_queue.put({"frame": frame})
+        if self.frame_slot.active:
+            self._publish_preview(frame, fps)
+
+    def _publish_preview(self, frame, fps: int) -> None:
+        """
+        Annotates a downscaled copy of the frame and puts it into the frame slot. The frame itself stays untouched.
+
+        :param frame: the current frame.
+        :param fps: the current frame rate.
+        :return: None.
+        """
+        if self._led_borders_orientation is not self.current_orientation:
+            self._led_borders = get_transformed_borders(self.board.led, self.current_orientation)
+            self._led_borders_orientation = self.current_orientation
+        out = self.frame_slot.reserve(frame_anotator.preview_shape(frame.shape, self.preview_width))
+        preview = frame_anotator.annotate_preview(frame, self._led_borders, self._led_ids, fps,
+                                                  self.state_store.snapshot(), self.preview_width, out)
+        self.frame_slot.put(preview)
 
     def open_stream(self, video_capture: BufferlessVideoCapture = None):
         """
@@ -158,7 +278,8 @@ class StateDetector:
             error("The created video capture is not opened.")
             raise Exception(f"StateDetector is unable to open VideoCapture with index {self.webcam_id}.")
 
-    def on_change(self, name: str, state: bool, color: str, time_point) -> None:
+    def on_change(self, name: str, state: bool, color: str, time_point, frequency=None, duty_cycle=None,
+                  confidence=None) -> None:
         """
         Function that should be called when a LED state change has been detected.
 
@@ -167,12 +288,39 @@ class StateDetector:
         :param state: True if this LED is currently powered on.
         :param color: The color that has been detected.
         :param time_point: The time the LED changed it's state.
+        :param frequency: The estimated blink frequency or None if the frequency of the state table should be used.
+        :param duty_cycle: The estimated duty cycle of the blinking or None if unknown.
+        :param confidence: The confidence of the estimated blink frequency or None if it is not estimated.
         :return: None.
         """
         state_str = "on" if state else "off"
-        entry = insert_state_entry(name, state_str, color, time_point)
+        entry = insert_state_entry(self.state_store, name, state_str, color, time_point, frequency)
 
         new_state = LedState("on" if state else "off", color, time_point)
         board_changes = BoardChanges(self.board.id, name, new_state.power, new_state.color, entry["frequency"],
-                                     new_state.timestamp)
-        self.state_queue.put({"changes": board_changes})
+                                     new_state.timestamp, duty_cycle, confidence)
+        if self._frame_changes is not None:
+            self._frame_changes.append(board_changes)
+        else:
+            self.state_queue.put({"changes": [board_changes]})
+
+    def on_frequency(self, name: str, frequency: float, duty_cycle: float = None, confidence: float = None) -> None:
+        """
+        Function that should be called when the estimated blink frequency of a LED has changed without a state change.
+        The frequency of the current state is replaced and the state is published again with the new frequency.
+
+        :param name: The name of the LED.
+        :param frequency: The estimated blink frequency.
+        :param duty_cycle: The estimated duty cycle of the blinking or None if unknown.
+        :param confidence: The confidence of the estimated blink frequency.
+        :return: None.
+        """
+        entry = self.state_store.update_frequency(name, frequency)
+        if entry is None:
+            return
+        board_changes = BoardChanges(self.board.id, name, entry["state"], entry["color"], frequency, entry["time"],
+                                     duty_cycle, confidence)
+        if self._frame_changes is not None:
+            self._frame_changes.append(board_changes)
+        else:
+            self.state_queue.put({"changes": [board_changes]})
@@ -0,0 +1,200 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from BSP.state_handler.state_store import COLUMNS
+
+RECORD_DTYPE = np.dtype([
+    ("led_id", "S32"),
+    ("state", "S3"),
+    ("color", "S16"),
+    ("time", "<f8"),
+    ("last_time_off", "<f8"),
+    ("last_time_on", "<f8"),
+    ("frequency", "<f8"),
+])
+FILE_PATTERN = "state_log_{:06d}.bin"
+
+
+class StateLog:
+    """
+    Persists the state entries in an append-only binary log.
+    Every entry is written as soon as it is inserted as a record of fixed size (RECORD_DTYPE), so the files can be read
+    as NumPy arrays with np.memmap without parsing. A new file is started once a file reaches max_file_size and the
+    oldest files are removed if there are more than max_files.
+    The identifiers and colors are stored with a fixed length, longer ones are rejected instead of being truncated.
+    """
+
+    def __init__(self, directory: str, max_file_size: int = 16 * 1024 * 1024, max_files: int = 64):
+        """
+        :param directory: the directory the log files are written to. It is created if necessary.
+        :param max_file_size: the size in bytes after which a new file is started.
+        :param max_files: the number of files kept or None to keep all files.
+        """
+        self.directory = directory
+        self.max_file_size = max(max_file_size, RECORD_DTYPE.itemsize)
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+
+        files = self.files()
+        self._file_index = self._index_of(files[-1]) if len(files) > 0 else 0
+        self._file = None
+        self._file_size = 0
+        self._record = np.zeros(1, dtype=RECORD_DTYPE)
+
+    @staticmethod
+    def validate(led_id: str, color: str = "") -> None:
+        """
+        Checks that the identifier and the color of a LED fit into a record.
+
+        :param led_id: the identifier of the LED.
+        :param color: the name of the color.
+        :return: None.
+        :raises ValueError: if the identifier or the color is too long.
+        """
+        for field, value in [("led_id", led_id), ("color", color)]:
+            size = len(str(value).encode())
+            if size > RECORD_DTYPE[field].itemsize:
+                raise ValueError("The {} {!r} is longer than the {} bytes of the state log".format(
+                    field, value, RECORD_DTYPE[field].itemsize))
+
+    def append(self, entry: dict) -> None:
+        """
+        Appends an entry with the keys of COLUMNS to the log.
+
+        :param entry: the entry.
+        :return: None.
+        :raises ValueError: if the identifier or the color of the entry is too long.
+        """
+        color = entry["color"] if isinstance(entry["color"], str) else ""
+        self.validate(entry["led_id"], color)
+        record = self._record
+        record["led_id"] = str(entry["led_id"]).encode()
+        record["state"] = str(entry["state"]).encode()
+        record["color"] = color.encode()
+        record["time"] = entry["time"]
+        record["last_time_off"] = entry["last_time_off"]
+        record["last_time_on"] = entry["last_time_on"]
+        record["frequency"] = entry["frequency"]
+
+        file = self._writable_file()
+        file.write(record.tobytes())
+        file.flush()
+
+    def files(self) -> list:
+        """
+        :return: the paths of all log files in the order they have been written.
+        """
+        return sorted(glob.glob(os.path.join(self.directory, "state_log_*.bin")))
+
+    def read(self, start: float = None, end: float = None) -> np.array:
+        """
+        Reads the records of all files, which are memory-mapped instead of loaded.
+
+        :param start: only records at or after this time are returned or None for all records.
+        :param end: only records before this time are returned or None for all records.
+        :return: the records as structured array with RECORD_DTYPE in the order they have been written.
+        """
+        if self._file is not None:
+            self._file.flush()
+
+        parts = []
+        for path in self.files():
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+            if count == 0:
+                continue
+            records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+            if start is None and end is None:
+                parts.append(records)
+                continue
+            # debounced changes are recorded with the time they have been detected first, so the records are not
+            # strictly ordered by time
+            times = records["time"]
+            in_range = np.ones(count, dtype=bool)
+            if start is not None:
+                in_range &= times >= start
+            if end is not None:
+                in_range &= times < end
+            parts.append(records[in_range])
+
+        if len(parts) == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def to_dataframe(self, start: float = None, end: float = None) -> pd.DataFrame:
+        """
+        :param start: only entries at or after this time are returned or None for all entries.
+        :param end: only entries before this time are returned or None for all entries.
+        :return: the entries of the log in the format of the state table.
+        """
+        records = self.read(start, end)
+        table = pd.DataFrame({column: records[column] for column in COLUMNS}, columns=COLUMNS)
+        for column in ["led_id", "state", "color"]:
+            table[column] = table[column].str.decode("utf-8")
+        return table
+
+    def replay(self, store) -> None:
+        """
+        Rebuilds the given store from the log, e.g. after a restart.
+
+        :param store: the StateStore, which is cleared first.
+        :return: None.
+        """
+        store.load_dataframe(self.to_dataframe())
+
+    def close(self) -> None:
+        """
+        Closes the current file.
+
+        :return: None.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _writable_file(self):
+        """
+        Returns the file the next record is written to, starting a new file if the current one is full.
+
+        :return: the opened file.
+        """
+        if self._file is not None and self._file_size + RECORD_DTYPE.itemsize > self.max_file_size:
+            self.close()
+            self._next_file()
+
+        if self._file is None:
+            path = os.path.join(self.directory, FILE_PATTERN.format(self._file_index))
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            # a partially written record of an interrupted run would shift all following records
+            if size + RECORD_DTYPE.itemsize > self.max_file_size or size % RECORD_DTYPE.itemsize != 0:
+                self._next_file()
+                path = os.path.join(self.directory, FILE_PATTERN.format(self._file_index))
+                size = 0
+            self._file = open(path, "ab")
+            self._file_size = size
+        self._file_size += RECORD_DTYPE.itemsize
+        return self._file
+
+    def _next_file(self) -> None:
+        self._file_index += 1
+        self._remove_old_files()
+
+    def _remove_old_files(self) -> None:
+        """
+        Removes the oldest files, so that there are at most max_files including the next one.
+
+        :return: None.
+        """
+        if self.max_files is None:
+            return
+        files = self.files()
+        for path in files[:max(len(files) - self.max_files + 1, 0)]:
+            os.remove(path)
+
+    @staticmethod
+    def _index_of(path: str) -> int:
+        return int(os.path.basename(path)[len("state_log_"):-len(".bin")])
@@ -0,0 +1,542 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["led_id", "state", "color", "time", "last_time_off", "last_time_on", "frequency"]
+AGGREGATE_COLUMNS = ["led_id", "interval_start", "on_time", "transitions", "frequency"]
+STATES = ["off", "on"]
+
+
+class _LedBuffer:
+    """
+    The preallocated ring buffers holding the entries of a single LED, one array per column.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: the number of entries kept, older entries are overwritten.
+        """
+        self.capacity = capacity
+        self.index = 0
+        self.count = 0
+        self.sequence = np.zeros(capacity, dtype=np.int64)
+        self.time = np.zeros(capacity, dtype=np.float64)
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.color = np.zeros(capacity, dtype=np.int16)
+        self.last_time_off = np.zeros(capacity, dtype=np.float64)
+        self.last_time_on = np.zeros(capacity, dtype=np.float64)
+        self.frequency = np.zeros(capacity, dtype=np.float64)
+
+    def append(self, sequence: int, timestamp, state: int, color: int, last_time_off, last_time_on, frequency) -> None:
+        i = self.index
+        self.sequence[i] = sequence
+        self.time[i] = timestamp
+        self.state[i] = state
+        self.color[i] = color
+        self.last_time_off[i] = last_time_off
+        self.last_time_on[i] = last_time_on
+        self.frequency[i] = frequency
+        self.index = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def order(self) -> np.array:
+        """
+        :return: the indices of the stored entries in chronological order.
+        """
+        return (self.index - self.count + np.arange(self.count)) % self.capacity
+
+    def oldest(self) -> int:
+        """
+        :return: the index of the oldest entry.
+        """
+        return (self.index - self.count) % self.capacity
+
+    def pop_oldest(self) -> None:
+        """
+        Removes the oldest entry.
+
+        :return: None.
+        """
+        self.count -= 1
+
+    def physical(self, positions) -> np.array:
+        """
+        :param positions: positions in chronological order, 0 being the oldest entry.
+        :return: the indices of the entries in the buffers.
+        """
+        return (self.oldest() + np.asarray(positions)) % self.capacity
+
+    def search(self, timestamp, side: str = "right") -> int:
+        """
+        Finds the position of the given time in the chronologically ordered entries with a binary search on the one
+        or two contiguous parts of the ring buffer.
+
+        :param timestamp: the time.
+        :param side: "left" to count the entries before the time, "right" to also count the entries at the time.
+        :return: the number of entries before (or at) the time.
+        """
+        oldest = self.oldest()
+        first = min(self.count, self.capacity - oldest)
+        position = int(np.searchsorted(self.time[oldest:oldest + first], timestamp, side=side))
+        if position < first or first == self.count:
+            return position
+        return first + int(np.searchsorted(self.time[:self.count - first], timestamp, side=side))
+
+
+class _IntervalAggregates:
+    """
+    The history of a single LED compacted into consecutive intervals: the time the LED was on, the number of
+    transitions and the mean frequency of the entries starting in each interval.
+    """
+
+    def __init__(self, interval: float):
+        """
+        :param interval: the length of an interval in seconds.
+        """
+        self.interval = interval
+        self.starts = []
+        self.on_time = []
+        self.transitions = []
+        self.frequency_sum = []
+        self.entries = []
+        self.last_state = None
+
+    def add(self, start, end, state: int, frequency) -> None:
+        """
+        Adds an entry, which has been the state of the LED from start to end.
+
+        :param start: the time of the entry.
+        :param end: the time of the next entry.
+        :param state: the state of the entry.
+        :param frequency: the frequency of the entry.
+        :return: None.
+        """
+        idx = self._interval(start)
+        if self.last_state is not None and state != self.last_state:
+            self.transitions[idx] += 1
+        self.last_state = state
+        self.frequency_sum[idx] += frequency
+        self.entries[idx] += 1
+
+        if state:
+            # split the on time at the interval borders
+            while start < end:
+                idx = self._interval(start)
+                border = min(max(self.starts[idx] + self.interval, start + 1e-9), end)
+                self.on_time[idx] += border - start
+                start = border
+
+    def copy(self):
+        """
+        :return: an independent copy of these aggregates.
+        """
+        aggregates = _IntervalAggregates(self.interval)
+        aggregates.starts = list(self.starts)
+        aggregates.on_time = list(self.on_time)
+        aggregates.transitions = list(self.transitions)
+        aggregates.frequency_sum = list(self.frequency_sum)
+        aggregates.entries = list(self.entries)
+        aggregates.last_state = self.last_state
+        return aggregates
+
+    def rebin(self, interval: float):
+        """
+        Returns these aggregates compacted into longer intervals.
+
+        :param interval: the length of the new intervals in seconds, an integer multiple of the current interval.
+        :return: the aggregates with the new interval.
+        :raises ValueError: if the interval is not an integer multiple of the current interval.
+        """
+        factor = interval / self.interval
+        if factor < 1 or not np.isclose(factor, round(factor)):
+            raise ValueError("The history is compacted into intervals of {} s, which can not be combined into "
+                             "intervals of {} s".format(self.interval, interval))
+        aggregates = _IntervalAggregates(interval)
+        for start, on_time, transitions, frequency_sum, entries in zip(self.starts, self.on_time, self.transitions,
+                                                                       self.frequency_sum, self.entries):
+            # the middle of the interval avoids rounding at the borders
+            idx = aggregates._interval(start + self.interval / 2)
+            aggregates.on_time[idx] += on_time
+            aggregates.transitions[idx] += transitions
+            aggregates.frequency_sum[idx] += frequency_sum
+            aggregates.entries[idx] += entries
+        aggregates.last_state = self.last_state
+        return aggregates
+
+    def to_dataframe(self, led_id: str) -> pd.DataFrame:
+        """
+        :param led_id: the identifier of the LED.
+        :return: a DataFrame with the columns AGGREGATE_COLUMNS and one row per interval.
+        """
+        entries = np.array(self.entries, dtype=np.float64)
+        frequency = np.divide(self.frequency_sum, entries, out=np.zeros(len(entries)), where=entries > 0)
+        return pd.DataFrame({"led_id": led_id, "interval_start": np.array(self.starts, dtype=np.float64),
+                             "on_time": np.array(self.on_time, dtype=np.float64),
+                             "transitions": np.array(self.transitions, dtype=np.int64), "frequency": frequency},
+                            columns=AGGREGATE_COLUMNS)
+
+    def _interval(self, timestamp) -> int:
+        """
+        Returns the index of the interval containing the given time, appending intervals if necessary.
+
+        :param timestamp: the time.
+        :return: the index.
+        """
+        start = np.floor(timestamp / self.interval) * self.interval
+        if len(self.starts) == 0:
+            self._append(start)
+        idx = max(int(round((start - self.starts[0]) / self.interval)), 0)
+        while len(self.starts) <= idx:
+            self._append(self.starts[-1] + self.interval)
+        return idx
+
+    def _append(self, start) -> None:
+        self.starts.append(start)
+        self.on_time.append(0.0)
+        self.transitions.append(0)
+        self.frequency_sum.append(0.0)
+        self.entries.append(0)
+
+
+class StateStore:
+    """
+    Stores the state entries of all LEDs in columnar ring buffers, one per LED.
+    Inserting an entry and looking up the last entry of a LED take constant time. The entries of a LED are expected
+    in chronological order, so queries by time use a binary search over its timestamps. The retention limits the entries
+    kept per LED by their number and age, so the memory is bounded. Removed entries can be compacted into per-interval
+    aggregates, which keep the long-term statistics of a LED.
+    The last entry of every LED is additionally kept as inserted in a snapshot. The snapshot is replaced instead of
+    modified on every insert, so reading it requires no lock. Writes and queries of the history hold the lock of the
+    store, which is meant to have a single writer.
+    """
+
+    def __init__(self, max_rows: int = 4096, max_age: float = None, aggregate_interval: float = None, log=None):
+        """
+        :param max_rows: the number of entries kept per LED, older entries are removed.
+        :param max_age: the age in seconds, relative to the latest entry of a LED, after which entries are removed or
+            None to keep them until max_rows is reached.
+        :param aggregate_interval: the length in seconds of the intervals removed entries are compacted into or None
+            to discard them.
+        :param log: a StateLog every inserted entry is appended to or None.
+        """
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.aggregate_interval = aggregate_interval
+        self.log = log
+        self.lock = threading.RLock()
+        self.version = 0
+        self._buffers = {}
+        self._aggregates = {}
+        self._snapshot = {}
+        self._colors = []
+        self._color_ids = {}
+        self._sequence = 0
+
+    def insert(self, entry: dict) -> None:
+        """
+        Appends an entry with the keys of COLUMNS and removes the entries of the LED exceeding the retention.
+
+        :param entry: the entry.
+        :return: None.
+        """
+        with self.lock:
+            self._insert(entry)
+            if self.log is not None:
+                self.log.append(entry)
+
+    def _insert(self, entry: dict) -> None:
+        led_id = entry["led_id"]
+        buffer = self._buffers.get(led_id)
+        if buffer is None:
+            buffer = _LedBuffer(self.max_rows)
+            self._buffers[led_id] = buffer
+
+        timestamp = entry["time"]
+        if buffer.count == buffer.capacity:
+            self._evict(led_id, buffer, timestamp)
+        if self.max_age is not None:
+            while buffer.count > 0 and buffer.time[buffer.oldest()] < timestamp - self.max_age:
+                self._evict(led_id, buffer, timestamp)
+
+        buffer.append(self._sequence, timestamp, STATES.index(entry["state"]), self._color_id(entry["color"]),
+                      entry["last_time_off"], entry["last_time_on"], entry["frequency"])
+        self._sequence += 1
+
+        # replace the snapshot, readers keep the one they got
+        snapshot = dict(self._snapshot)
+        snapshot[led_id] = dict(entry)
+        self._snapshot = snapshot
+        self.version += 1
+
+    def update_frequency(self, led_id: str, frequency):
+        """
+        Replaces the frequency of the last entry of the given LED in the snapshot, the history is not changed.
+
+        :param led_id: the identifier of the LED.
+        :param frequency: the new frequency.
+        :return: a copy of the updated entry or None if the LED has no entries.
+        """
+        with self.lock:
+            entry = self._snapshot.get(led_id)
+            if entry is None:
+                return None
+            entry = dict(entry, frequency=frequency)
+            snapshot = dict(self._snapshot)
+            snapshot[led_id] = entry
+            self._snapshot = snapshot
+            self.version += 1
+            return dict(entry)
+
+    def get_last_entry(self, led_id: str):
+        """
+        Returns the last entry of the given LED.
+
+        :param led_id: the identifier of the LED.
+        :return: a copy of the entry or None if the LED has no entries.
+        """
+        entry = self._snapshot.get(led_id)
+        return dict(entry) if entry is not None else None
+
+    def is_new(self, led_id: str) -> bool:
+        """
+        :param led_id: the identifier of the LED.
+        :return: True if the LED has no entries.
+        """
+        return led_id not in self._snapshot
+
+    def led_ids(self) -> list:
+        """
+        :return: the identifiers of all LEDs in the order of their first entry.
+        """
+        return list(self._snapshot.keys())
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current state of all LEDs without copying or locking. The returned snapshot is not changed by
+        later inserts and must not be modified.
+
+        :return: a dict with the last entry of every LED by its identifier.
+        """
+        return self._snapshot
+
+    def state_at(self, led_id: str, timestamp):
+        """
+        Returns the entry of the given LED that was valid at the given time.
+
+        :param led_id: the identifier of the LED.
+        :param timestamp: the time.
+        :return: the entry as dict or None if the LED has no entry up to this time.
+        """
+        with self.lock:
+            buffer = self._buffers.get(led_id)
+            if buffer is None:
+                return None
+            position = buffer.search(timestamp, "right")
+            if position == 0:
+                return None
+            return self._entries(led_id, buffer, buffer.physical([position - 1])).iloc[0].to_dict()
+
+    def transitions(self, start, end, led_id: str = None) -> pd.DataFrame:
+        """
+        Returns the entries in which a LED changed its state within the given time range. The first entry of a LED is
+        a transition as well.
+
+        :param start: the start of the range.
+        :param end: the end of the range, inclusive.
+        :param led_id: the LED or None for all LEDs.
+        :return: a DataFrame with the columns COLUMNS ordered by time.
+        """
+        with self.lock:
+            parts = []
+            for led in (self.led_ids() if led_id is None else [led_id]):
+                buffer = self._buffers.get(led)
+                if buffer is None:
+                    continue
+                first = buffer.search(start, "left")
+                last = buffer.search(end, "right")
+                if last <= first:
+                    continue
+                # include the entry before the range to compare its state with the first one in the range
+                indices = buffer.physical(np.arange(max(first - 1, 0), last))
+                states = buffer.state[indices]
+                changed = np.empty(len(indices), dtype=bool)
+                changed[0] = True
+                changed[1:] = states[1:] != states[:-1]
+                if first > 0:
+                    indices, changed = indices[1:], changed[1:]
+                parts.append(self._entries(led, buffer, indices[changed]))
+            return self._concat(parts, "time")
+
+    def duty_cycle(self, led_id: str, start, end) -> float:
+        """
+        Returns the share of the given time range the LED has been on.
+
+        :param led_id: the identifier of the LED.
+        :param start: the start of the range.
+        :param end: the end of the range.
+        :return: the duty cycle within [0, 1] relative to the part of the range the state of the LED is known or NaN
+            if the state is not known within the range.
+        """
+        with self.lock:
+            buffer = self._buffers.get(led_id)
+            if buffer is None or end <= start:
+                return np.nan
+            first = max(buffer.search(start, "right") - 1, 0)
+            last = buffer.search(end, "left")
+            if last <= first:
+                return np.nan
+
+            indices = buffer.physical(np.arange(first, last))
+            times = np.clip(buffer.time[indices], start, end)
+            durations = np.diff(np.append(times, end))
+            known = durations.sum()
+            if known <= 0:
+                return np.nan
+            return float(durations[buffer.state[indices] == 1].sum() / known)
+
+    def to_dataframe(self, led_id: str = None) -> pd.DataFrame:
+        """
+        Exports the stored entries in the format of the state table.
+
+        :param led_id: the LED to export or None for all LEDs.
+        :return: a DataFrame with the columns COLUMNS and the entries in the order they have been inserted.
+        """
+        with self.lock:
+            led_ids = self.led_ids() if led_id is None else [led_id]
+            parts = []
+            for led in led_ids:
+                buffer = self._buffers.get(led)
+                if buffer is None or buffer.count == 0:
+                    continue
+                parts.append(self._entries(led, buffer, buffer.order()))
+            return self._concat(parts, "sequence")
+
+    def aggregates(self, led_id: str, interval: float = None) -> pd.DataFrame:
+        """
+        Returns the whole history of the given LED in intervals, the compacted history followed by the entries that
+        are still kept.
+
+        :param led_id: the identifier of the LED.
+        :param interval: the length of the intervals in seconds or None to use the aggregate_interval. Required if no
+            aggregate_interval is set. If a part of the history has been compacted, it has to be an integer multiple of
+            the aggregate_interval.
+        :return: a DataFrame with the columns AGGREGATE_COLUMNS and one row per interval.
+        :raises ValueError: if the compacted history can not be combined into intervals of the given length.
+        """
+        with self.lock:
+            interval = interval if interval is not None else self.aggregate_interval
+            assert interval is not None, "An interval is required if the history is not compacted."
+
+            compacted = self._aggregates.get(led_id)
+            if compacted is None:
+                aggregates = _IntervalAggregates(interval)
+            elif compacted.interval == interval:
+                aggregates = compacted.copy()
+            else:
+                aggregates = compacted.rebin(interval)
+
+            buffer = self._buffers.get(led_id)
+            if buffer is not None and buffer.count > 0:
+                order = buffer.order()
+                times = buffer.time[order]
+                # the last entry lasts until now, which is unknown here
+                ends = np.append(times[1:], times[-1])
+                for start, end, state, frequency in zip(times, ends, buffer.state[order], buffer.frequency[order]):
+                    aggregates.add(start, end, state, frequency)
+            return aggregates.to_dataframe(led_id)
+
+    def load_dataframe(self, table: pd.DataFrame) -> None:
+        """
+        Replaces all entries with the rows of the given state table.
+
+        :param table: a DataFrame with the columns COLUMNS.
+        :return: None.
+        """
+        with self.lock:
+            self.clear()
+            for row in table[COLUMNS].itertuples(index=False):
+                self._insert(row._asdict())
+
+    def clear(self) -> None:
+        """
+        Removes all entries and aggregates.
+
+        :return: None.
+        """
+        with self.lock:
+            self._buffers = {}
+            self._aggregates = {}
+            self._snapshot = {}
+            self._sequence = 0
+            self.version += 1
+
+    def __len__(self):
+        with self.lock:
+            return sum(buffer.count for buffer in self._buffers.values())
+
+    def _entries(self, led_id: str, buffer: _LedBuffer, indices: np.array) -> pd.DataFrame:
+        """
+        :param led_id: the identifier of the LED.
+        :param buffer: the buffer of the LED.
+        :param indices: the indices of the entries in the buffer.
+        :return: a DataFrame of the entries with the columns COLUMNS and their sequence numbers.
+        """
+        return pd.DataFrame({
+            "sequence": buffer.sequence[indices],
+            "led_id": led_id,
+            "state": np.array(STATES, dtype=object)[buffer.state[indices]],
+            "color": np.array(self._colors, dtype=object)[buffer.color[indices]],
+            "time": buffer.time[indices],
+            "last_time_off": buffer.last_time_off[indices],
+            "last_time_on": buffer.last_time_on[indices],
+            "frequency": buffer.frequency[indices],
+        })
+
+    @staticmethod
+    def _concat(parts: list, order_by: str) -> pd.DataFrame:
+        """
+        :param parts: DataFrames created with _entries.
+        :param order_by: the column the entries are ordered by.
+        :return: one DataFrame with the columns COLUMNS.
+        """
+        if len(parts) == 0:
+            return pd.DataFrame(columns=COLUMNS)
+        table = pd.concat(parts, ignore_index=True)
+        keys = [order_by, "sequence"] if order_by != "sequence" else ["sequence"]
+        return table.sort_values(keys, kind="stable")[COLUMNS].reset_index(drop=True)
+
+    def _evict(self, led_id: str, buffer: _LedBuffer, timestamp) -> None:
+        """
+        Removes the oldest entry of a LED and compacts it if an aggregate_interval is set.
+
+        :param led_id: the identifier of the LED.
+        :param buffer: the buffer of the LED.
+        :param timestamp: the time of the entry that is inserted next.
+        :return: None.
+        """
+        oldest = buffer.oldest()
+        if self.aggregate_interval is not None:
+            aggregates = self._aggregates.get(led_id)
+            if aggregates is None:
+                aggregates = _IntervalAggregates(self.aggregate_interval)
+                self._aggregates[led_id] = aggregates
+            # the entry lasted until the next one
+            end = buffer.time[(oldest + 1) % buffer.capacity] if buffer.count > 1 else timestamp
+            aggregates.add(buffer.time[oldest], end, buffer.state[oldest], buffer.frequency[oldest])
+        buffer.pop_oldest()
+
+    def _color_id(self, color: str) -> int:
+        """
+        :param color: the name of a color.
+        :return: the id the color is stored as.
+        """
+        if not isinstance(color, str):
+            # missing colors of loaded tables
+            color = ""
+        color_id = self._color_ids.get(color)
+        if color_id is None:
+            color_id = len(self._colors)
+            self._colors.append(color)
+            self._color_ids[color] = color_id
+        return color_id
@@ -1,46 +1,47 @@
-import warnings
-warnings.simplefilter(action='ignore', category=FutureWarning)  # Ignore the warning of the dataframe append
-
 import numpy as np
 import pandas as pd
 import time
 import matplotlib.pyplot as plt
-from threading import Lock
 
-state_table = pd.DataFrame(columns=["led_id", "state", "color", "time", "last_time_off", "last_time_on", "frequency"])
+from BSP.state_handler.state_store import StateStore, COLUMNS
 
 
-def insert_state_entry(led_id: str,
+def insert_state_entry(store: StateStore,
+                       led_id: str,
                        state: str,
                        color: str,
-                       timestamp=None):
+                       timestamp=None,
+                       frequency=None):
     """
     Insert a new row to the state_table
 
+    :param store: the StateStore to insert into, e.g. the state_store of a StateDetector.
     :param led_id: is the name of the LED type: str
     :param state: the current state. Can be "on" or "off"
     :param color: the color as str
     :param timestamp: the timestamp or None if time.time() should be used.
+    :param frequency: the estimated frequency or None if it should be calculated from the last state change.
     :return: The created entry
     """
-    global state_table
-    with Lock():
-        last_state = get_last_entry(led_id)
+    with store.lock:
+        last_state = store.get_last_entry(led_id)
         entry = _add_new_led_id(led_id, state, color, timestamp)
         if last_state is not None:
             entry = insert_last_time_state(entry, last_state)
-        state_table = state_table.append(entry, ignore_index=True)
+        if frequency is not None:
+            entry["frequency"] = frequency
+        store.insert(entry)
         return entry
 
 
-def get_state_table():
+def get_state_table(store: StateStore):
     """
     Returns an copy of the state table.
 
+    :param store: the StateStore of the LEDs.
     :return:
     """
-    global state_table
-    return state_table.copy()
+    return store.to_dataframe()
 
 
 def insert_frequency(current_entry, last_entry, inverse_state):
@@ -66,7 +67,7 @@ def insert_last_time_state(current_entry, last_entry):
 
     inverse_state = "off" if current_entry["state"] == "on" else "on"
     column_name = "last_time_" + inverse_state
-    if current_entry["state"] is last_entry["state"]:
+    if current_entry["state"] == last_entry["state"]:
         current_entry[column_name] = last_entry[column_name]
     else:
         insert_frequency(current_entry, last_entry, inverse_state)
@@ -74,15 +75,15 @@ def insert_last_time_state(current_entry, last_entry):
     return current_entry
 
 
-def calculate_frequency(led_id):
+def calculate_frequency(store: StateStore, led_id):
     """
     Calculates the frequency of the given led_id.
 
+    :param store: the StateStore of the LEDs.
     :param led_id:
     :return:
     """
-    global state_table
-    time_series = get_led_time_series(led_id)
+    time_series = get_led_time_series(store, led_id)
     time_series["frequency"] = time_series["time"] - time_series["last_time_on"]
     return time_series["frequency"]
 
@@ -100,134 +101,141 @@ def _add_new_led_id(led_id,
     :param timestamp: the current timestamp or None if time.time() should be used.
     :return:
     """
-    global state_table
     time_now = timestamp if timestamp is not None else time.time()
     if (state == "on"):
-        return pd.Series({"led_id": led_id, "state": state, "color": color, "time": time_now, "last_time_off": np.NINF,
-                          "last_time_on": time_now, "frequency": 0})
+        return {"led_id": led_id, "state": state, "color": color, "time": time_now, "last_time_off": -np.inf,
+                "last_time_on": time_now, "frequency": 0}
 
     else:
-        return pd.Series({"led_id": led_id, "state": state, "color": color, "time": time_now, "last_time_off": time_now,
-                          "last_time_on": np.NINF, "frequency": 0})
+        return {"led_id": led_id, "state": state, "color": color, "time": time_now, "last_time_off": time_now,
+                "last_time_on": -np.inf, "frequency": 0}
 
 
-def check_if_led_is_new(led_id):
+def check_if_led_is_new(store: StateStore, led_id):
     """
     Checks if the given led_id is new.
 
+    :param store: the StateStore of the LEDs.
     :param led_id:
     :return:
     """
-    global state_table
-    return state_table.loc[state_table["led_id"] == led_id].empty
+    return store.is_new(led_id)
 
 
-def get_last_entry(led_id):
+def get_last_entry(store: StateStore, led_id):
     """
     Returns the entry.
 
+    :param store: the StateStore of the LEDs.
     :param led_id: is the identifier of the led
     :param state: None if it doesn't matter, otherwise the state
-    :return:
+    :return: a dict with the columns of the state table as keys or None if the LED has no entries.
     """
-    global state_table
-    if check_if_led_is_new(led_id):
-        return None
-
-    return state_table.loc[state_table["led_id"] == led_id].iloc[-1]
+    return store.get_last_entry(led_id)
 
 
-def get_led_time_series(led_id):
+def get_led_time_series(store: StateStore, led_id, aggregated: bool = False, interval: float = None):
     """
     Returns the time series of the given led_id.
 
+    :param store: the StateStore of the LEDs.
     :param led_id:
+    :param aggregated: if True, the whole history including the compacted entries is returned in intervals with the
+        on time, the number of transitions and the mean frequency.
+    :param interval: the length of the intervals in seconds or None to use the interval of the retention.
     :return:
     """
-    global state_table
-    return state_table.loc[state_table["led_id"] == led_id]
+    if aggregated:
+        return store.aggregates(led_id, interval)
+    return store.to_dataframe(led_id)
 
 
-def load_state_table(file_name: str):
+def load_state_table(store: StateStore, file_name: str):
     """
     Loads the state table from the given file.
 
+    :param store: the StateStore of the LEDs.
     :param file_name:
     :return: the state table
     """
-    global state_table
     with open(file_name, "r") as file:
         new_state_table = pd.read_csv(file, delimiter=";")
         # check if the new state table is valid
-        assert np.all(new_state_table.columns == state_table.columns)
-        state_table = new_state_table
-    return state_table
+        assert np.all(new_state_table.columns == COLUMNS)
+        store.load_dataframe(new_state_table)
+    return store.to_dataframe()
 
 
-def save_state_table(file_name: str):
+def save_state_table(store: StateStore, file_name: str):
     """
     Saves the state table to the given file.
 
+    :param store: the StateStore of the LEDs.
     :param file_name:
     :return:
     """
-    global state_table
     with open(file_name, "w") as file:
-        state_table.to_csv(file, index=True)
+        store.to_dataframe().to_csv(file, sep=";", index=False)
 
 
-def get_led_as_time_series(led_id: str):
+def get_led_as_time_series(store: StateStore, led_id: str):
     """
     Returns the time series of the given led_id.
 
+    :param store: the StateStore of the LEDs.
     :param led_id:
     :return:
     """
-    global state_table
-    table = state_table.loc[state_table["led_id"] == led_id]
+    table = store.to_dataframe(led_id)
     # table["time"] = pd.to_datetime(table["time"])
     table = table.set_index("time")
 
     return table
 
 
-def plot_led_time_series(led_id):
+def plot_led_time_series(store: StateStore, led_id):
     """
     Plots the time series of the given led_id.
 
+    :param store: the StateStore of the LEDs.
     :param led_id:
     :return:
     """
-    table = get_led_as_time_series(led_id)
+    table = get_led_as_time_series(store, led_id)
     table["state"] = table["state"].map({"on": 1, "off": 0})
 
     table.plot(x="time", y="state")
     plt.show()
 
 
-def get_current_state():
+def get_current_state(store: StateStore):
     """
     Returns the last detected state of all leds.
 
+    :param store: the StateStore of the LEDs.
     :return:
     """
-    global state_table
+    state_table = store.to_dataframe()
     assert not state_table.empty  # check if the state table is empty
     last_time = state_table["time"].iloc[-1]
     return state_table.loc[state_table["time"] == last_time]
 
 
-def get_led_ids():
+def get_led_ids(store: StateStore):
     """
     Returns the led_ids.
 
+    :param store: the StateStore of the LEDs.
     :return:
     """
-    global state_table
-    return state_table["led_id"].unique()
+    return np.array(store.led_ids())
 
 
-def clear_state_table():
-    global state_table
-    state_table.drop(state_table.index, inplace=True)
+def clear_state_table(store: StateStore):
+    """
+    Removes all entries.
 
+    :param store: the StateStore of the LEDs.
+    :return:
+    """
+    store.clear()
@@ -9,6 +9,7 @@ import sys
 from BSP.state_detector import StateDetector
 import BDG.utils.json_util as jsutil
 from publisher.master_publisher import MasterPublisher
+from publisher.process_publisher import PublisherProcess
 from MockVideoCapture import MockVideoCapture
 
 
@@ -30,10 +31,31 @@ def main(args):
         logging.error("Could not load board: %s", e)
 
     # Open StateDetector
-    with StateDetector(reference=board, webcam_id=args.webcam_id, validity_seconds=args.validity_seconds, debug=args.debug) as detector:
-        publisher = MasterPublisher(detector.state_queue)
-        publisher.init_video("rtmp://localhost:8080", args.visualizer)
-        start_publisher(publisher, args.broker_host, args.broker_port)
+    with StateDetector(reference=board, webcam_id=args.webcam_id, validity_seconds=args.validity_seconds, debug=args.debug,
+                       delay_in_seconds=args.detection_interval, fast_sampling=args.fast_sampling,
+                       normalize_brightness=args.normalize_brightness, confirm_frames=args.confirm_frames,
+                       confirm_seconds=args.confirm_seconds, hysteresis=args.hysteresis,
+                       history_max_rows=args.history_max_rows, history_max_age=args.history_max_age,
+                       history_interval=args.history_interval, state_log=args.state_log,
+                       state_log_max_files=args.state_log_max_files,
+                       preview_width=args.stream_width) as detector:
+        mqtt_config = create_mqtt_config(args.broker_host, args.broker_port, args.batch_changes, args.batch_window,
+                                         args.spool_dir, args.spool_max_mb, args.encoding,
+                                         {board.id: [led.id for led in board.led]})
+        video_config = {"video_config": args.stream_url, "publish_stream": args.visualizer,
+                        "width": args.stream_width, "max_fps": args.stream_fps, "on_demand": not args.stream_always,
+                        "quality": args.stream_quality}
+        if args.publisher_process:
+            # the frames are handed over in shared memory and the changes through a pipe
+            publisher = PublisherProcess(mqtt_config, video_config, args.snapshot_interval)
+            detector.state_queue = publisher.state_queue
+            detector.frame_slot = publisher.frame_slot
+        else:
+            publisher = MasterPublisher(detector.state_queue, detector.frame_slot)
+            publisher.init_video(**video_config)
+            if args.snapshot_interval > 0:
+                publisher.init_snapshots({board.id: detector.state_store.snapshot}, args.snapshot_interval)
+            start_publisher(publisher, mqtt_config)
 
 
 
@@ -57,12 +79,20 @@ def main(args):
             return
 
 
-def start_publisher(publisher: MasterPublisher, broker_host, broker_port):
-    publisher.init_mqqt({"broker_address": broker_host, "broker_port": broker_port,
-                         "topics": {"changes": "changes", "avail": "avail", "config": "config"}})
+def create_mqtt_config(broker_host, broker_port, batch_changes=False, batch_window=0.0, spool_dir=None, spool_max_mb=64,
+                       encoding="json", led_ids=None):
+    return {"broker_address": broker_host, "broker_port": broker_port,
+            "topics": {"changes": "changes", "avail": "avail", "config": "config", "schema": "schema",
+                       "snapshot": "snapshot"},
+            "batch_changes": batch_changes, "batch_window": batch_window,
+            "spool_dir": spool_dir, "spool_max_bytes": int(spool_max_mb * 1024 * 1024),
+            "encoding": encoding, "led_ids": led_ids}
+
 
+def start_publisher(publisher: MasterPublisher, mqtt_config):
+    publisher.init_mqqt(mqtt_config)
 
-    threading.Thread(target=publisher.start_publish_heartbeats).start()
+    # a single asyncio loop publishes the changes and handles the MQTT connection
     threading.Thread(target=publisher.run).start()
 
 
@@ -76,9 +106,31 @@ def parse_arguments():
     parser.add('-w', '--webcam_id', required=True, help='ID of the usb webcam')
     parser.add('-bh', '--broker_host', type=str, default='localhost', help='Broker host for MQTT')
     parser.add('-bp', '--broker_port', type=int, default=1883, help='Broker port for MQTT')
+    parser.add('-bc', '--batch_changes', action='store_true',
+               help='Publish the changes of a frame as one message per board instead of one message per LED')
+    parser.add('-bw', '--batch_window', type=float, default=0.0,
+               help='The seconds the changes of multiple frames are collected for with --batch_changes')
+    parser.add('-en', '--encoding', type=str, default='json', choices=['json', 'compact'],
+               help='The encoding of the changes, compact publishes a binary message per board')
+    parser.add('-si', '--snapshot_interval', type=float, default=0.0,
+               help='The minimum seconds between two retained snapshots of the board, 0 disables the snapshots')
+    parser.add('-pp', '--publisher_process', action='store_true',
+               help='Run the publisher and the visualizer stream in a separate process')
+    parser.add('-sd', '--spool_dir', type=str, default=None,
+               help='Directory where changes are stored while the broker is not reachable')
+    parser.add('-sm', '--spool_max_mb', type=float, default=64,
+               help='The maximum size of the spool in MB, the oldest changes are dropped beyond')
 
     parser.add('-d', '--debug', action='store_true', help='Enable debug mode')
     parser.add('-v', '--visualizer', action='store_true', help='activate visualizer mode')
+    parser.add('-vu', '--stream_url', type=str, default='rtmp://localhost:8080',
+               help='The url of the visualizer stream, an http url serves a MJPEG stream without ffmpeg')
+    parser.add('-vq', '--stream_quality', type=int, default=80, help='The JPEG quality of a MJPEG visualizer stream')
+    parser.add('-vw', '--stream_width', type=int, default=1280,
+               help='The width of the visualizer stream, larger frames are downscaled')
+    parser.add('-vf', '--stream_fps', type=float, default=10, help='The maximum frame rate of the visualizer stream')
+    parser.add('-va', '--stream_always', action='store_true',
+               help='Encode the visualizer stream even if no client is connected')
     parser.add('-l', '--log_to_console', action='store_true',
                help='Enable logging to console. Only necessary if log_file is set otherwise logging will be printed in the console by default')
     parser.add('-ll', '--log_level', type=str, help='Enable logging',
@@ -86,6 +138,28 @@ def parse_arguments():
     parser.add('-lf', '--log_file', type=str, help='Enable logging to file', default=None)
     parser.add('-s', '--validity_seconds', type=int, default=300,
                help='The seconds until the homography matrix is calculated anew')
+    parser.add('-di', '--detection_interval', type=float, default=0.05,
+               help='The seconds between two runs of the full detection')
+    parser.add('-fs', '--fast_sampling', action='store_true',
+               help='Sample the brightness of the LEDs from every frame in between two full detections')
+    parser.add('-nb', '--normalize_brightness', action='store_true',
+               help='Compensate lighting changes by rescaling the LED brightness instead of restarting the detection')
+    parser.add('-cf', '--confirm_frames', type=int, default=1,
+               help='The number of consecutive frames a state change has to be detected in before it is reported')
+    parser.add('-cs', '--confirm_seconds', type=float, default=None,
+               help='The seconds after which a detected state change is reported regardless of confirm_frames')
+    parser.add('-hy', '--hysteresis', type=int, default=0,
+               help='The additional brightness deviation required to detect a LED that is on as off')
+    parser.add('-hr', '--history_max_rows', type=int, default=4096,
+               help='The number of state changes kept in memory per LED')
+    parser.add('-ha', '--history_max_age', type=float, default=None,
+               help='The seconds after which state changes are removed from memory')
+    parser.add('-hi', '--history_interval', type=float, default=None,
+               help='The seconds of the intervals removed state changes are compacted into')
+    parser.add('-sl', '--state_log', type=str, default=None,
+               help='Directory of a binary log all state changes are written to. The history is restored from it on start')
+    parser.add('-sf', '--state_log_max_files', type=int, default=64,
+               help='The number of files of 16 MiB the state log keeps, the oldest files are removed')
 
     return parser.parse_args()
 
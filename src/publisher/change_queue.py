@@ -0,0 +1,51 @@
+import asyncio
+import queue
+
+
+class ChangeQueue(queue.Queue):
+    """
+    Lossless FIFO of the changes that can be awaited from an asyncio loop.
+    Producers put from any thread as with queue.Queue. Once a loop is bound, every put wakes it up, so the consumer
+    neither blocks a thread nor polls.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self._loop = None  # type: asyncio.AbstractEventLoop or None
+        self._available = None  # type: asyncio.Event or None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Binds the queue to the loop of the consumer, which is woken up on every put.
+
+        :param loop: the running asyncio loop.
+        :return: None.
+        """
+        self._available = asyncio.Event()
+        self._loop = loop
+
+    def put(self, item, block=True, timeout=None) -> None:
+        super().put(item, block, timeout)
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._available.set)
+            except RuntimeError:
+                # the loop has been closed, there is no consumer anymore
+                self._loop = None
+
+    async def get_async(self):
+        """
+        Takes the next item, waiting for one if the queue is empty. Has to be awaited in the bound loop.
+        Cancelling the wait never loses an item.
+
+        :return: the item.
+        """
+        while True:
+            try:
+                return self.get_nowait()
+            except queue.Empty:
+                self._available.clear()
+            # an item put between get_nowait and clear would not wake us up otherwise
+            if self.qsize() == 0:
+                await self._available.wait()
@@ -2,13 +2,19 @@ import logging
 
 
 class BoardChanges:
-    def __init__(self, board, id, value, color, frequency, time):
+    def __init__(self, board, id, value, color, frequency, time, duty_cycle=None, confidence=None):
+        """
+        :param duty_cycle: the estimated fraction of the time the LED is on while blinking or None if unknown
+        :param confidence: the confidence in [0, 1] of the estimated frequency or None if it is not estimated
+        """
         self.id = id
         self.time = time
         self.board = board
         self.value = value
         self.color = color
         self.frequency = frequency
+        self.duty_cycle = duty_cycle
+        self.confidence = confidence
 
     def log(self):
         logging.info("Time: %s Led %s on board %s new state: %s with color %s and frequency %s", str(self.time), str(self.id), self.board, self.value, self.color, str(self.frequency))
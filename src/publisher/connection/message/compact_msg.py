@@ -0,0 +1,139 @@
+import math
+import struct
+
+# schema version, number of changes, time of the earliest change
+HEADER = struct.Struct("<HHd")
+# index of the led, state, index of the color, time relative to the header, frequency, duty cycle, confidence
+CHANGE = struct.Struct("<HBBffff")
+STATES = ["off", "on"]
+COLORS = ["", "red", "yellow", "green", "blue", "cyan", "purple"]
+
+
+class CompactEncoder:
+    """
+    Encodes the changes of a board into a fixed binary layout instead of JSON.
+    A message is a HEADER followed by one CHANGE per led, all little-endian. The led ids and colors are replaced by their
+    index in the tables of the schema of the board. Unknown leds and colors are appended to the tables, which increments
+    the version of the schema. Indices are never reused, so the latest schema decodes all previous messages of a run.
+    """
+
+    def __init__(self, led_ids: dict = None):
+        """
+        :param led_ids: the ids of the leds by the board id. Registering them up front keeps the indices stable across
+            restarts.
+        """
+        self._tables = {}
+        self._indices = {}
+        self.versions = {}
+        for board, ids in (led_ids or {}).items():
+            self.register(board, ids)
+
+    def register(self, board: str, led_ids: list) -> None:
+        """
+        Adds the leds of a board to its schema.
+
+        :param board: the id of the board.
+        :param led_ids: the ids of the leds in the order of their indices.
+        :return: None.
+        """
+        size = self._size(board)
+        for led_id in led_ids:
+            self._index(board, "leds", led_id)
+        if self._size(board) != size:
+            self.versions[board] += 1
+
+    def boards(self) -> list:
+        """
+        :return: the ids of the boards with a schema.
+        """
+        return list(self.versions.keys())
+
+    def schema(self, board: str) -> dict:
+        """
+        :param board: the id of the board.
+        :return: the schema of the board, which is published as JSON for the consumers.
+        """
+        return {"version": self.versions[board], "header": HEADER.format, "change": CHANGE.format,
+                "fields": ["led", "state", "color", "time", "frequency", "duty_cycle", "confidence"], "states": STATES,
+                "colors": list(self._tables[board]["colors"]), "leds": list(self._tables[board]["leds"])}
+
+    def encode(self, board: str, changes: list):
+        """
+        :param board: the id of the board.
+        :param changes: the BoardChanges of the board.
+        :return: a tuple of the payload and True if the schema of the board has changed and has to be published
+            before the payload.
+        """
+        size = self._size(board)
+        base = min(change.time for change in changes)
+        payload = bytearray(HEADER.size + CHANGE.size * len(changes))
+        offset = HEADER.size
+        for change in changes:
+            color = change.color if isinstance(change.color, str) else ""
+            CHANGE.pack_into(payload, offset, self._index(board, "leds", change.id), STATES.index(change.value),
+                             self._index(board, "colors", color), change.time - base, _float(change.frequency),
+                             _float(change.duty_cycle), _float(change.confidence))
+            offset += CHANGE.size
+        changed = self._size(board) != size
+        if changed:
+            self.versions[board] += 1
+        HEADER.pack_into(payload, 0, self.versions[board], len(changes), base)
+        return bytes(payload), changed
+
+    def _size(self, board: str) -> int:
+        """
+        :return: the number of entries of the tables of the board or -1 if the board is unknown.
+        """
+        if board not in self._tables:
+            return -1
+        return len(self._tables[board]["leds"]) + len(self._tables[board]["colors"])
+
+    def _index(self, board: str, table: str, value: str) -> int:
+        """
+        :param table: "leds" or "colors".
+        :return: the index of the value in the table of the board, appending it if it is unknown.
+        """
+        if board not in self.versions:
+            self.versions[board] = 0
+            self._tables[board] = {"leds": [], "colors": list(COLORS)}
+            self._indices[board] = {"leds": {}, "colors": {color: i for i, color in enumerate(COLORS)}}
+        indices = self._indices[board][table]
+        index = indices.get(value)
+        if index is None:
+            index = len(indices)
+            indices[value] = index
+            self._tables[board][table].append(value)
+        return index
+
+
+def decode(payload: bytes, schema: dict) -> list:
+    """
+    Decodes a compact message with the schema of its board.
+
+    :param payload: the payload of the message.
+    :param schema: the schema as published by the CompactEncoder.
+    :return: the changes as dicts with id, value, color, frequency, time, duty_cycle and confidence as in the JSON
+        messages. Unknown values are NaN.
+    """
+    header, change = struct.Struct(schema["header"]), struct.Struct(schema["change"])
+    version, count, base = header.unpack_from(payload)
+    if version > schema["version"]:
+        raise ValueError("Message has schema version {}, but got version {}".format(version, schema["version"]))
+    changes = []
+    for i in range(count):
+        fields = dict(zip(schema["fields"], change.unpack_from(payload, header.size + i * change.size)))
+        decoded = {"id": schema["leds"][fields["led"]], "value": schema["states"][fields["state"]],
+                   "color": schema["colors"][fields["color"]], "frequency": fields["frequency"],
+                   "time": base + fields["time"]}
+        for name in ("duty_cycle", "confidence"):
+            if name in fields:
+                decoded[name] = fields[name]
+        changes.append(decoded)
+    return changes
+
+
+def _float(value) -> float:
+    """
+    :return: the value or NaN if it is None.
+    """
+    return value if value is not None else math.nan
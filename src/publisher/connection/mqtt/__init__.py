@@ -1,2 +1,3 @@
 from .mqtt_connector import MQTTConnector
 from .mqtt_connector import publish_heartbeat as publish_heartbeat_routine
+from .mqtt_connector import drain_spool as drain_spool_routine
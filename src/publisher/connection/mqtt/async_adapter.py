@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+import paho.mqtt.client as mqtt
+
+
+class AsyncioAdapter:
+    """
+    Drives the network loop of a paho client from an asyncio loop instead of a separate thread.
+    The socket of the client is watched with add_reader and, while there is data that has not been written,
+    add_writer. Keep alive and reconnecting are handled by a task calling loop_misc. All methods of the client have to be
+    called from the thread of the asyncio loop.
+    """
+
+    def __init__(self, client, loop: asyncio.AbstractEventLoop, reconnect_seconds: float = 5.0):
+        """
+        :param client: the MQTTConnector, its socket callbacks are replaced.
+        :param loop: the running asyncio loop.
+        :param reconnect_seconds: the interval in which a lost connection is re-established.
+        """
+        self.client = client
+        self.loop = loop
+        self.reconnect_seconds = reconnect_seconds
+        self.closed = False
+        self._flushed = asyncio.Event()
+        self._flushed.set()
+        self._misc_task = None  # type: asyncio.Task or None
+
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        self._flushed.set()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+        self._flushed.clear()
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+        self._flushed.set()
+
+    def connect(self) -> bool:
+        """
+        Connects the client with its own connect method and starts the task for keep alive and reconnecting.
+        A broker that is not reachable is retried by the task.
+
+        :return: True if the socket has been opened.
+        """
+        if self._misc_task is None:
+            self._misc_task = self.loop.create_task(self.misc_loop())
+        try:
+            self.client.connect()
+            return True
+        except OSError as e:
+            logging.warning("Could not connect to broker: %s", e)
+            return False
+
+    async def misc_loop(self):
+        """
+        Sends the keep alive of the client every second and reconnects if the connection has been lost.
+        """
+        since_reconnect = 0.0
+        while not self.closed:
+            await asyncio.sleep(1)
+            if self.closed:
+                break
+            if self.client.loop_misc() != mqtt.MQTT_ERR_NO_CONN:
+                continue
+            since_reconnect += 1
+            if since_reconnect < self.reconnect_seconds:
+                continue
+            since_reconnect = 0.0
+            try:
+                self.client.reconnect()
+            except (OSError, ValueError) as e:
+                logging.debug("Reconnecting to broker failed: %s", e)
+
+    async def wait_flushed(self) -> None:
+        """
+        Waits until all queued data has been written to the socket or the socket has been closed. Awaited by producers
+        to apply backpressure instead of queuing in memory.
+
+        :return: None.
+        """
+        await self._flushed.wait()
+
+    def close(self) -> None:
+        """
+        Stops reconnecting. The client has to be disconnected separately.
+
+        :return: None.
+        """
+        self.closed = True
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
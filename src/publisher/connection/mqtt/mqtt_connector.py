@@ -1,10 +1,16 @@
 
 import logging
 import asyncio
+import collections
 import json
+import math
+import threading
 
 import paho.mqtt.client as mqtt
 
+from .spool import MessageSpool
+from ..message.compact_msg import CompactEncoder
+
 
 
 host = "89.58.3.45"
@@ -36,6 +42,10 @@ config = {"broker_address":"89.58.3.45", "broker_port":1883, "topics": {"changes
                         id: "LED-1",
                         value: "on",
                         color: "red",
+                        frequency: 2.0,
+                        time: 1546300800.0,
+                        duty_cycle: 0.5,
+                        confidence: 0.9,
                     }
                 ]
         ]
@@ -62,7 +72,16 @@ class MQTTConnector(mqtt.Client):
         "topics": {
             "changes": "changes", #  publishes changes of board led to this topic
             "avail": "avail", # publish an heartbeat to this topic to indicate that the provider is online
-            "config": "config" # receive configuration from user (e.g. Board Type)
+            "config": "config", # receive configuration from user (e.g. Board Type)
+            "schema": "schema", # optional, publishes the retained schema of the compact encoding of each board
+            "snapshot": "snapshot" # optional, publishes the retained state of all leds of each board
+        },
+        "encoding": "json", # optional, "compact" publishes the changes of a board as binary message, see compact_msg
+        "led_ids": {"raspberrypi": ["LED-1"]}, # optional, the leds of each board for the indices of the compact encoding
+        "spool_dir": "spool", # optional, changes that can not be published are stored there until reconnected and
+                              # all changes are published with QoS 1
+        "spool_max_bytes": 67108864, # optional, the maximum size of the spool
+        "spool_rate": 50 # optional, the number of stored changes sent per second after reconnecting
     }
     """
 
@@ -79,7 +98,29 @@ class MQTTConnector(mqtt.Client):
         self._topics = config["topics"]
         self._is_connected = False
         self.closed = False
+        self.spool = None  # type: MessageSpool or None
+        if config.get("spool_dir") is not None:
+            self.spool = MessageSpool(config["spool_dir"], config.get("spool_max_bytes", 64 * 1024 * 1024))
+        self.spool_rate = config.get("spool_rate", 50)
+        self._spool_lock = threading.Lock()
+        # message ids of the stored changes that have been sent, in the order of the spool, and whether they are acked
+        self._spool_in_flight = collections.OrderedDict()
+        # message ids acknowledged by the broker, paho calls on_publish while holding its own locks
+        self._acked = collections.deque()
+        self.encoder = None  # type: CompactEncoder or None
+        if config.get("encoding", "json") == "compact":
+            self.encoder = CompactEncoder(config.get("led_ids"))
         self.init_connect_callback()
+        self.on_disconnect = self.disconnect_callback
+        if self.spool is not None:
+            self.on_publish = self.publish_callback
+
+    def is_connected(self):
+        """
+        :return: True if the connection has been acknowledged and has not been lost since. paho itself only notices a
+            lost connection when it reconnects.
+        """
+        return self._is_connected and super().is_connected()
 
     def connect(self):
         """
@@ -97,9 +138,165 @@ class MQTTConnector(mqtt.Client):
         :return:
         """
         logging.info("Publish changes")
+        if self.encoder is not None:
+            self.publish_board_changes([changes])
+            return
         topic = self._topics["changes"]
         topic = topic + "/" + changes.board + "/" + changes.id + '/' + changes.value + "/" + changes.color
-        self.publish(topic, payload=json.dumps({"time": changes.time, "frequency": changes.frequency}))
+        self._publish_or_spool(topic, json.dumps({"time": changes.time, "frequency": changes.frequency,
+                                                  "duty_cycle": changes.duty_cycle, "confidence": changes.confidence}),
+                               changes.time)
+
+    def publish_board_changes(self, changes):
+        """
+        publish the given changes as one message per board to the topic changes/<board>, with the payload described
+        at the top of this module
+        :param changes: a list of BoardChanges
+        :return:
+        """
+        logging.info("Publish %d changes", len(changes))
+        if self.encoder is not None:
+            self.publish_compact_changes(changes)
+            return
+        for board, payload in board_changes_payloads(changes).items():
+            self._publish_or_spool(self._topics["changes"] + "/" + board, json.dumps(payload),
+                                   payload["boards"][0]["time"])
+
+    def publish_compact_changes(self, changes):
+        """
+        publish the given changes as one binary message per board to the topic changes/<board>. If the schema of a
+        board changes, it is published before.
+        :param changes: a list of BoardChanges
+        :return:
+        """
+        boards = {}
+        for change in changes:
+            boards.setdefault(change.board, []).append(change)
+        for board, board_changes in boards.items():
+            payload, schema_changed = self.encoder.encode(board, board_changes)
+            if schema_changed:
+                self.publish_schema(board)
+            self._publish_or_spool(self._topics["changes"] + "/" + board, payload,
+                                   max(change.time for change in board_changes))
+
+    def publish_schema(self, board):
+        """
+        publish the schema of the compact encoding of a board as retained message to the topic schema/<board>
+        :param board: the id of the board
+        :return:
+        """
+        topic = self._topics.get("schema", "schema") + "/" + board
+        self.publish(topic, payload=json.dumps(self.encoder.schema(board)), qos=1, retain=True)
+
+    def publish_snapshot(self, board, snapshot):
+        """
+        publish the state of all leds of a board as retained message to the topic snapshot/<board>, so a new
+        subscriber knows the state of the board without waiting for changes. The payload is
+        {"id": board, "leds": [{"id": ..., "value": ..., "color": ..., "frequency": ..., "time": ...}, ...]}
+        :param board: the id of the board
+        :param snapshot: the last entry of every led by its id, as returned by StateStore.snapshot
+        :return:
+        """
+        topic = self._topics.get("snapshot", "snapshot") + "/" + board
+        self.publish(topic, payload=json.dumps(snapshot_payload(board, snapshot)), qos=1, retain=True)
+
+    def _publish_or_spool(self, topic, payload, timestamp):
+        """
+        publishes a change or stores it in the spool if the broker is not reachable. As long as stored changes are
+        waiting, new changes are stored as well to keep their order. With a spool, changes are published with QoS 1,
+        so paho keeps a change until it is acknowledged and sends it again after a lost connection.
+        :param topic:
+        :param payload:
+        :param timestamp: the time the change has been captured
+        :return:
+        """
+        if self.spool is None:
+            self.publish(topic, payload=payload)
+            return
+        with self._spool_lock:
+            self._commit_acked()
+            if not self.is_connected() or self.spool.depth > 0:
+                self._spool_append(topic, payload, timestamp)
+                return
+            info = self.publish(topic, payload=payload, qos=1)
+            if info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+                # any other error leaves the message queued in paho
+                self._spool_append(topic, payload, timestamp)
+
+    def _spool_append(self, topic, payload, timestamp):
+        """
+        stores a change in the spool. If the spool drops the stored changes that are in flight to stay bounded, their
+        acknowledgements must not remove the following changes, so they are forgotten. Must be called holding the spool
+        lock.
+        """
+        if self.spool.append(topic, payload, timestamp):
+            self._spool_in_flight.clear()
+
+    def drain_spool(self, max_messages):
+        """
+        publishes stored changes in the order they have been captured. They are removed from the spool once the broker
+        has acknowledged them, see publish_callback, so changes that are lost with the connection are sent again.
+        :param max_messages: the maximum number of changes to publish
+        :return: the number of published changes
+        """
+        if self.spool is None or not self.is_connected():
+            return 0
+        with self._spool_lock:
+            self._commit_acked()
+            sent = 0
+            in_flight = len(self._spool_in_flight)
+            for timestamp, topic, payload in self.spool.peek(in_flight + max_messages)[in_flight:]:
+                info = self.publish(topic, payload=payload, qos=1)
+                if info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+                    break
+                self._spool_in_flight[info.mid] = False
+                sent += 1
+        if sent > 0:
+            logging.info("Published %d stored changes, %d remaining", sent, self.spool.depth)
+        return sent
+
+    def publish_callback(self, client, userdata, mid):
+        """
+        notes that the broker acknowledged a message, the spool is updated with the next drain
+        """
+        self._acked.append(mid)
+
+    def _commit_acked(self):
+        """
+        removes the stored changes from the spool, whose sending has been acknowledged by the broker, as long as all
+        changes stored before are acknowledged as well. Must be called holding the spool lock.
+        """
+        while len(self._acked) > 0:
+            mid = self._acked.popleft()
+            if mid in self._spool_in_flight:
+                self._spool_in_flight[mid] = True
+        acked = 0
+        while len(self._spool_in_flight) > 0 and next(iter(self._spool_in_flight.values())):
+            self._spool_in_flight.popitem(last=False)
+            acked += 1
+        if acked > 0:
+            self.spool.commit(acked)
+
+    def disconnect_callback(self, client, userdata, rc):
+        """
+        notes the lost connection, so new changes are stored in the spool instead of being queued in memory
+        """
+        self._is_connected = False
+        if rc != 0:
+            logging.warning("Lost connection to broker: %s", mqtt.error_string(rc))
+
+    def spool_metrics(self):
+        """
+        :return: the depth of the backlog, its size on disk, the number of dropped changes and the number of stored
+            changes that have been sent, but not acknowledged, or None without spool
+        """
+        if self.spool is None:
+            return None
+        with self._spool_lock:
+            self._commit_acked()
+            metrics = self.spool.metrics()
+            metrics["in_flight"] = len(self._spool_in_flight)
+        return metrics
 
     def publish_heartbeat(self):
         """
@@ -113,6 +310,9 @@ class MQTTConnector(mqtt.Client):
         def connect_callback(client, userdata, flags, rc):
             if rc == 0:
                 self.subscribe(self._topics["config"])
+                if self.encoder is not None:
+                    for board in self.encoder.boards():
+                        self.publish_schema(board)
                 logging.info("Connected to broker.")
                 self._is_connected = True
             else:
@@ -133,6 +333,45 @@ class MQTTConnector(mqtt.Client):
         self.publish(self._topics["avail"], payload="offline")
         self.loop_stop()
         super().disconnect()
+        if self.spool is not None:
+            with self._spool_lock:
+                self.spool.close()
+
+
+def board_changes_payloads(changes):
+    """
+    groups the changes by board
+    :param changes: a list of BoardChanges
+    :return: a dict with the payload of each board by the board id
+    """
+    payloads = {}
+    for change in changes:
+        payload = payloads.get(change.board)
+        if payload is None:
+            payload = {"boards": [{"id": change.board, "time": change.time, "changes": []}]}
+            payloads[change.board] = payload
+        board = payload["boards"][0]
+        board["time"] = max(board["time"], change.time)
+        board["changes"].append({"id": change.id, "value": change.value, "color": change.color,
+                                 "frequency": change.frequency, "time": change.time, "duty_cycle": change.duty_cycle,
+                                 "confidence": change.confidence})
+    return payloads
+
+
+def snapshot_payload(board, snapshot):
+    """
+    :param board: the id of the board
+    :param snapshot: the last entry of every led by its id
+    :return: the payload of the snapshot of the board, unknown frequencies are null
+    """
+    leds = []
+    for led_id, entry in snapshot.items():
+        frequency = entry["frequency"]
+        leds.append({"id": led_id, "value": entry["state"],
+                     "color": entry["color"] if isinstance(entry["color"], str) else "",
+                     "frequency": None if frequency is None or math.isnan(frequency) else float(frequency),
+                     "time": float(entry["time"])})
+    return {"id": board, "leds": leds}
 
 
 async def publish_heartbeat(mqtt_connector: MQTTConnector):
@@ -147,6 +386,14 @@ async def publish_heartbeat(mqtt_connector: MQTTConnector):
             mqtt_connector.publish_heartbeat()
 
 
+async def drain_spool(mqtt_connector: MQTTConnector):
+    """publishes the stored changes with at most spool_rate changes per second"""
+    while not mqtt_connector.closed:
+        await asyncio.sleep(1)
+        mqtt_connector.drain_spool(mqtt_connector.spool_rate)
+        logging.debug("Spool: %s", mqtt_connector.spool_metrics())
+
+
 if __name__ == "__main__":
     config = {"broker_address": "89.58.3.45", "broker_port": 1883,
               "topics": {"changes": "changes", "avail": "avail", "config": "config"}}
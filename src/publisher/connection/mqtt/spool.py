@@ -0,0 +1,250 @@
+import glob
+import logging
+import os
+import struct
+
+# capture time, length of the topic, length of the payload
+HEADER = struct.Struct("<dII")
+SEGMENT_PATTERN = "spool_{:06d}.seg"
+
+
+class MessageSpool:
+    """
+    Disk-backed FIFO of MQTT messages that could not be published.
+    Messages are appended to segment files together with the time they have been captured. The position of the next
+    message to send is stored in a cursor file, so the backlog survives a restart. Segments that have been sent
+    completely are removed, and if the spool exceeds max_bytes the oldest segment is dropped, so the disk usage is
+    bounded. Only the segment that is read is loaded into memory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024, segment_size: int = 1024 * 1024):
+        """
+        :param directory: the directory of the segment files. It is created if necessary.
+        :param max_bytes: the maximum size of all segments, older messages are dropped.
+        :param segment_size: the size in bytes after which a new segment is started.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._counts = {}
+        self._sizes = {}
+        complete = True
+        for path in sorted(glob.glob(os.path.join(directory, "spool_*.seg"))):
+            segment = int(os.path.basename(path)[len("spool_"):-len(".seg")])
+            self._sizes[segment], self._counts[segment], valid_size = self._scan(path)
+            complete = self._sizes[segment] == valid_size
+
+        self._cursor_segment, self._cursor_offset, self._cursor_messages = self._load_cursor()
+        self._writer = None
+        self._writer_segment = max(self._counts.keys(), default=0)
+        if not complete:
+            # do not append to a partially written message of an interrupted run
+            self._writer_segment += 1
+
+    @property
+    def depth(self) -> int:
+        """
+        :return: the number of messages that have not been sent yet.
+        """
+        return sum(self._counts.values()) - self._cursor_messages
+
+    @property
+    def size(self) -> int:
+        """
+        :return: the size in bytes of all segments.
+        """
+        return sum(self._sizes.values())
+
+    def metrics(self) -> dict:
+        """
+        :return: the depth of the backlog, its size on disk and the number of dropped messages.
+        """
+        return {"depth": self.depth, "bytes": self.size, "dropped": self.dropped}
+
+    def append(self, topic: str, payload, timestamp: float) -> None:
+        """
+        Appends a message to the spool.
+
+        :param topic: the topic of the message.
+        :param payload: the payload as str or bytes.
+        :param timestamp: the time the message has been captured.
+        :return: True if the next messages to send have been dropped to bound the spool, so messages returned by peek
+            before are not the next ones anymore.
+        """
+        topic_bytes = topic.encode()
+        payload_bytes = payload.encode() if isinstance(payload, str) else bytes(payload)
+        record = HEADER.pack(timestamp, len(topic_bytes), len(payload_bytes)) + topic_bytes + payload_bytes
+
+        writer = self._writable_segment(len(record))
+        writer.write(record)
+        writer.flush()
+        self._sizes[self._writer_segment] = self._sizes.get(self._writer_segment, 0) + len(record)
+        self._counts[self._writer_segment] = self._counts.get(self._writer_segment, 0) + 1
+
+        cursor_dropped = False
+        while self.size > self.max_bytes and len(self._counts) > 1:
+            cursor_dropped = self._drop_oldest_segment() or cursor_dropped
+        return cursor_dropped
+
+    def peek(self, count: int) -> list:
+        """
+        Returns the next messages without removing them.
+
+        :param count: the maximum number of messages.
+        :return: a list of tuples of capture time, topic and payload in the order they have been appended.
+        """
+        messages = []
+        segment, offset = self._cursor_segment, self._cursor_offset
+        for current in sorted(self._counts.keys()):
+            if current < segment:
+                continue
+            available = self._counts[current]
+            if current > segment:
+                offset = 0
+            else:
+                available -= self._cursor_messages
+            if self._writer is not None and current == self._writer_segment:
+                self._writer.flush()
+            with open(self._path(current), "rb") as file:
+                file.seek(offset)
+                data = file.read()
+            position = 0
+            # a partially written message at the end of the segment is not counted
+            for _ in range(min(available, count - len(messages))):
+                timestamp, topic_length, payload_length = HEADER.unpack_from(data, position)
+                position += HEADER.size
+                topic = data[position:position + topic_length].decode()
+                position += topic_length
+                messages.append((timestamp, topic, data[position:position + payload_length]))
+                position += payload_length
+            if len(messages) >= count:
+                break
+        return messages
+
+    def commit(self, count: int) -> None:
+        """
+        Removes the next messages after they have been sent.
+
+        :param count: the number of messages, as returned by peek.
+        :return: None.
+        """
+        for _ in range(count):
+            if self.depth == 0:
+                break
+            self._skip_sent_segments()
+            with open(self._path(self._cursor_segment), "rb") as file:
+                file.seek(self._cursor_offset)
+                _, topic_length, payload_length = HEADER.unpack(file.read(HEADER.size))
+            self._cursor_offset += HEADER.size + topic_length + payload_length
+            self._cursor_messages += 1
+        self._skip_sent_segments()
+        self._store_cursor()
+
+    def _skip_sent_segments(self) -> None:
+        """
+        Moves the cursor to the first segment with messages that have not been sent, removing the sent segments.
+
+        :return: None.
+        """
+        while True:
+            segment = self._cursor_segment
+            if segment not in self._counts:
+                following = [s for s in self._counts.keys() if s > segment]
+                next_segment = min(following) if len(following) > 0 else max(segment + 1, self._writer_segment)
+                self._cursor_segment, self._cursor_offset, self._cursor_messages = next_segment, 0, 0
+                if len(following) == 0:
+                    return
+            elif self._cursor_messages >= self._counts[segment] and segment != self._writer_segment:
+                self._remove_segment(segment)
+            else:
+                return
+
+    def close(self) -> None:
+        """
+        Closes the segment that is written.
+
+        :return: None.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _writable_segment(self, record_size: int):
+        size = self._sizes.get(self._writer_segment, 0)
+        if self._writer is None or size + record_size > self.segment_size:
+            self.close()
+            if size > 0 and size + record_size > self.segment_size:
+                self._writer_segment += 1
+            self._writer = open(self._path(self._writer_segment), "ab")
+        return self._writer
+
+    def _drop_oldest_segment(self) -> bool:
+        """
+        Drops the oldest segment including its messages that have not been sent.
+
+        :return: True if the cursor has been in the dropped segment.
+        """
+        first = min(self._counts.keys())
+        dropped = self._counts[first] - (self._cursor_messages if self._cursor_segment == first else 0)
+        self.dropped += dropped
+        logging.warning("MQTT spool is full, dropped %d messages", dropped)
+        self._remove_segment(first)
+        if self._cursor_segment <= first:
+            self._cursor_segment, self._cursor_offset, self._cursor_messages = first + 1, 0, 0
+            self._store_cursor()
+            return True
+        return False
+
+    def _remove_segment(self, segment: int) -> None:
+        self._counts.pop(segment, None)
+        self._sizes.pop(segment, None)
+        try:
+            os.remove(self._path(segment))
+        except OSError as e:
+            logging.debug("Could not remove spool segment: %s", e)
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, SEGMENT_PATTERN.format(segment))
+
+    def _load_cursor(self):
+        """
+        :return: the segment, offset and number of messages sent of this segment, at which the next message starts.
+        """
+        try:
+            with open(os.path.join(self.directory, "cursor"), "r") as file:
+                segment, offset, messages = (int(value) for value in file.read().split())
+        except (OSError, ValueError):
+            return min(self._counts.keys(), default=0), 0, 0
+        if segment not in self._counts:
+            return min(self._counts.keys(), default=0), 0, 0
+        return segment, offset, messages
+
+    def _store_cursor(self) -> None:
+        path = os.path.join(self.directory, "cursor")
+        with open(path + ".tmp", "w") as file:
+            file.write("{} {} {}".format(self._cursor_segment, self._cursor_offset, self._cursor_messages))
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _scan(path: str):
+        """
+        Counts the complete messages of a segment by reading their headers only.
+
+        :param path: the path of the segment.
+        :return: the size of the segment, the number of messages and the size of the complete messages.
+        """
+        size = os.path.getsize(path)
+        count = 0
+        with open(path, "rb") as file:
+            position = 0
+            while position + HEADER.size <= size:
+                file.seek(position)
+                _, topic_length, payload_length = HEADER.unpack(file.read(HEADER.size))
+                if position + HEADER.size + topic_length + payload_length > size:
+                    break
+                position += HEADER.size + topic_length + payload_length
+                count += 1
+        return size, count, position
@@ -1 +1,2 @@
 from .rtmp_output_stream import VideoStream
+from .mjpeg_stream import MjpegStream
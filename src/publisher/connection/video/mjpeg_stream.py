@@ -0,0 +1,173 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import cv2
+import logging as log
+
+from .rtmp_output_stream import VideoStream
+from ...frame_slot import FrameSlot
+
+BOUNDARY = "frame"
+
+
+class MjpegStream(VideoStream):
+    """
+    MjpegStream class
+    for serving opencv frames as MJPEG multipart HTTP stream from a built-in server, without ffmpeg
+    The server is started with the writer thread. Frames are only encoded while at least one client is connected and
+    every encoded frame is shared by all clients, so the cost does not depend on the number of clients.
+    """
+
+    def __init__(self, url, publish_stream, logger: log.Logger = logging.root, width: int = None, max_fps: float = None,
+                 quality: int = 80, frame_slot: FrameSlot = None):
+        """
+        :param url: the url the server listens on, e.g. http://0.0.0.0:8081. Port 0 chooses a free port.
+        :param publish_stream: if False, frames are ignored and the server is not started.
+        :param logger:
+        :param width: the width of the stream, larger frames are downscaled keeping their aspect ratio. None keeps the
+            size of the frames.
+        :param max_fps: the maximum frame rate of the stream or None to encode every frame.
+        :param quality: the JPEG quality from 0 to 100.
+        :param frame_slot: the slot the writer thread takes the frames from. write puts the frames there.
+        """
+        super().__init__(url, publish_stream, logger, width, max_fps, True, frame_slot)
+        self.host = urlparse(url).hostname or ""
+        self.quality = quality
+        self.server = None  # type: ThreadingHTTPServer or None
+        self.clients = 0
+        self.frames_encoded = 0
+        self._condition = threading.Condition()
+        self._jpeg = None
+        self._sequence = 0
+
+    def start_writer(self):
+        """
+        Starts the server and the thread encoding the frames of the frame slot, if they are not running.
+        :return:
+        """
+        if self.publish_stream and self.server is None:
+            self.start_streaming()
+        super().start_writer()
+
+    def has_client(self) -> bool:
+        """
+        :return: True if at least one client is connected.
+        """
+        return self.clients > 0
+
+    def wants_frames(self) -> bool:
+        """
+        :return: True if a client is connected.
+        """
+        return self.publish_stream and not self.frame_slot.closed and self.has_client()
+
+    def write_frame(self, frame):
+        """
+        Scales and encodes the frame for all connected clients, does nothing if there is no client.
+        :param frame: is an opencv frame type: numpy.ndarray
+        :return:
+        """
+        if not self.has_client():
+            return
+        if self._size is None:
+            self._size = self.output_size(frame.shape[1], frame.shape[0])
+        if (frame.shape[1], frame.shape[0]) != self._size:
+            frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+        success, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not success:
+            self.logger.error("Could not encode frame")
+            return
+        with self._condition:
+            self._jpeg = jpeg.tobytes()
+            self._sequence += 1
+            self.frames_encoded += 1
+            self.frames_written += 1
+            self._condition.notify_all()
+
+    def next_jpeg(self, sequence, timeout=None):
+        """
+        Waits for a frame that is newer than the given one.
+        :param sequence: the sequence number of the last frame of the client, 0 for none.
+        :param timeout: the maximum time in seconds to wait.
+        :return: a tuple of the sequence number and the encoded frame, which is None if there is no new frame or the
+            server has been stopped.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence != sequence or self.server is None, timeout)
+            if self._sequence == sequence or self.server is None:
+                return sequence, None
+            return self._sequence, self._jpeg
+
+    def start_streaming(self, width=None, height=None, fps=None):
+        """
+        Starts the HTTP server, the size of the frames is not needed
+        :return:
+        """
+        stream = self
+
+        class Handler(MjpegRequestHandler):
+            pass
+
+        Handler.stream = stream
+        self.server = ThreadingHTTPServer((self.host, self.port or 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.logger.info("Start streaming to http://{}:{}".format(self.host, self.port))
+
+    def stop_process(self):
+        """
+        Stops the HTTP server and disconnects all clients
+        :return:
+        """
+        server = self.server
+        if server is not None:
+            with self._condition:
+                self.server = None
+                self._condition.notify_all()
+            server.shutdown()
+            server.server_close()
+            self.logger.info("Stopped streaming to http://{}:{}".format(self.host, self.port))
+
+
+class MjpegRequestHandler(BaseHTTPRequestHandler):
+    """
+    Sends the frames of the MjpegStream as multipart/x-mixed-replace response on GET /
+    """
+    stream = None  # type: MjpegStream
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/":
+            self.send_error(404)
+            return
+        # the client is counted before the response, so every frame put after the headers are received is encoded
+        stream = self.stream
+        with stream._condition:
+            stream.clients += 1
+        stream.frame_slot.active = stream.wants_frames()
+        sequence = 0
+        try:
+            self.send_response(200)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=" + BOUNDARY)
+            self.end_headers()
+            while stream.server is not None:
+                sequence, jpeg = stream.next_jpeg(sequence, timeout=1.0)
+                if jpeg is None:
+                    continue
+                self.wfile.write("--{}\r\nContent-Type: image/jpeg\r\nContent-Length: {}\r\n\r\n".format(
+                    BOUNDARY, len(jpeg)).encode())
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with stream._condition:
+                stream.clients -= 1
+            stream.frame_slot.active = stream.wants_frames()
+
+    def log_message(self, format, *args):
+        logging.debug("MJPEG %s: %s", self.address_string(), format % args)
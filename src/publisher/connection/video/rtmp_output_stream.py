@@ -1,61 +1,175 @@
 import logging
-import queue
-import sys
+import threading
+import time
+from urllib.parse import urlparse
 
 import ffmpeg
 import cv2
 import logging as log
 
+from ...frame_slot import FrameSlot
+
 video_format = "flv"
 server_url = "rtmp://localhost:8080"
 
+# state of a tcp connection in /proc/net/tcp
+TCP_ESTABLISHED = "01"
+
 
 class VideoStream:
     """
     VideoStream class
     for creating an rtmp stream out of opencv frames
+    The frames are scaled and written to ffmpeg by a writer thread, which takes the latest frame of a FrameSlot at most
+    max_fps times per second, so writing never blocks the caller. ffmpeg listens for a client itself and is started with
+    the first frame. It does not read any frame before a client has connected, so with on_demand, frames are only
+    scaled and written while a client is connected and the writer thread never blocks on the pipe without one. ffmpeg
+    exits if the client disconnects and is restarted with the next frame.
     """
 
-    def __init__(self, url, publish_stream, logger: log.Logger = logging.root):
-
+    def __init__(self, url, publish_stream, logger: log.Logger = logging.root, width: int = None, max_fps: float = None,
+                 on_demand: bool = True, frame_slot: FrameSlot = None):
+        """
+        :param url: the url ffmpeg listens on.
+        :param publish_stream: if False, frames are ignored.
+        :param logger:
+        :param width: the width of the stream, larger frames are downscaled keeping their aspect ratio. None keeps the
+            size of the frames.
+        :param max_fps: the maximum frame rate of the stream or None to write every frame.
+        :param on_demand: if True, frames are only written while a client is connected.
+        :param frame_slot: the slot the writer thread takes the frames from. write puts the frames there.
+        """
         self.url = url
         self.publish_stream = publish_stream
         self.process = None
         self.logger = logger
+        self.width = width
+        self.max_fps = max_fps
+        self.on_demand = on_demand
+        self.frame_slot = frame_slot if frame_slot is not None else FrameSlot()  # type: FrameSlot
+        self.port = urlparse(url).port
+        self.frames_written = 0
+        self._writer = None  # type: threading.Thread or None
+        self._size = None
 
     def write(self, frame):
         """
-        Writes the frame to the ffmpeg process.
-        !If the flag publish_stream is set, this method will return without doing anything!
+        Hands the frame to the writer thread without waiting, a frame that has not been written yet is replaced.
+        !If the flag publish_stream is not set, this method will return without doing anything!
         :param frame: is an opencv frame type: numpy.ndarray
         :return:
         """
-
         if not self.publish_stream:
             return
+        self.start_writer()
+        self.frame_slot.put(frame)
 
+    def start_writer(self):
+        """
+        Starts the thread writing the frames of the frame slot to ffmpeg, if it is not running.
+        :return:
+        """
+        if self._writer is None and self.publish_stream:
+            self._writer = threading.Thread(target=self.run_writer, daemon=True)
+            self._writer.start()
+
+    def run_writer(self):
+        """
+        Routine of the writer thread, runs until the frame slot is closed.
+        :return:
+        """
+        interval = 1 / self.max_fps if self.max_fps else 0.0
+        next_write = time.monotonic()
+        while not self.frame_slot.closed:
+            # the producer only renders frames while they are wanted
+            self.frame_slot.active = self.wants_frames()
+            delay = next_write - time.monotonic()
+            if delay > 0:
+                # frames put in the meantime replace each other, so the latest one is written afterwards
+                time.sleep(delay)
+            frame = self.frame_slot.get(timeout=1.0)
+            if frame is None:
+                continue
+            next_write = time.monotonic() + interval
+            self.write_frame(frame)
+
+    def write_frame(self, frame):
+        """
+        Scales the frame and writes it to the ffmpeg process, which is started if necessary. With on_demand, the frame
+        is dropped while no client is connected. Blocks while the pipe is full.
+        :param frame: is an opencv frame type: numpy.ndarray
+        :return:
+        """
+        if self._size is None:
+            self._size = self.output_size(frame.shape[1], frame.shape[0])
         if not self.process:
-            self.start_streaming(frame.shape[1], frame.shape[0])
+            self.start_streaming(self._size[0], self._size[1], self.max_fps or 30)
+        if self.on_demand and not self.has_client():
+            # ffmpeg waits for a client before reading, the write would block until one connects
+            return
+        if (frame.shape[1], frame.shape[0]) != self._size:
+            frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
         try:
             self.process.stdin.write(frame.tobytes())
-        except IOError as e:
-            self.logger.error("Error writing to ffmpeg process: {}".format(e))
-            self.stop_streaming()
-        except BrokenPipeError as e:
-            self.logger.error("Error writing to ffmpeg process: {}".format(e))
-            self.stop_streaming()
+            self.frames_written += 1
+        except (IOError, BrokenPipeError, ValueError) as e:
+            # ffmpeg exits after the client has disconnected
+            self.logger.info("ffmpeg process has stopped: {}".format(e))
+            self.stop_process()
+
+    def wants_frames(self) -> bool:
+        """
+        :return: True if frames are written to ffmpeg. With on_demand, ffmpeg is started with the first frame to
+            listen for a client, afterwards frames are only wanted while a client is connected.
+        """
+        if not self.publish_stream or self.frame_slot.closed:
+            return False
+        return not self.on_demand or self.process is None or self.has_client()
+
+    def output_size(self, width, height):
+        """
+        :param width: the width of the frames.
+        :param height: the height of the frames.
+        :return: the size of the stream, which is even as required by yuv420p.
+        """
+        if self.width is not None and width > self.width:
+            height = round(height * self.width / width)
+            width = self.width
+        return width - width % 2, height - height % 2
+
+    def has_client(self) -> bool:
+        """
+        :return: True if a tcp connection to the port of the url is established or the connections can not be read,
+            e.g. on other systems than Linux.
+        """
+        if self.port is None:
+            return True
+        found = False
+        for path in ("/proc/net/tcp", "/proc/net/tcp6"):
+            try:
+                with open(path) as file:
+                    lines = file.readlines()[1:]
+            except OSError:
+                continue
+            found = True
+            for line in lines:
+                fields = line.split()
+                if len(fields) > 3 and fields[3] == TCP_ESTABLISHED and int(fields[1].split(":")[1], 16) == self.port:
+                    return True
+        return not found
 
     def start_streaming(self, width, height, fps=30):
         """
         Starts the ffmpeg process to stream the video and stores it in self.process
         :param width: is the input and output width of the video type: int
         :param height: is the input and output height of the video type: int
-        :param fps:
+        :param fps: the frame rate of the frames written to the process
         :return:
         """
         self.process = (
             ffmpeg
-                .input('pipe:', format='rawvideo', codec="rawvideo", pix_fmt='bgr24', s='{}x{}'.format(width, height))
+                .input('pipe:', format='rawvideo', codec="rawvideo", pix_fmt='bgr24', s='{}x{}'.format(width, height),
+                       framerate=fps)
                 .output(
                 self.url,
                 # codec = "copy", # use same codecs of the original video
@@ -65,18 +179,29 @@ class VideoStream:
                 f=video_format,
 
             )
-                .global_args('-re')
                 .overwrite_output()
                 .run_async(pipe_stdin=True)
         )
         self.logger.info("Start streaming to {}".format(self.url))
 
-    def stop_streaming(self):
+    def stop_process(self):
         """
-        Stops the ffmpeg process
+        Stops the ffmpeg process, it is started again with the next frame
         :return:
         """
         if self.process:
             self.process.kill()
             self.process = None
             self.logger.info("Stopped streaming to {}".format(self.url))
+
+    def stop_streaming(self):
+        """
+        Stops the writer thread and the ffmpeg process
+        :return:
+        """
+        self.frame_slot.close()
+        self.frame_slot.active = False
+        if self._writer is not None and self._writer is not threading.current_thread():
+            self._writer.join(2)
+        self._writer = None
+        self.stop_process()
@@ -0,0 +1,134 @@
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# per slot: sequence number, height, width and channels of the frame
+META_FIELDS = 4
+# written sequence number, read sequence number
+COUNTERS = 2
+
+
+class FrameRing:
+    """
+    Ring of frames in shared memory to hand frames to another process without pickling them.
+    The writer stores every frame in the next slot together with a sequence number, the reader copies the latest frame.
+    A slot is marked while it is written and the reader checks its sequence number after copying, so a frame that has
+    been overwritten in the meantime is never returned. With more than two slots, the frame that is read is not
+    overwritten by the next frame.
+    """
+
+    def __init__(self, slot_size: int, slots: int = 3, name: str = None):
+        """
+        :param slot_size: the maximum size of a frame in bytes.
+        :param slots: the number of frames in the ring.
+        :param name: the name of an existing ring to attach to or None to create a new ring.
+        """
+        self.slot_size = slot_size
+        self.slots = slots
+        self.owner = name is None
+        header_size = np.dtype(np.int64).itemsize * (COUNTERS + META_FIELDS * slots)
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_size + slots * slot_size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # only the owner removes the memory, the tracker of this process would remove it as well
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        header = np.ndarray((COUNTERS + META_FIELDS * slots,), dtype=np.int64, buffer=self.shm.buf)
+        self._counters = header[:COUNTERS]
+        self._meta = header[COUNTERS:].reshape(slots, META_FIELDS)
+        self._data = np.ndarray((slots, slot_size), dtype=np.uint8, buffer=self.shm.buf, offset=header_size)
+        self._reserved = None
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def written(self) -> int:
+        """
+        :return: the sequence number of the latest frame, 0 if no frame has been written.
+        """
+        return int(self._counters[0])
+
+    @property
+    def read_sequence(self) -> int:
+        """
+        :return: the sequence number of the latest frame the reader has tried to read.
+        """
+        return int(self._counters[1])
+
+    def reserve(self, shape) -> np.array:
+        """
+        Returns the next slot as writable array, e.g. as destination of cv2.resize. The frame is only visible to the
+        reader after commit.
+
+        :param shape: the shape of the uint8 frame.
+        :return: the array in shared memory.
+        :raises ValueError: if the frame is larger than the slots.
+        """
+        size = int(np.prod(shape))
+        if size > self.slot_size:
+            raise ValueError("Frame of {} bytes does not fit into slots of {} bytes".format(size, self.slot_size))
+        sequence = self.written + 1
+        slot = sequence % self.slots
+        self._meta[slot, 0] = -1
+        self._reserved = (sequence, slot, tuple(shape))
+        return self._data[slot, :size].reshape(shape)
+
+    def commit(self) -> int:
+        """
+        Makes the reserved slot the latest frame.
+
+        :return: the sequence number of the frame.
+        """
+        sequence, slot, shape = self._reserved
+        self._reserved = None
+        self._meta[slot, 1:] = (shape + (0,))[:3]
+        self._meta[slot, 0] = sequence
+        self._counters[0] = sequence
+        return sequence
+
+    def put(self, frame: np.array) -> int:
+        """
+        Copies the frame into the next slot.
+
+        :param frame: the uint8 frame.
+        :return: the sequence number of the frame.
+        """
+        np.copyto(self.reserve(frame.shape), frame)
+        return self.commit()
+
+    def read(self):
+        """
+        Copies the latest frame out of the ring.
+
+        :return: the frame or None if there is no frame or it has been overwritten while it has been copied.
+        """
+        sequence = self.written
+        self._counters[1] = sequence
+        if sequence == 0:
+            return None
+        slot = sequence % self.slots
+        height, width, channels = (int(value) for value in self._meta[slot, 1:])
+        if self._meta[slot, 0] != sequence:
+            return None
+        shape = (height, width, channels) if channels > 0 else (height, width)
+        frame = self._data[slot, :int(np.prod(shape))].reshape(shape).copy()
+        if self._meta[slot, 0] != sequence:
+            return None
+        return frame
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory, which is removed if this ring has created it.
+
+        :return: None.
+        """
+        if self.shm is None:
+            return
+        # the arrays export the buffer of the shared memory, which can not be closed before
+        self._counters = self._meta = self._data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
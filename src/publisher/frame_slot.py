@@ -0,0 +1,88 @@
+import threading
+
+
+class FrameSlot:
+    """
+    Holds the latest frame for a single consumer.
+    Putting a frame replaces the one that has not been taken yet, so a slow consumer always gets the most recent frame
+    and memory never grows with the backlog. The consumer sets active while it wants frames, so the producer can skip
+    rendering them otherwise.
+    """
+
+    def __init__(self, active_flag=None):
+        """
+        :param active_flag: a shared value, e.g. multiprocessing.Value, that holds active, to share it with the
+            producer in another process. None keeps it in this object.
+        """
+        self._frame = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._active_flag = active_flag
+        self._active = False
+        self.dropped = 0
+
+    @property
+    def active(self) -> bool:
+        """
+        :return: True if a consumer wants frames.
+        """
+        if self._active_flag is not None:
+            return bool(self._active_flag.value)
+        return self._active
+
+    @active.setter
+    def active(self, active: bool) -> None:
+        if self._active_flag is not None:
+            self._active_flag.value = active
+        else:
+            self._active = active
+
+    def reserve(self, shape):
+        """
+        Frames are handed over by reference, so there is no buffer to render the next frame into.
+
+        :param shape: the shape of the frame.
+        :return: None, the producer allocates the frame itself.
+        """
+        return None
+
+    def put(self, frame) -> None:
+        """
+        Stores the frame, dropping the previous one if it has not been taken.
+
+        :param frame: the frame.
+        :return: None.
+        """
+        with self._condition:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._condition.notify()
+
+    def get(self, timeout: float = None):
+        """
+        Takes the latest frame, waiting for one if the slot is empty.
+
+        :param timeout: the maximum time in seconds to wait or None to wait until a frame is put or the slot is closed.
+        :return: the frame or None if there is no frame within the timeout or the slot has been closed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._frame is not None or self._closed, timeout)
+            frame = self._frame
+            self._frame = None
+            return frame
+
+    def close(self) -> None:
+        """
+        Wakes up a waiting consumer, which gets None from now on.
+
+        :return: None.
+        """
+        with self._condition:
+            self._closed = True
+            self._frame = None
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
@@ -1,83 +1,286 @@
 import asyncio
+import functools
+import logging
 import queue
+import threading
+from urllib.parse import urlparse
 
+from .change_queue import ChangeQueue
 from .connection import mqtt
-from .connection.video import VideoStream
+from .connection.mqtt.async_adapter import AsyncioAdapter
+from .connection.video import VideoStream, MjpegStream
+from .frame_slot import FrameSlot
 
 
 class MasterPublisher:
     """
     class master_publisher
     controls all publishing options such as mqqt, video and so on...
+    The changes, the network loop of the MQTT client, the heartbeat, the offline spool and the configuration messages
+    are handled by tasks of a single asyncio loop. Only the frames are published by a separate thread, so publishing
+    the changes is never delayed by the video.
     """
 
-    def __init__(self, state_queue: queue.Queue):
+    def __init__(self, state_queue: queue.Queue, frame_slot: FrameSlot = None):
         """
         initialize all publishers
-        :param state_queue: is the queue that is used to communicate between the threads
+        :param state_queue: is the queue of the changes that is used to communicate between the threads, no change is
+            dropped. A ChangeQueue is awaited directly, any other queue is read by a worker thread of the loop.
+        :param frame_slot: holds the latest frame for the video publisher. Frames in the state_queue are moved there.
         """
         assert state_queue is not None
         self.state_queue = state_queue  # type: queue.Queue
+        self.frame_slot = frame_slot if frame_slot is not None else FrameSlot()  # type: FrameSlot
+        self.video_thread = None  # type: threading.Thread or None
 
         self.mqqt_publisher = None  # type: mqtt.MQTTConnector or None
+        self.mqtt_adapter = None  # type: AsyncioAdapter or None
+        self.batch_changes = False  # type: bool
+        self.batch_window = 0.0  # type: float
         self.video_publisher = None  # type: VideoStream or None
         self.running = False  # type: bool
-        self.heartbeat_thread = None  # type: asyncio.Task or None
+        self.loop = None  # type: asyncio.AbstractEventLoop or None
+        self.config_handlers = []
+        self._config_messages = None  # type: asyncio.Queue or None
+        self.snapshot_sources = {}
+        self.snapshot_interval = 1.0  # type: float
+        self._changes_published = None  # type: asyncio.Event or None
 
     def init_mqqt(self, mqqt_config):
         """
-        initialize mqqt publisher
+        initialize mqqt publisher, it is connected once the publisher runs
+        If "batch_changes" is set in the config, the changes of a frame or of "batch_window" seconds are published as a
+        single message per board. The compact encoding always publishes one message per board.
         """
+        self.batch_changes = mqqt_config.get("batch_changes", False) or mqqt_config.get("encoding") == "compact"
+        self.batch_window = mqqt_config.get("batch_window", 0.0)
         self.mqqt_publisher = mqtt.MQTTConnector(mqqt_config)
-        self.mqqt_publisher.connect()
 
-    def init_video(self, video_config, publish_stream):
+    def init_video(self, video_config, publish_stream, width=None, max_fps=None, on_demand=True, quality=80):
         """
         initialize video publisher and start streaming
+        The VideoStream takes the frames from the frame slot with its own writer thread.
         :param publish_stream:
-        :param video_config:
+        :param video_config: the url of the stream, an http url serves a MJPEG stream instead of RTMP via ffmpeg
+        :param width: the width of the stream or None to keep the size of the frames
+        :param max_fps: the maximum frame rate of the stream or None to publish every frame
+        :param on_demand: only stream while a client is connected, the MJPEG stream always is on demand
+        :param quality: the JPEG quality of the MJPEG stream
         :return:
         """
+        if urlparse(video_config).scheme == "http":
+            self.video_publisher = MjpegStream(video_config, publish_stream, width=width, max_fps=max_fps,
+                                               quality=quality, frame_slot=self.frame_slot)
+            return
+        self.video_publisher = VideoStream(video_config, publish_stream, width=width, max_fps=max_fps,
+                                           on_demand=on_demand, frame_slot=self.frame_slot)
 
-        self.video_publisher = VideoStream(video_config, publish_stream)
+    def init_snapshots(self, snapshot_sources, snapshot_interval=1.0):
+        """
+        publish a retained snapshot of every board after its leds have changed, at most once per interval
+        :param snapshot_sources: a callable returning the current snapshot, e.g. StateStore.snapshot, by the board id
+        :param snapshot_interval: the minimum time in seconds between two snapshots of a board
+        :return:
+        """
+        self.snapshot_sources = snapshot_sources
+        self.snapshot_interval = snapshot_interval
+
+    def add_config_handler(self, handler):
+        """
+        registers a handler for the messages of the config topic, which is called in the loop of the publisher
+        :param handler: a callable getting the paho message
+        :return:
+        """
+        self.config_handlers.append(handler)
 
     def run(self):
         """
-        Routine for publishing all changes
+        Runs the loop of the publisher until stop is called. Starts the thread publishing the frames.
+        :return:
+        """
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """
+        Routine for publishing all changes, together with the tasks for the MQTT connection.
         :return:
         """
         self.running = True
+        self.loop = asyncio.get_running_loop()
+        if isinstance(self.state_queue, ChangeQueue):
+            self.state_queue.bind(self.loop)
+        if isinstance(self.video_publisher, VideoStream) and self.video_publisher.frame_slot is self.frame_slot:
+            self.video_publisher.start_writer()
+        elif self.video_thread is None:
+            self.frame_slot.active = self.video_publisher is not None
+            self.video_thread = threading.Thread(target=self.run_video, daemon=True)
+            self.video_thread.start()
+
+        tasks = []
+        if isinstance(self.mqqt_publisher, mqtt.MQTTConnector):
+            tasks = self.start_mqtt_tasks()
+        try:
+            await self.publish_states()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.mqtt_adapter is not None:
+                self.mqtt_adapter.close()
+                self.mqqt_publisher.disconnect()
+
+    def start_mqtt_tasks(self):
+        """
+        connects the MQTT client and starts the heartbeat, the drain of the spool and the handling of configurations
+        :return: the started tasks
+        """
+        self.mqtt_adapter = AsyncioAdapter(self.mqqt_publisher, self.loop)
+        self._config_messages = asyncio.Queue()
+        self.mqqt_publisher.add_config_handler(
+            lambda client, userdata, message: self._config_messages.put_nowait(message))
+        self.mqtt_adapter.connect()
+
+        tasks = [self.loop.create_task(mqtt.publish_heartbeat_routine(self.mqqt_publisher)),
+                 self.loop.create_task(self.handle_config())]
+        if len(self.snapshot_sources) > 0:
+            self._changes_published = asyncio.Event()
+            tasks.append(self.loop.create_task(self.publish_snapshots()))
+        if self.mqqt_publisher.spool is not None:
+            tasks.append(self.loop.create_task(mqtt.drain_spool_routine(self.mqqt_publisher)))
+        return tasks
+
+    async def publish_states(self):
+        """
+        Takes the states from the queue until stop is called. A new state is only taken once the previous changes have
+        been written to the socket, so a slow connection holds the changes back instead of buffering them in memory.
+        :return:
+        """
         while self.running:
-            # get the next message from the queue and publish it
-            state = self.state_queue.get(block=True)
-            if state is not None:
-                if self.mqqt_publisher is not None and state.__contains__("changes"):
-                    self.mqqt_publisher.publish_changes(state["changes"])
-                if self.video_publisher is not None and state.__contains__("frame"):
-                    self.video_publisher.write(state["frame"])
+            state = await self.next_state()
+            if state is None:
+                break
+            if self.mqqt_publisher is not None and state.__contains__("changes"):
+                await self.publish_changes(state["changes"])
+                if self._changes_published is not None:
+                    self._changes_published.set()
+                if self.mqtt_adapter is not None:
+                    await self.mqtt_adapter.wait_flushed()
+            if state.__contains__("frame"):
+                self.frame_slot.put(state["frame"])
+
+    async def next_state(self, timeout=None):
+        """
+        :param timeout: the maximum time in seconds to wait or None to wait until a state is put
+        :return: the next state of the queue
+        :raises queue.Empty: if there is no state within the timeout
+        """
+        if isinstance(self.state_queue, ChangeQueue):
+            try:
+                return await asyncio.wait_for(self.state_queue.get_async(), timeout)
+            except asyncio.TimeoutError:
+                raise queue.Empty
+        # a cancelled get of a worker thread would still take the next state, so the timeout is left to the queue
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.state_queue.get, True, timeout))
+
+    async def publish_changes(self, changes):
+        """
+        publishes the changes of a frame, either per led or, in batch mode, as one message per board
+        :param changes: the list of BoardChanges of a frame or a single BoardChanges
+        :return:
+        """
+        if not isinstance(changes, list):
+            changes = [changes]
+
+        if not self.batch_changes:
+            for change in changes:
+                self.mqqt_publisher.publish_changes(change)
+            return
+
+        # collect the changes of the following frames within the window
+        changes = list(changes)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+        while self.running and loop.time() < deadline:
+            try:
+                state = await self.next_state(deadline - loop.time())
+            except queue.Empty:
+                break
+            if state is None:
+                self.running = False
+                break
+            if state.__contains__("changes"):
+                changes.extend(state["changes"] if isinstance(state["changes"], list) else [state["changes"]])
+            if state.__contains__("frame"):
+                self.frame_slot.put(state["frame"])
+        self.mqqt_publisher.publish_board_changes(changes)
+
+    async def publish_snapshots(self):
+        """
+        Routine publishing the snapshot of every board that has changed since its last snapshot. Changes within the
+        snapshot interval are combined into one snapshot. All snapshots are published again after reconnecting.
+        :return:
+        """
+        published = {}
+        connected = False
+        while True:
+            try:
+                await asyncio.wait_for(self._changes_published.wait(), self.snapshot_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._changes_published.clear()
+
+            if not self.mqqt_publisher.is_connected():
+                connected = False
+                continue
+            if not connected:
+                # the broker might have lost the retained snapshots
+                published = {}
+                connected = True
+            for board, source in self.snapshot_sources.items():
+                snapshot = source()
+                # the snapshot of the store is replaced on every change, so an unchanged board returns the same dict
+                if len(snapshot) > 0 and snapshot is not published.get(board):
+                    self.mqqt_publisher.publish_snapshot(board, snapshot)
+                    published[board] = snapshot
+            await asyncio.sleep(self.snapshot_interval)
+
+    async def handle_config(self):
+        """
+        Routine passing the messages of the config topic to the registered handlers
+        :return:
+        """
+        while True:
+            message = await self._config_messages.get()
+            for handler in self.config_handlers:
+                try:
+                    handler(message)
+                except Exception as e:
+                    logging.error("Could not handle configuration: %s", e)
+
+    def run_video(self):
+        """
+        Routine for publishing the latest frame, frames that arrive while the previous one is written are dropped.
+        :return:
+        """
+        while self.running:
+            frame = self.frame_slot.get()
+            if frame is not None and self.video_publisher is not None:
+                self.video_publisher.write(frame)
 
     def stop(self):
         """
-        stop all publishers
+        stop all publishers, the MQTT client is disconnected by the loop if it is running
         :return:
         """
         self.running = False
-        self.state_queue.put(None)  # Needed to stop the get method in the run method
+        self.state_queue.put(None)  # Needed to stop waiting for the next state
+        self.frame_slot.close()
+        self.frame_slot.active = False
         if self.video_publisher is not None:
             self.video_publisher.stop_streaming()
-        if self.mqqt_publisher is not None:
+        if self.mqqt_publisher is not None and self.mqtt_adapter is None:
             self.mqqt_publisher.disconnect()
 
-    def start_publish_heartbeats(self):
-        """
-        publish heartbeats to mqqt
-        :return:
-        """
-        if self.heartbeat_thread is None:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            self.heartbeat_thread = loop.create_task(mqtt.publish_heartbeat_routine(self.mqqt_publisher))
-            loop.run_until_complete(self.heartbeat_thread)
-
     def __del__(self):
         self.stop()
@@ -0,0 +1,212 @@
+import functools
+import logging
+import multiprocessing
+import threading
+
+import numpy as np
+
+from .change_queue import ChangeQueue
+from .frame_ring import FrameRing
+from .frame_slot import FrameSlot
+from .master_publisher import MasterPublisher
+
+
+class PipeStateQueue:
+    """
+    Replaces the state_queue of the StateDetector, sends the states to the publisher process through a pipe.
+    Only the small change messages are pickled. If the publisher process stops reading, put blocks once the buffer of
+    the pipe is full, because no change is dropped.
+    """
+
+    def __init__(self, connection, lock: threading.Lock):
+        self.connection = connection
+        self.lock = lock
+
+    def put(self, state) -> None:
+        with self.lock:
+            self.connection.send(state)
+
+
+class RingFrameSlot:
+    """
+    Replaces the frame_slot of the StateDetector, writes the frames into a FrameRing in shared memory and notifies the
+    publisher process with the sequence number. A new notification is only sent once the previous one has been read,
+    so frames never fill the pipe. The ring is created with the first frame and recreated if a frame does not fit.
+    Whether the publisher process wants frames is shared through active_flag.
+    """
+
+    def __init__(self, connection, lock: threading.Lock, slots: int = 3, active_flag=None):
+        self.connection = connection
+        self.lock = lock
+        self.slots = slots
+        self.ring = None  # type: FrameRing or None
+        self.dropped = 0
+        self.closed = False
+        self._active_flag = active_flag
+        self._notified = 0
+        self._reserved = None
+
+    @property
+    def active(self) -> bool:
+        """
+        :return: True if the publisher process wants frames.
+        """
+        return self._active_flag is None or bool(self._active_flag.value)
+
+    def reserve(self, shape):
+        """
+        Returns the next slot of the ring, so the frame can be rendered into shared memory directly and put afterwards
+        without copying it.
+
+        :param shape: the shape of the uint8 frame.
+        :return: the writable array in shared memory.
+        """
+        size = int(np.prod(shape))
+        if self.ring is None or size > self.ring.slot_size:
+            self._create_ring(size)
+        self._reserved = self.ring.reserve(shape)
+        return self._reserved
+
+    def put(self, frame) -> None:
+        """
+        Copies the frame into the ring without pickling it.
+
+        :param frame: the frame.
+        :return: None.
+        """
+        if self.closed:
+            return
+        if frame is self._reserved:
+            sequence = self.ring.commit()
+        else:
+            if self.ring is None or frame.nbytes > self.ring.slot_size:
+                self._create_ring(frame.nbytes)
+            sequence = self.ring.put(frame)
+        self._reserved = None
+        if self.ring.read_sequence < self._notified:
+            self.dropped += 1
+            return
+        self._notified = sequence
+        with self.lock:
+            self.connection.send({"frame": sequence})
+
+    def _create_ring(self, slot_size: int) -> None:
+        old = self.ring
+        self.ring = FrameRing(slot_size, self.slots)
+        self._notified = 0
+        with self.lock:
+            self.connection.send({"frame_ring": (self.ring.name, self.ring.slot_size, self.ring.slots)})
+        if old is not None:
+            # the mapping of the publisher process stays valid until it has attached to the new ring. If it has not
+            # attached to the old ring yet, it skips it.
+            old.close()
+
+    def close(self) -> None:
+        self.closed = True
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+class PublisherProcess:
+    """
+    Runs a MasterPublisher with its MQTT connection and video stream in a separate process, so publishing does not
+    compete with the detection for the GIL. state_queue and frame_slot replace the ones of the StateDetector.
+    """
+
+    def __init__(self, mqtt_config: dict, video_config: dict = None, snapshot_interval: float = 0.0):
+        """
+        :param mqtt_config: the config of the MQTTConnector or None to not publish changes.
+        :param video_config: the keyword arguments of MasterPublisher.init_video or None for no video.
+        :param snapshot_interval: the minimum time in seconds between two snapshots of a board, 0 for no snapshots. The
+            snapshots are built from the changes, the boards are the keys of "led_ids" of the mqtt_config.
+        """
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        active_flag = context.Value("b", 0, lock=False)
+        self.process = context.Process(target=run_publisher_process, daemon=True, name="publisher",
+                                       args=(receiver, mqtt_config, video_config, snapshot_interval, active_flag))
+        self.process.start()
+        receiver.close()
+        self.connection = sender
+        lock = threading.Lock()
+        self.state_queue = PipeStateQueue(sender, lock)
+        self.frame_slot = RingFrameSlot(sender, lock, active_flag=active_flag)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stops the publisher process and removes the frame ring.
+
+        :param timeout: the time in seconds to wait for the process before it is terminated.
+        :return: None.
+        """
+        if self.connection is None:
+            return
+        try:
+            self.state_queue.put(None)
+        except (OSError, ValueError) as e:
+            logging.debug("Could not stop publisher process: %s", e)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.frame_slot.close()
+        self.connection.close()
+        self.connection = None
+
+
+def run_publisher_process(connection, mqtt_config, video_config, snapshot_interval, active_flag=None):
+    """
+    Entry point of the publisher process, runs the MasterPublisher until None is received.
+    """
+    publisher = MasterPublisher(ChangeQueue(), FrameSlot(active_flag))
+    if video_config is not None:
+        publisher.init_video(**video_config)
+    if mqtt_config is not None:
+        publisher.init_mqqt(mqtt_config)
+    snapshots = {}
+    if mqtt_config is not None and snapshot_interval > 0:
+        publisher.init_snapshots({board: functools.partial(snapshots.get, board, {})
+                                  for board in mqtt_config.get("led_ids") or {}}, snapshot_interval)
+
+    receiver = threading.Thread(target=receive_states, args=(connection, publisher, snapshots), daemon=True)
+    receiver.start()
+    publisher.run()
+
+
+def receive_states(connection, publisher: MasterPublisher, snapshots: dict):
+    """
+    Passes the states received from the StateDetector to the publisher and copies the notified frames out of the ring.
+    The snapshot of every board is replaced with each change, as the StateStore does.
+    """
+    ring = None
+    while True:
+        try:
+            state = connection.recv()
+        except (EOFError, OSError):
+            state = None
+        if state is None:
+            publisher.stop()
+            break
+        if "frame_ring" in state:
+            name, slot_size, slots = state["frame_ring"]
+            if ring is not None:
+                ring.close()
+            try:
+                ring = FrameRing(slot_size, slots, name)
+            except FileNotFoundError:
+                # the ring has already been replaced, the name of the newer one follows
+                logging.debug("Frame ring %s has already been removed", name)
+                ring = None
+        elif "frame" in state:
+            frame = ring.read() if ring is not None else None
+            if frame is not None:
+                publisher.frame_slot.put(frame)
+        else:
+            for change in state.get("changes", []):
+                snapshot = dict(snapshots.get(change.board, {}))
+                snapshot[change.id] = {"state": change.value, "color": change.color, "frequency": change.frequency,
+                                       "time": change.time}
+                snapshots[change.board] = snapshot
+            publisher.state_queue.put(state)
+    if ring is not None:
+        ring.close()
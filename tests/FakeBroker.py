@@ -0,0 +1,76 @@
+import queue
+import socket
+import threading
+
+
+class FakeBroker:
+    """
+    Accepts MQTT clients one after another and records the topics of their PUBLISH packets. Subclasses can override
+    handle_publish to answer the packets.
+    """
+
+    def __init__(self):
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.topics = queue.Queue()
+        self.connection = None
+        self.connections = 0
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def read_packet(self, connection):
+        """
+        :return: the fixed header byte and the body of the next packet or None and b"" if the connection is closed
+        """
+        header = connection.recv(1)
+        if len(header) == 0:
+            return None, b""
+        length, multiplier = 0, 1
+        while True:
+            byte = connection.recv(1)[0]
+            length += (byte & 127) * multiplier
+            multiplier *= 128
+            if byte < 128:
+                break
+        body = b""
+        while len(body) < length:
+            body += connection.recv(length - len(body))
+        return header[0], body
+
+    def serve(self):
+        while True:
+            connection, _ = self.server.accept()
+            self.connection = connection
+            self.connections += 1
+            try:
+                self.serve_connection(connection)
+            except OSError:
+                pass
+
+    def serve_connection(self, connection):
+        while True:
+            header, body = self.read_packet(connection)
+            if header is None:
+                break
+            if header >> 4 == 1:  # CONNECT
+                connection.sendall(bytes([0x20, 2, 0, 0]))
+            elif header >> 4 == 8:  # SUBSCRIBE
+                connection.sendall(bytes([0x90, 3]) + body[:2] + bytes([0]))
+            elif header >> 4 == 3:  # PUBLISH
+                topic_length = int.from_bytes(body[:2], "big")
+                self.handle_publish(connection, header, body[2:2 + topic_length].decode(), body[2 + topic_length:])
+
+    def handle_publish(self, connection, header, topic, rest):
+        """
+        :param connection: the connection of the client
+        :param header: the fixed header byte, which contains the QoS
+        :param topic: the topic of the message
+        :param rest: the packet id, if any, followed by the payload
+        """
+        self.topics.put(topic)
+
+    def drop(self):
+        """closes the connection of the current client"""
+        self.connection.shutdown(socket.SHUT_RDWR)
+        self.connection.close()
@@ -0,0 +1,31 @@
+import numpy as np
+
+from BSP.LED.StateDetection.BlinkFrequencyEstimator import BlinkFrequencyEstimator
+
+
+def square_wave(times, frequency, duty_cycle):
+    return np.where((times * frequency) % 1 < duty_cycle, 200, 40)
+
+
+def test_estimate_blinking_and_steady_leds():
+    rng = np.random.default_rng(0)
+    estimator = BlinkFrequencyEstimator(3)
+    times = np.cumsum(rng.uniform(0.025, 0.04, 200))
+    for t in times:
+        estimator.add_sample(t, [square_wave(t, 7, 0.5), square_wave(t, 2, 0.25), 120 + rng.normal(0, 1)])
+
+    frequency, duty_cycle, confidence = estimator.estimate()
+    assert abs(frequency[0] - 7) < 0.35
+    assert abs(frequency[1] - 2) < 0.1
+    assert abs(duty_cycle[0] - 0.5) < 0.1
+    assert abs(duty_cycle[1] - 0.25) < 0.1
+    assert confidence[0] > 0.5 and confidence[1] > 0.3
+    assert frequency[2] == 0 and confidence[2] == 0 and np.isnan(duty_cycle[2])
+
+
+def test_estimate_without_enough_samples():
+    estimator = BlinkFrequencyEstimator(1)
+    estimator.add_sample(0, [0])
+    estimator.add_sample(0.1, [255])
+    frequency, duty_cycle, confidence = estimator.estimate()
+    assert frequency[0] == 0 and confidence[0] == 0
@@ -0,0 +1,115 @@
+import numpy as np
+
+from BDG.model.board_model import Led
+from BSP.FrameContext import FrameContext
+from BSP.LED.ColorDetection import HueHistograms
+from BSP.LED.StateDetection.BoardObserver import BoardObserver
+
+
+def observer(**kwargs):
+    return BoardObserver([Led("LED_Red", np.array([0, 0]), 5, ["red"])], **kwargs)
+
+
+def test_lighting_change_invalidates_leds():
+    obs = observer()
+    for brightness in [100, 100, 130]:
+        obs._check_invalidation(brightness)
+    assert obs.invalidations == 1
+    assert obs.gain == 1.0
+
+
+def test_normalize_brightness_rescales_instead_of_invalidating():
+    obs = observer(normalize_brightness=True, max_gain=2.0)
+    for brightness in [100, 100, 130]:
+        obs._check_invalidation(brightness)
+    assert obs.invalidations == 0
+    assert obs.invalidations_avoided == 1
+    assert np.isclose(obs.gain, 100 / 130)
+
+    # changes by more than max_gain restart the detection with a new reference
+    obs._check_invalidation(30)
+    assert obs.invalidations == 1
+    assert obs.gain == 1.0
+
+
+def test_debug_frame_leaves_rois_untouched():
+    obs = observer(debug=True)
+    frame = np.full((20, 20, 3), 40, dtype=np.uint8)
+    context = FrameContext(frame, None, 0.0)
+    context.set_rois([frame[5:10, 5:10]], [[5, 5, 10, 10]])
+    obs.leds[0].is_on = True
+
+    debug = obs.debug_frame(context)
+    assert tuple(debug[5, 7]) == (0, 255, 0)
+    assert np.all(frame == 40) and np.all(context.rois[0].frame == 40)
+
+
+def test_frequency_reported_without_state_change():
+    obs = observer()
+    reported = []
+    obs.leds[0].is_on = True
+    obs.blink_confidences[0] = 1.0
+    obs.duty_cycles[0] = 0.25
+    for frequency in [2.0, 2.1, 3.0]:
+        obs.frequencies[0] = frequency
+        obs._report_frequencies(lambda *args: reported.append(args))
+    # changes within the tolerance of 10% are not reported again, the duty cycle and confidence are reported as well
+    assert reported == [("LED_Red", 2.0, 0.25, 1.0), ("LED_Red", 3.0, 0.25, 1.0)]
+
+    obs.blink_confidences[0] = 0.0
+    obs.frequencies[0] = 5.0
+    obs._report_frequencies(lambda *args: reported.append(args))
+    assert len(reported) == 2 and obs.frequency_updates == 2
+    assert obs.blink_details(0) == (None, None)
+
+
+def test_change_gate_only_counts_gated_leds():
+    obs = observer()
+    frame = np.full((20, 20, 3), 40, dtype=np.uint8)
+    context = FrameContext(frame, None, 0.0)
+    context.set_rois([frame[5:10, 5:10]], [[5, 5, 10, 10]])
+
+    # a LED without state is evaluated without asking the gate
+    obs.check(context, 100, lambda *args: None)
+    assert obs.change_gate.evaluated == 0 and obs.change_gate.skipped == 0
+
+    obs.leds[0].is_on = False
+    obs.check(context, 100, lambda *args: None)
+    obs.check(context, 100, lambda *args: None)
+    assert obs.change_gate.evaluated == 1 and obs.change_gate.skipped == 1
+
+
+def test_slow_drift_beyond_max_gain_invalidates():
+    obs = observer(normalize_brightness=True, max_gain=2.0)
+    for brightness in np.arange(100, 40, -0.5):
+        obs._check_invalidation(brightness)
+        assert 1 / obs.max_gain <= obs.gain <= obs.max_gain
+    assert obs.invalidations == 1
+
+
+def test_colors_classified_at_once(monkeypatch):
+    obs = BoardObserver([Led("LED_1", np.array([0, 0]), 5, ["red", "green"]),
+                         Led("LED_2", np.array([0, 0]), 5, ["red", "green"]),
+                         Led("LED_3", np.array([0, 0]), 5, [])])
+    boxes = [[0, 0, 5, 5], [5, 0, 10, 5], [10, 0, 15, 5]]
+    off = np.zeros((5, 15, 3), dtype=np.uint8)
+    off[:] = (255, 0, 0)
+    on = off.copy()
+    on[:, 0:5] = (0, 0, 255)
+    on[:, 5:10] = (0, 255, 0)
+    calls = []
+    classify = HueHistograms.classify
+    monkeypatch.setattr(HueHistograms, "classify", lambda *args: calls.append(args) or classify(*args))
+
+    # the off-state is not known yet
+    context = FrameContext(on, None, 0.0)
+    context.set_rois([on[:, x0:x1] for x0, _, x1, _ in boxes], boxes)
+    assert obs._classify_colors(context, [0, 2], np.array([1, 1, 1])) == {0: None, 2: ""}
+
+    context = FrameContext(off, None, 1.0)
+    context.set_rois([off[:, x0:x1] for x0, _, x1, _ in boxes], boxes)
+    obs._classify_colors(context, [0, 1, 2], np.array([0, 0, 0]))
+    context = FrameContext(on, None, 2.0)
+    context.set_rois([on[:, x0:x1] for x0, _, x1, _ in boxes], boxes)
+    assert obs._classify_colors(context, [0, 1, 2], np.array([1, 1, 1])) == {0: "red", 1: "green", 2: ""}
+    assert len(calls) == 1 and calls[0][0].shape == (2, 180)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from BSP.FrameContext import FrameContext
+from BSP.LED.StateDetection.ChangeGate import ChangeGate
+
+
+def roi(value):
+    return FrameContext(np.full((10, 10, 3), value, np.uint8))
+
+
+def test_skip_unchanged_roi():
+    gate = ChangeGate(2, threshold=2.0, max_skipped_frames=3)
+    assert gate.should_evaluate(0, roi(100))
+    assert gate.should_evaluate(1, roi(100))
+    assert not gate.should_evaluate(0, roi(101))
+    assert gate.should_evaluate(1, roi(150))
+    assert gate.evaluated == 3 and gate.skipped == 1
+
+
+def test_evaluate_drift_and_max_skipped_frames():
+    gate = ChangeGate(1, threshold=2.0, max_skipped_frames=3)
+    assert gate.should_evaluate(0, roi(100))
+    assert not gate.should_evaluate(0, roi(101))
+    assert not gate.should_evaluate(0, roi(102))
+    # compared with the last evaluated frame
+    assert gate.should_evaluate(0, roi(103))
+
+    for _ in range(3):
+        assert not gate.should_evaluate(0, roi(103))
+    assert gate.should_evaluate(0, roi(103))
+
+    gate.reset()
+    assert gate.should_evaluate(0, roi(103))
@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+import cv2
+
+from BSP.LED import ColorDetection
+from BSP.LED.ColorDetection.ColorLookup import ColorLookupTable
+from BSP.LED.ColorDetection.DominantColor import get_dominant_color
+from BSP.LED.ColorDetection.Util import get_closest_color, create_new_cmap
+
+colors = list(ColorDetection.COLOR_HUE_MEANS.keys())
+
+
+def test_same_color_as_dominant_color():
+    table = ColorLookupTable(colors, cache_dir=None)
+    for path in ["led_roi_yellow.jpg", "resources/red_led_roi.png", "resources/Pi/led_green.png",
+                 "resources/Pi/led_red.png"]:
+        img = cv2.imread(path)
+        expected = get_closest_color(get_dominant_color(img), create_new_cmap(colors))
+        assert table.dominant_color(img) == expected
+
+
+def test_rules():
+    table = ColorLookupTable(["red", "green"], cache_dir=None)
+    overexposed = np.full((4, 4, 3), 255, np.uint8)
+    unsaturated = np.full((4, 4, 3), (100, 110, 100), np.uint8)
+    counts = table.color_counts(np.concatenate([overexposed, unsaturated]))
+    assert counts[0] == 16 and counts[4] == 16
+    assert table.dominant_color(unsaturated) == "green"
+
+
+def test_cached_on_disk(tmp_path):
+    table = ColorLookupTable(["blue"], cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+    assert np.all(ColorLookupTable(["blue"], cache_dir=str(tmp_path)).table == table.table)
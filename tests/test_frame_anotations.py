@@ -1,12 +1,36 @@
+from BSP.state_handler.state_store import StateStore
 from BSP.state_handler.state_table import load_state_table
-from BSP.frame_anotations.frame_anotator import draw_plot, draw_plot_in_frame
+from BSP.frame_anotations.frame_anotator import draw_plot, draw_plot_in_frame, annotate_preview, preview_shape
 import cv2
+import numpy as np
 
 
 
 def test_frame_anotation():
     frame = cv2.imread("resources/test_model.jpg")
-    table = load_state_table("resources/example_log.csv")
+    store = StateStore()
+    table = load_state_table(store, "resources/example_log.csv")
 
-    plot = draw_plot_in_frame(frame)
+    plot = draw_plot_in_frame(frame, store)
     cv2.imwrite("tests/resources/test_frame_anotation.jpg", plot)
+
+
+def test_annotate_preview():
+    frame = np.full((400, 800, 3), 50, dtype=np.uint8)
+    original = frame.copy()
+    out = np.zeros(preview_shape(frame.shape, 200), dtype=np.uint8)
+    preview = annotate_preview(frame, [[400, 200, 440, 240]], ["LED_1"], 30, {"LED_1": {"state": "on"}}, 200, out)
+
+    assert np.array_equal(frame, original)
+    assert preview is out and preview.shape == (100, 200, 3)
+    # the box is scaled by 1/4 and drawn in the color of the state
+    assert tuple(preview[55, 100]) == (0, 255, 0)
+    assert tuple(preview[55, 105]) == (50, 50, 50)
+
+
+def test_annotate_preview_keeps_small_frames():
+    frame = np.full((100, 200, 3), 50, dtype=np.uint8)
+    preview = annotate_preview(frame, [[20, 30, 40, 50]], ["LED_1"], 30, {}, 1280)
+    assert preview is not frame and preview.shape == frame.shape
+    assert tuple(preview[40, 20]) == (0, 0, 255)
+    assert tuple(frame[40, 20]) == (50, 50, 50)
@@ -0,0 +1,24 @@
+import numpy as np
+import cv2
+
+from BSP.BoardOrientation import BoardOrientation
+from BSP.FrameContext import FrameContext
+
+
+frame = cv2.imread("resources/Pi/pi_test.jpg")
+corners = [[100, 100], [100, 300], [300, 300], [300, 100]]
+
+
+def test_views_are_memoized():
+    context = FrameContext(frame)
+    assert context.gray is context.gray
+    assert context.hsv is context.hsv
+    assert np.all(context.gray == cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+
+def test_board_mask_cached_per_orientation():
+    orientation = BoardOrientation(None, corners)
+    mask = orientation.get_board_mask(frame.shape[1], frame.shape[0])
+    assert orientation.get_board_mask(frame.shape[1], frame.shape[0]) is mask
+    assert BoardOrientation(None, corners).get_board_mask(frame.shape[1], frame.shape[0]) is not mask
+    assert mask[200, 200] == 255 and mask[50, 50] == 0
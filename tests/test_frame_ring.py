@@ -0,0 +1,138 @@
+import multiprocessing
+import socket
+import threading
+import urllib.request
+
+import numpy as np
+
+from publisher.frame_ring import FrameRing
+from publisher.frame_slot import FrameSlot
+from publisher.process_publisher import PublisherProcess, RingFrameSlot, receive_states
+from publisher.connection.message.change_msg import BoardChanges
+from FakeBroker import FakeBroker
+from test_video_stream import read_part
+
+
+def test_put_and_read():
+    ring = FrameRing(4 * 4 * 3, slots=3)
+    reader = FrameRing(ring.slot_size, ring.slots, ring.name)
+    assert reader.read() is None
+
+    for i in range(5):
+        assert ring.put(np.full((4, 4, 3), i, dtype=np.uint8)) == i + 1
+    frame = reader.read()
+    assert frame.shape == (4, 4, 3) and np.all(frame == 4)
+    assert ring.read_sequence == 5
+
+    # a frame can be written into the ring directly
+    buffer = ring.reserve((2, 3))
+    buffer[:] = 7
+    assert reader.read().shape == (4, 4, 3)
+    ring.commit()
+    assert np.all(reader.read() == np.full((2, 3), 7))
+
+    try:
+        ring.reserve((5, 5, 3))
+        assert False
+    except ValueError:
+        pass
+    reader.close()
+    ring.close()
+
+
+def test_overwritten_frame_is_not_returned():
+    ring = FrameRing(16, slots=2)
+    ring.put(np.zeros((4, 4), dtype=np.uint8))
+    # the slot of the latest frame is written again
+    ring.reserve((4, 4))
+    ring._counters[0] = ring.written + 2
+    assert ring.read() is None
+    ring.close()
+
+
+def test_ring_frame_slot_reserve():
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    flag = multiprocessing.Value("b", 0, lock=False)
+    slot = RingFrameSlot(sender, threading.Lock(), active_flag=flag)
+    assert not slot.active
+    flag.value = 1
+    assert slot.active
+
+    # the preview is rendered into shared memory and put without a copy
+    out = slot.reserve((4, 6, 3))
+    out[:] = 7
+    slot.put(out)
+    name, slot_size, slots = receiver.recv()["frame_ring"]
+    assert slot_size == 4 * 6 * 3
+    sequence = receiver.recv()["frame"]
+    reader = FrameRing(slot_size, slots, name)
+    assert reader.written == sequence
+    assert np.array_equal(reader.read(), np.full((4, 6, 3), 7, dtype=np.uint8))
+    reader.close()
+    slot.close()
+
+
+class StoppingPublisher:
+    """Stands in for the MasterPublisher of receive_states"""
+
+    def __init__(self):
+        self.frame_slot = FrameSlot()
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def test_ring_replaced_before_attach():
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    slot = RingFrameSlot(sender, threading.Lock())
+    # the ring is replaced twice before the receiver attached to the first one
+    for size in (2, 4, 6):
+        slot.put(np.full((size, size), size, dtype=np.uint8))
+    sender.send(None)
+
+    publisher = StoppingPublisher()
+    receive_states(receiver, publisher, {})
+    assert publisher.stopped
+    assert np.array_equal(publisher.frame_slot.get(0), np.full((6, 6), 6, dtype=np.uint8))
+    slot.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_publisher_process():
+    broker = FakeBroker()
+    port = free_port()
+    publisher = PublisherProcess({"broker_address": "127.0.0.1", "broker_port": broker.port,
+                                  "topics": {"changes": "changes", "avail": "avail", "config": "config"}},
+                                 {"video_config": "http://127.0.0.1:{}".format(port), "publish_stream": True})
+    try:
+        publisher.state_queue.put({"changes": [BoardChanges("pi", "LED_1", "on", "red", 0, 1.0)]})
+        assert broker.topics.get(timeout=30) == "changes/pi/LED_1/on/red"
+
+        frame = np.full((32, 48, 3), 120, dtype=np.uint8)
+        done = threading.Event()
+
+        def produce():
+            # frames are only encoded while a client is connected and dropped while the previous one is not read
+            while not done.wait(0.02):
+                publisher.frame_slot.put(frame)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        response = urllib.request.urlopen("http://127.0.0.1:{}/".format(port), timeout=30)
+        _, jpeg = read_part(response)
+        assert jpeg[:2] == b"\xff\xd8"
+        # the stream wants frames while the client is connected
+        assert publisher.frame_slot.active
+        response.close()
+    finally:
+        done.set()
+        producer.join(1)
+        publisher.stop()
+    assert not publisher.process.is_alive()
+    assert publisher.frame_slot.ring is None
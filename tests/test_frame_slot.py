@@ -0,0 +1,80 @@
+import multiprocessing
+import queue
+import threading
+
+from publisher.frame_slot import FrameSlot
+from publisher.master_publisher import MasterPublisher
+
+
+def test_latest_frame_only():
+    slot = FrameSlot()
+    slot.put(1)
+    slot.put(2)
+    assert slot.get() == 2
+    assert slot.dropped == 1
+    assert slot.get(timeout=0.01) is None
+
+
+def test_close_wakes_consumer():
+    slot = FrameSlot()
+    frames = []
+    consumer = threading.Thread(target=lambda: frames.append(slot.get()))
+    consumer.start()
+    slot.close()
+    consumer.join(1)
+    assert not consumer.is_alive() and frames == [None]
+
+
+class BlockingVideo:
+    def __init__(self):
+        self.release = threading.Event()
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame)
+        self.release.wait(5)
+
+    def stop_streaming(self):
+        pass
+
+
+class RecordingMQTT:
+    def __init__(self):
+        self.changes = queue.Queue()
+
+    def publish_changes(self, changes):
+        self.changes.put(changes)
+
+    def disconnect(self):
+        pass
+
+
+def test_changes_are_not_delayed_by_video():
+    changes = queue.Queue()
+    publisher = MasterPublisher(changes)
+    publisher.video_publisher = BlockingVideo()
+    publisher.mqqt_publisher = RecordingMQTT()
+    threading.Thread(target=publisher.run, daemon=True).start()
+
+    for i in range(5):
+        publisher.frame_slot.put(i)
+    changes.put({"changes": "LED_1"})
+    assert publisher.mqqt_publisher.changes.get(timeout=1) == "LED_1"
+
+    publisher.video_publisher.release.set()
+    publisher.stop()
+    assert len(publisher.video_publisher.frames) <= 2
+
+
+def test_active_flag():
+    slot = FrameSlot()
+    assert not slot.active
+    slot.active = True
+    assert slot.active
+
+    # the flag is shared with the producer in another process
+    flag = multiprocessing.Value("b", 0, lock=False)
+    consumer, producer = FrameSlot(flag), FrameSlot(flag)
+    consumer.active = True
+    assert producer.active and flag.value == 1
+    assert producer.reserve((2, 2)) is None
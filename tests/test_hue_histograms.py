@@ -0,0 +1,47 @@
+import numpy as np
+import cv2
+
+from BSP.LED import ColorDetection
+from BSP.LED.ColorDetection.HueComparison import integral
+from BSP.LED.ColorDetection.HueHistograms import hue_histograms, range_integrals, classify, allowed_colors, \
+    roi_layout
+
+
+frame = cv2.imread("resources/Pi/pi_test.jpg")
+boxes = [[230, 275, 240, 285], [227, 295, 237, 305], [400, 400, 420, 410]]
+
+
+def test_batched_histograms_match_single_rois():
+    hists = hue_histograms(frame, boxes)
+    for hist, (x0, y0, x1, y1) in zip(hists, boxes):
+        hsv = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)
+        expected = cv2.calcHist([hsv], [0], None, [180], [0, 180])[:, 0]
+        assert np.all(hist == expected)
+
+
+def test_overlapping_rois_keep_their_pixels():
+    overlapping = [[230, 275, 240, 285], [235, 280, 245, 290], [400, 400, 420, 410]]
+    hists = hue_histograms(frame, overlapping)
+    for hist, (x0, y0, x1, y1) in zip(hists, overlapping):
+        hsv = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)
+        expected = cv2.calcHist([hsv], [0], None, [180], [0, 180])[:, 0]
+        assert np.all(hist == expected)
+    assert roi_layout(tuple(map(tuple, overlapping)), frame.shape[1], frame.shape[0])[2] == [0, 1]
+
+
+def test_range_integrals_match_integral():
+    hists = hue_histograms(frame, boxes)
+    integrals = range_integrals(hists)
+    for led, hist in enumerate(hists):
+        for color, name in enumerate(ColorDetection.COLOR_NAMES):
+            lower, upper = ColorDetection.COLOR_RANGE[name]
+            assert integrals[led, color] == integral(hist, lower, upper)
+
+
+def test_classify():
+    hists = np.zeros((2, 180))
+    hists[0, 175] = 10  # red wraps around 0
+    hists[1, 60] = 10
+    allowed = np.array([allowed_colors(["red", "green"]), allowed_colors(["red", "green"])])
+    assert classify(hists, allowed) == ["red", "green"]
+    assert classify(hists[:1], allowed_colors([])[None]) == [""]
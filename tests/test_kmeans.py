@@ -0,0 +1,13 @@
+import numpy as np
+import cv2
+
+from BSP.LED.ColorDetection.KMeans import k_means, fast_k_means
+
+
+def test_fast_k_means_close_to_k_means():
+    for path in ["led_roi_yellow.jpg", "resources/Pi/led_green.png"]:
+        img = cv2.imread(path)
+        reference = k_means(img)
+        assert np.linalg.norm(fast_k_means(img) - reference) < 10
+        fast_k_means(img, key=path)
+        assert np.linalg.norm(fast_k_means(img, key=path) - reference) < 10
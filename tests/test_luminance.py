@@ -2,7 +2,9 @@ import pytest
 import cv2
 
 # modules to test
-from BSP.detection.luminance_detection import get_most_frequent_luminance, plot_luminance
+from BSP.detection.luminance_detection import get_most_frequent_luminance, plot_luminance, avg_board_brightness, \
+    estimate_board_brightness
+from BSP.BoardOrientation import BoardOrientation
 
 
 frame = cv2.imread("resources/Pi/pi_test.jpg")
@@ -18,4 +20,9 @@ def test_luminance():
     assert most_frequent_luminance == 255
 
 
-
+def test_estimate_board_brightness():
+    corners = [[230, 237], [215, 536], [673, 571], [693, 272]]
+    orientation = BoardOrientation(None, corners)
+    expected = avg_board_brightness(frame, corners)
+    for stride in (1, 2, 4):
+        assert abs(estimate_board_brightness(frame, orientation, stride) - expected) < 0.5
@@ -0,0 +1,256 @@
+import time
+
+import paho.mqtt.client as mqtt
+
+from publisher.connection.message.change_msg import BoardChanges
+from publisher.connection.mqtt.mqtt_connector import MQTTConnector
+from publisher.connection.mqtt.spool import MessageSpool, HEADER
+from FakeBroker import FakeBroker
+
+
+class PublishInfo:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class FlakyBroker(MQTTConnector):
+    """Stands in for the broker, recording the published messages while connected and acknowledging them on ack"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.connected = True
+        self.published = []
+        self.unacked = []
+        self.mid = 0
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.mid += 1
+        if not self.connected:
+            return PublishInfo(mqtt.MQTT_ERR_NO_CONN, self.mid)
+        self.published.append((topic, payload if isinstance(payload, str) else bytes(payload).decode()))
+        if qos > 0:
+            self.unacked.append(self.mid)
+        return PublishInfo(mqtt.MQTT_ERR_SUCCESS, self.mid)
+
+    def ack(self):
+        for mid in self.unacked:
+            self.publish_callback(self, None, mid)
+        self.unacked = []
+
+
+class DroppingBroker(FakeBroker):
+    """Records the PUBLISH packets together with the number of their connection and acknowledges them if wanted"""
+
+    def __init__(self):
+        self.acknowledge = True
+        self.received = []
+        super().__init__()
+
+    def handle_publish(self, connection, header, topic, rest):
+        self.received.append((self.connections, topic))
+        if (header >> 1) & 3 == 1 and self.acknowledge:
+            connection.sendall(bytes([0x40, 2]) + rest[:2])
+
+
+def wait_for(condition, timeout=10.0):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end
+        time.sleep(0.01)
+
+
+def test_append_peek_commit(tmp_path):
+    spool = MessageSpool(str(tmp_path), segment_size=64)
+    for i in range(10):
+        spool.append("changes/" + str(i), "payload " + str(i), float(i))
+    assert spool.depth == 10
+
+    messages = spool.peek(3)
+    assert [m[1] for m in messages] == ["changes/0", "changes/1", "changes/2"]
+    assert messages[0] == (0.0, "changes/0", b"payload 0")
+    assert spool.depth == 10
+
+    spool.commit(3)
+    assert spool.depth == 7
+    assert [m[0] for m in spool.peek(10)] == [float(i) for i in range(3, 10)]
+
+    spool.commit(7)
+    assert spool.depth == 0
+    assert spool.peek(1) == []
+    spool.append("changes/10", "payload 10", 10.0)
+    assert spool.peek(5) == [(10.0, "changes/10", b"payload 10")]
+    spool.close()
+
+
+def test_restart(tmp_path):
+    spool = MessageSpool(str(tmp_path), segment_size=64)
+    for i in range(6):
+        spool.append("changes", str(i), float(i))
+    spool.commit(4)
+    spool.close()
+
+    spool = MessageSpool(str(tmp_path), segment_size=64)
+    assert spool.depth == 2
+    spool.append("changes", "6", 6.0)
+    assert [m[2] for m in spool.peek(10)] == [b"4", b"5", b"6"]
+    spool.close()
+
+
+def test_partial_record(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    spool.append("changes", "0", 0.0)
+    spool.close()
+    with open(spool._path(0), "ab") as file:
+        file.write(b"\x00\x01")
+
+    spool = MessageSpool(str(tmp_path))
+    assert spool.depth == 1
+    spool.append("changes", "1", 1.0)
+    assert [m[2] for m in spool.peek(10)] == [b"0", b"1"]
+    spool.close()
+
+
+def test_peek_skips_partial_record(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    spool.append("changes", "0", 0.0)
+    # a message that is still written
+    with open(spool._path(0), "ab") as file:
+        file.write(HEADER.pack(1.0, 7, 100) + b"changes" + b"partial")
+    assert spool.peek(10) == [(0.0, "changes", b"0")]
+    spool.close()
+
+
+def test_bounded(tmp_path):
+    spool = MessageSpool(str(tmp_path), max_bytes=1024, segment_size=256)
+    for i in range(200):
+        spool.append("changes", "{:04d}".format(i), float(i))
+    assert spool.size <= 1024
+    assert spool.dropped > 0
+    assert spool.depth + spool.dropped == 200
+    # the newest messages are kept
+    assert spool.peek(spool.depth)[-1][2] == b"0199"
+    assert spool.metrics() == {"depth": spool.depth, "bytes": spool.size, "dropped": spool.dropped}
+    spool.close()
+
+
+def test_connector_spools_while_disconnected(tmp_path):
+    broker = FlakyBroker({"topics": {"changes": "changes", "avail": "avail", "config": "config"},
+                          "spool_dir": str(tmp_path), "spool_rate": 2})
+    broker.publish_changes(BoardChanges("board", "led1", "on", "red", 0.0, 1.0))
+    assert len(broker.published) == 1
+
+    broker.connected = False
+    broker.publish_changes(BoardChanges("board", "led1", "off", "red", 0.0, 2.0))
+    broker.publish_changes(BoardChanges("board", "led2", "on", "green", 0.0, 3.0))
+    assert broker.drain_spool(10) == 0
+    assert broker.spool_metrics()["depth"] == 2
+
+    broker.connected = True
+    # new changes wait for the stored ones to keep the order
+    broker.publish_changes(BoardChanges("board", "led1", "on", "red", 0.0, 4.0))
+    assert len(broker.published) == 1
+    assert broker.drain_spool(broker.spool_rate) == 2
+    assert broker.drain_spool(broker.spool_rate) == 1
+    assert [topic for topic, _ in broker.published] == ["changes/board/led1/on/red", "changes/board/led1/off/red",
+                                                       "changes/board/led2/on/green", "changes/board/led1/on/red"]
+    # stored changes are kept until the broker acknowledged them
+    assert broker.spool_metrics()["depth"] == 3
+    assert broker.spool_metrics()["in_flight"] == 3
+    broker.ack()
+    assert broker.spool_metrics()["depth"] == 0
+    assert broker.spool_metrics()["in_flight"] == 0
+    broker.spool.close()
+
+
+def test_spool_overflows_while_in_flight(tmp_path):
+    broker = FlakyBroker({"topics": {"changes": "changes", "avail": "avail", "config": "config"},
+                          "spool_dir": str(tmp_path / "spool")})
+    broker.spool.close()
+    broker.spool = MessageSpool(str(tmp_path / "small"), max_bytes=1024, segment_size=256)
+    broker.connected = False
+    for i in range(3):
+        broker.publish_changes(BoardChanges("board", "led{}".format(i), "on", "red", 0.0, float(i)))
+    broker.connected = True
+    assert broker.drain_spool(2) == 2
+
+    # the segment with the changes in flight is dropped
+    broker.connected = False
+    count = 3
+    while broker.spool.dropped == 0:
+        broker.publish_changes(BoardChanges("board", "led{}".format(count), "on", "red", 0.0, float(count)))
+        count += 1
+    assert broker.spool_metrics()["in_flight"] == 0
+    first = broker.spool.dropped
+    assert broker.spool.peek(1)[0][1] == "changes/board/led{}/on/red".format(first)
+
+    # their acknowledgements do not remove the changes of the next segment, which have not been sent
+    broker.ack()
+    assert broker.spool_metrics()["depth"] == count - first
+    broker.connected = True
+    broker.published = []
+    while broker.spool_metrics()["depth"] > 0:
+        broker.drain_spool(10)
+        broker.ack()
+    assert [topic for topic, _ in broker.published] == ["changes/board/led{}/on/red".format(i)
+                                                        for i in range(first, count)]
+    broker.spool.close()
+
+
+def test_no_acks_kept_without_spool():
+    broker = FakeBroker()
+    connector = MQTTConnector({"broker_address": "127.0.0.1", "broker_port": broker.port,
+                               "topics": {"changes": "changes", "avail": "avail", "config": "config"}})
+    connector.connect()
+    connector.loop_start()
+    try:
+        wait_for(connector.is_connected)
+        for i in range(10):
+            connector.publish_changes(BoardChanges("board", "led1", "on", "red", 0.0, float(i)))
+            connector.publish_heartbeat()
+        for i in range(10):
+            broker.topics.get(timeout=5)
+        assert connector.on_publish is None
+        assert len(connector._acked) == 0
+    finally:
+        connector.disconnect()
+
+
+def test_connection_dropped_mid_stream(tmp_path):
+    broker = DroppingBroker()
+    connector = MQTTConnector({"broker_address": "127.0.0.1", "broker_port": broker.port,
+                               "topics": {"changes": "changes", "avail": "avail", "config": "config"},
+                               "spool_dir": str(tmp_path)})
+    connector.connect()
+    connector.loop_start()
+    try:
+        wait_for(connector.is_connected)
+        connector.publish_changes(BoardChanges("board", "led1", "on", "red", 0.0, 1.0))
+        wait_for(lambda: (1, "changes/board/led1/on/red") in broker.received)
+
+        # the change sent right before the connection is lost is not acknowledged and sent again after reconnecting
+        broker.acknowledge = False
+        connector.publish_changes(BoardChanges("board", "led1", "off", "red", 0.0, 2.0))
+        wait_for(lambda: (1, "changes/board/led1/off/red") in broker.received)
+        broker.drop()
+        wait_for(lambda: not connector.is_connected())
+        connector.publish_changes(BoardChanges("board", "led2", "on", "green", 0.0, 3.0))
+        assert connector.spool_metrics()["depth"] == 1
+
+        # the drained change is lost with the connection as well and stays in the spool
+        wait_for(connector.is_connected)
+        wait_for(lambda: (2, "changes/board/led1/off/red") in broker.received)
+        assert connector.drain_spool(10) == 1
+        wait_for(lambda: (2, "changes/board/led2/on/green") in broker.received)
+        assert connector.spool_metrics()["depth"] == 1
+        broker.acknowledge = True
+        broker.drop()
+
+        wait_for(lambda: (3, "changes/board/led2/on/green") in broker.received)
+        wait_for(lambda: connector.spool_metrics()["depth"] == 0)
+        assert connector.spool_metrics()["in_flight"] == 0
+    finally:
+        connector.disconnect()
@@ -1,6 +1,16 @@
+import json
+import math
 import queue
+import threading
+from queue import Queue
 
+from BSP.state_handler.state_store import StateStore
+from publisher.change_queue import ChangeQueue
+from publisher.connection.message.change_msg import BoardChanges
+from publisher.connection.message.compact_msg import CompactEncoder, decode, HEADER, CHANGE
+from publisher.connection.mqtt.mqtt_connector import MQTTConnector, board_changes_payloads
 from publisher.master_publisher import MasterPublisher
+from FakeBroker import FakeBroker
 import asyncio as aio
 
 queue = queue.Queue()
@@ -11,3 +21,182 @@ mqtt_config = {"broker_address": "89.58.3.45", "broker_port": 1883,
 def test_publishing():
     publisher = MasterPublisher(queue)
     publisher.init_mqqt(mqtt_config)
+
+
+class RecordingMQTT:
+    def __init__(self):
+        self.single = []
+        self.batches = []
+
+    def publish_changes(self, changes):
+        self.single.append(changes)
+
+    def publish_board_changes(self, changes):
+        self.batches.append(changes)
+
+
+def test_board_changes_payloads():
+
+    changes = [BoardChanges("pi", "LED_1", "on", "red", 0, 1.0), BoardChanges("pi", "LED_2", "off", "", 2.0, 2.0, 0.25, 0.9),
+               BoardChanges("zcu", "LED_1", "on", "green", 0, 1.5)]
+    payloads = board_changes_payloads(changes)
+    assert sorted(payloads.keys()) == ["pi", "zcu"]
+    board = payloads["pi"]["boards"][0]
+    assert board["time"] == 2.0
+    assert [change["id"] for change in board["changes"]] == ["LED_1", "LED_2"]
+    assert board["changes"][1] == {"id": "LED_2", "value": "off", "color": "", "frequency": 2.0, "time": 2.0,
+                                   "duty_cycle": 0.25, "confidence": 0.9}
+    assert board["changes"][0]["duty_cycle"] is None and board["changes"][0]["confidence"] is None
+
+
+def test_batch_window():
+    changes_queue = Queue()
+    publisher = MasterPublisher(changes_queue)
+    publisher.mqqt_publisher = RecordingMQTT()
+    publisher.running = True
+
+    aio.run(publisher.publish_changes(["a", "b"]))
+    assert publisher.mqqt_publisher.single == ["a", "b"]
+
+    publisher.batch_changes = True
+    publisher.batch_window = 0.05
+    changes_queue.put({"changes": ["c"]})
+    aio.run(publisher.publish_changes(["a", "b"]))
+    assert publisher.mqqt_publisher.batches == [["a", "b", "c"]]
+    publisher.mqqt_publisher = None
+
+
+def test_change_queue_wakes_loop():
+
+    async def consume(changes_queue):
+        changes_queue.bind(aio.get_running_loop())
+        threading.Timer(0.05, changes_queue.put, ["a"]).start()
+        first = await aio.wait_for(changes_queue.get_async(), 1)
+        try:
+            await aio.wait_for(changes_queue.get_async(), 0.05)
+        except aio.TimeoutError:
+            pass
+        changes_queue.put("b")
+        return first, await changes_queue.get_async()
+
+    assert aio.run(consume(ChangeQueue())) == ("a", "b")
+
+
+def test_single_loop():
+
+    broker = FakeBroker()
+    changes_queue = ChangeQueue()
+    publisher = MasterPublisher(changes_queue)
+    publisher.init_mqqt({"broker_address": "127.0.0.1", "broker_port": broker.port,
+                         "topics": {"changes": "changes", "avail": "avail", "config": "config"}})
+    threads = threading.active_count()
+    runner = threading.Thread(target=publisher.run)
+    runner.start()
+
+    changes_queue.put({"changes": [BoardChanges("pi", "LED_1", "on", "red", 0, 1.0)]})
+    assert broker.topics.get(timeout=5) == "changes/pi/LED_1/on/red"
+    # the changes, the MQTT client and the heartbeat share one thread, only the video has its own
+    assert threading.active_count() <= threads + 2
+
+    publisher.stop()
+    runner.join(5)
+    assert not runner.is_alive()
+    assert broker.topics.get(timeout=5) == "avail"
+
+
+def test_compact_encoding():
+
+    encoder = CompactEncoder({"pi": ["LED_1", "LED_2"]})
+    assert encoder.schema("pi")["leds"] == ["LED_1", "LED_2"]
+    version = encoder.versions["pi"]
+
+    changes = [BoardChanges("pi", "LED_2", "on", "green", 0.5, 100.25, 0.5, 0.75),
+               BoardChanges("pi", "LED_1", "off", None, None, 100.0)]
+    payload, schema_changed = encoder.encode("pi", changes)
+    assert not schema_changed
+    assert len(payload) == HEADER.size + 2 * CHANGE.size
+    schema = json.loads(json.dumps(encoder.schema("pi")))
+    decoded = decode(payload, schema)
+    assert decoded[0] == {"id": "LED_2", "value": "on", "color": "green", "frequency": 0.5, "time": 100.25,
+                          "duty_cycle": 0.5, "confidence": 0.75}
+    assert decoded[1]["id"] == "LED_1" and decoded[1]["color"] == "" and math.isnan(decoded[1]["frequency"])
+    assert math.isnan(decoded[1]["duty_cycle"]) and math.isnan(decoded[1]["confidence"])
+
+    # unknown leds extend the schema, the new schema still decodes the old message
+    payload_new, schema_changed = encoder.encode("pi", [BoardChanges("pi", "LED_3", "on", "orange", 0, 101.0)])
+    assert schema_changed and encoder.versions["pi"] == version + 1
+    assert decode(payload_new, encoder.schema("pi"))[0]["color"] == "orange"
+    assert decode(payload, encoder.schema("pi"))[0] == decoded[0]
+    try:
+        decode(payload_new, schema)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_compact_publishing():
+
+    class RecordingConnector(MQTTConnector):
+        def __init__(self, config):
+            super().__init__(config)
+            self.messages = []
+
+        def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+            self.messages.append((topic, payload, retain))
+
+    connector = RecordingConnector({"topics": {"changes": "changes", "avail": "avail", "config": "config"},
+                                    "encoding": "compact", "led_ids": {"pi": ["LED_1"]}})
+    connector.publish_changes(BoardChanges("pi", "LED_1", "on", "red", 0, 1.0))
+    connector.publish_board_changes([BoardChanges("pi", "LED_2", "on", "red", 0, 2.0),
+                                     BoardChanges("zcu", "LED_1", "off", "", 0, 2.0)])
+    topics = [(topic, retain) for topic, _, retain in connector.messages]
+    assert topics == [("changes/pi", False), ("schema/pi", True), ("changes/pi", False), ("schema/zcu", True),
+                      ("changes/zcu", False)]
+    schema = json.loads(connector.messages[1][1])
+    assert decode(connector.messages[2][1], schema)[0]["id"] == "LED_2"
+
+
+def test_snapshots():
+
+    class RecordingConnector(MQTTConnector):
+        def __init__(self, config):
+            super().__init__(config)
+            self.messages = []
+
+        def is_connected(self):
+            return True
+
+        def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+            self.messages.append((topic, json.loads(payload), retain))
+
+    store = StateStore()
+    publisher = MasterPublisher(queue)
+    publisher.mqqt_publisher = RecordingConnector({"topics": {"changes": "changes", "avail": "avail",
+                                                              "config": "config"}})
+    publisher.init_snapshots({"pi": store.snapshot}, 0.05)
+
+    def insert(led_id, state, time):
+        store.insert({"led_id": led_id, "state": state, "color": "red" if state == "on" else math.nan, "time": time,
+                      "last_time_off": -math.inf, "last_time_on": -math.inf, "frequency": math.nan})
+
+    async def run():
+        publisher._changes_published = aio.Event()
+        task = aio.ensure_future(publisher.publish_snapshots())
+        insert("LED_1", "on", 1.0)
+        publisher._changes_published.set()
+        await aio.sleep(0.02)
+        # changes within the interval are combined
+        insert("LED_2", "off", 2.0)
+        insert("LED_1", "off", 3.0)
+        publisher._changes_published.set()
+        await aio.sleep(0.15)
+        task.cancel()
+
+    aio.run(run())
+    messages = publisher.mqqt_publisher.messages
+    assert len(messages) == 2
+    assert messages[0] == ("snapshot/pi", {"id": "pi", "leds": [
+        {"id": "LED_1", "value": "on", "color": "red", "frequency": None, "time": 1.0}]}, True)
+    assert [(led["id"], led["value"], led["color"]) for led in messages[1][1]["leds"]] == [("LED_1", "off", ""),
+                                                                                         ("LED_2", "off", "")]
+    publisher.mqqt_publisher = None
@@ -1,6 +1,7 @@
 import threading
 import time
 
+import numpy as np
 import pytest
 from BDG.model.board_model import Board
 from BSP.BufferlessVideoCapture import BufferlessVideoCapture
@@ -8,7 +9,6 @@ from BSP.state_detector import StateDetector
 from cv2 import cv2
 import BDG.utils.json_util as jsutil
 from MockVideoCapture import MockVideoCapture
-from BSP.state_handler.state_table import get_state_table, get_last_entry, get_current_state, get_led_ids
 
 
 def test_blackbox_state_detector():
@@ -21,8 +21,8 @@ def test_blackbox_state_detector():
 
             # if dec.state_table[0].current_state is None or dec.state_table[1].current_state is None:
             #     continue
-            led_0 = get_last_entry("LED_Red")
-            led_1 = get_last_entry("LED_Green")
+            led_0 = dec.state_store.get_last_entry("LED_Red")
+            led_1 = dec.state_store.get_last_entry("LED_Green")
             # Assert LEDs on and off based on the video
             if i < 120:
                 assert led_0["state"] == "on", "LED 0 not detected correctly"
@@ -41,3 +41,25 @@ def test_blackbox_state_detector():
                 assert led_1["state"] == "on", "LED 1 not detected correctly"
 
     cv2.destroyAllWindows()
+
+
+def test_fast_sampling(tmp_path):
+    reference = jsutil.from_json(file_path="resources/Pi/pi_test.json")
+    # the boxes refer to the frame rotated by 180 degrees, the second one exceeds the frame
+    height, width = 48, 64
+    boxes = [[10, 8, 20, 18], [width - 4, 30, width + 6, 40]]
+    rotated = np.zeros((height, width, 3), dtype=np.uint8)
+    rotated[8:18, 10:20] = 200
+    rotated[30:40, width - 4:width] = 100
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / "frame_{:03d}.png".format(i)), cv2.rotate(rotated, cv2.ROTATE_180))
+
+    with StateDetector(reference=reference, webcam_id=0, fast_sampling=True, delay_in_seconds=60) as dec:
+        dec.open_stream(MockVideoCapture(str(tmp_path / "frame_%03d.png"), False))
+        dec._roi_boxes = boxes
+        # samples all frames and returns once the video capture is closed
+        dec.start()
+        assert dec._board_observer.roi_brightnesses == pytest.approx([200, 100])
+        times, values = dec._board_observer.blink_estimator.samples()
+        assert len(times) == 3
+        assert values[:, 1] == pytest.approx([100, 100, 100])
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from BSP.state_handler.state_log import StateLog, RECORD_DTYPE
+from BSP.state_handler.state_store import StateStore
+from BSP.state_handler.state_table import insert_state_entry
+
+
+def entry(led_id, state, timestamp, color="red"):
+    return {"led_id": led_id, "state": state, "color": color, "time": timestamp, "last_time_off": -np.inf,
+            "last_time_on": timestamp, "frequency": 0.5}
+
+
+def test_append_and_read(tmp_path):
+    log = StateLog(str(tmp_path))
+    for i in range(5):
+        log.append(entry("LED_1", "on" if i % 2 else "off", i))
+    records = log.read()
+    assert len(records) == 5
+    assert list(records["time"]) == [0, 1, 2, 3, 4]
+    assert list(log.read(1, 3)["time"]) == [1, 2]
+
+    table = log.to_dataframe()
+    assert list(table["led_id"].unique()) == ["LED_1"]
+    assert list(table["state"][:2]) == ["off", "on"]
+    log.close()
+
+
+def test_rotation(tmp_path):
+    log = StateLog(str(tmp_path), max_file_size=2 * RECORD_DTYPE.itemsize, max_files=2)
+    for i in range(5):
+        log.append(entry("LED_1", "on", i))
+    log.close()
+    assert len(log.files()) == 2
+    assert list(log.read()["time"]) == [2, 3, 4]
+
+
+def test_replay_after_restart(tmp_path):
+    log = StateLog(str(tmp_path))
+    log.append(entry("LED_1", "on", 1))
+    log.append(entry("LED_2", "off", 2, ""))
+    log.close()
+
+    # append to the existing files after a restart
+    log = StateLog(str(tmp_path))
+    log.append(entry("LED_1", "off", 3, ""))
+    store = StateStore()
+    log.replay(store)
+    assert store.led_ids() == ["LED_1", "LED_2"]
+    assert store.get_last_entry("LED_1")["time"] == 3
+    assert store.get_last_entry("LED_1")["state"] == "off"
+    assert len(os.listdir(str(tmp_path))) == 1
+    log.close()
+
+
+def test_long_fields_are_rejected(tmp_path):
+    log = StateLog(str(tmp_path))
+    log.append(entry("L" * 32, "on", 1, "c" * 16))
+    with pytest.raises(ValueError):
+        log.append(entry("L" * 33, "on", 2))
+    with pytest.raises(ValueError):
+        log.append(entry("LED_1", "on", 3, "c" * 17))
+    assert list(log.read()["time"]) == [1]
+    log.close()
+
+
+def test_insert_after_replay(tmp_path):
+    log = StateLog(str(tmp_path))
+    log.append(entry("LED_1", "on", 1))
+    store = StateStore()
+    log.replay(store)
+    log.close()
+
+    # the replayed state is decoded into a new str, the same state is no transition
+    inserted = insert_state_entry(store, "LED_1", "on", "red", timestamp=2)
+    assert inserted["last_time_on"] == 2
+    assert inserted["last_time_off"] == -np.inf
+    assert inserted["frequency"] == 0
+
+    inserted = insert_state_entry(store, "LED_1", "off", "", timestamp=4)
+    assert inserted["last_time_on"] == 2
+    inserted = insert_state_entry(store, "LED_1", "on", "red", timestamp=6)
+    assert inserted["last_time_off"] == 4
+    assert inserted["frequency"] == 0.25
@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from BSP.state_handler.state_store import StateStore, COLUMNS
+
+
+def entry(led_id, state, timestamp, color="red"):
+    return {"led_id": led_id, "state": state, "color": color, "time": timestamp, "last_time_off": -np.inf,
+            "last_time_on": timestamp, "frequency": 0}
+
+
+def test_last_entry():
+    store = StateStore()
+    assert store.is_new("LED_1")
+    assert store.get_last_entry("LED_1") is None
+
+    store.insert(entry("LED_1", "on", 1))
+    store.insert(entry("LED_2", "off", 2, ""))
+    store.insert(entry("LED_1", "off", 3, "green"))
+    assert not store.is_new("LED_1")
+    assert store.get_last_entry("LED_1")["time"] == 3
+    assert store.get_last_entry("LED_1")["color"] == "green"
+    assert store.led_ids() == ["LED_1", "LED_2"]
+
+
+def test_to_dataframe_keeps_insertion_order():
+    store = StateStore()
+    store.insert(entry("LED_1", "on", 1))
+    store.insert(entry("LED_2", "off", 2, ""))
+    store.insert(entry("LED_1", "off", 3, "green"))
+
+    table = store.to_dataframe()
+    assert list(table.columns) == COLUMNS
+    assert list(table["led_id"]) == ["LED_1", "LED_2", "LED_1"]
+    assert list(table["state"]) == ["on", "off", "off"]
+    assert list(table["color"]) == ["red", "", "green"]
+    assert list(store.to_dataframe("LED_1")["time"]) == [1, 3]
+    assert StateStore().to_dataframe().empty
+
+
+def test_ring_buffer_is_bounded():
+    store = StateStore(max_rows=4)
+    for i in range(10):
+        store.insert(entry("LED_1", "on" if i % 2 else "off", i))
+    assert len(store) == 4
+    assert list(store.to_dataframe()["time"]) == [6, 7, 8, 9]
+    assert store.get_last_entry("LED_1")["time"] == 9
+
+    store.clear()
+    assert len(store) == 0 and store.is_new("LED_1")
+
+
+def test_max_age():
+    store = StateStore(max_age=5)
+    for i in range(10):
+        store.insert(entry("LED_1", "on" if i % 2 else "off", i))
+    assert list(store.to_dataframe()["time"]) == [4, 5, 6, 7, 8, 9]
+
+
+def test_compaction_keeps_statistics():
+    store = StateStore(max_rows=2, aggregate_interval=10)
+    # on for 1 second of every 2 seconds
+    for i in range(40):
+        store.insert(entry("LED_1", "on" if i % 2 else "off", i))
+    assert len(store) == 2
+
+    aggregates = store.aggregates("LED_1")
+    assert list(aggregates["interval_start"]) == [0, 10, 20, 30]
+    assert list(aggregates["on_time"][:3]) == [5, 5, 5]
+    assert list(aggregates["transitions"]) == [9, 10, 10, 10]
+    # retained entries are included
+    assert aggregates["on_time"].iloc[3] == 4
+    # without compaction the retained entries are aggregated on request
+    assert StateStore().aggregates("LED_1", 10).empty
+
+
+def test_compacted_history_is_rebinned():
+    store = StateStore(max_rows=2, aggregate_interval=10)
+    for i in range(40):
+        store.insert(entry("LED_1", "on" if i % 2 else "off", i))
+
+    aggregates = store.aggregates("LED_1", 20)
+    assert list(aggregates["interval_start"]) == [0, 20]
+    assert list(aggregates["on_time"]) == [10, 9]
+    assert list(aggregates["transitions"]) == [19, 20]
+    for interval in [5, 15]:
+        with pytest.raises(ValueError):
+            store.aggregates("LED_1", interval)
+
+
+def test_queries():
+    store = StateStore(max_rows=8)
+    # wrap around the ring buffer
+    for i in range(12):
+        store.insert(entry("LED_1", "on" if i // 2 % 2 else "off", i))
+    store.insert(entry("LED_2", "on", 5))
+
+    assert store.state_at("LED_1", 3) is None
+    assert store.state_at("LED_1", 6.5)["time"] == 6
+    assert store.state_at("LED_1", 7)["state"] == "on"
+    assert store.state_at("LED_2", 100)["state"] == "on"
+
+    transitions = store.transitions(5, 10)
+    assert list(transitions["time"]) == [5, 6, 8, 10]
+    assert list(transitions["led_id"]) == ["LED_2", "LED_1", "LED_1", "LED_1"]
+    # the first retained entry is a transition
+    assert list(store.transitions(0, 5, "LED_1")["time"]) == [4]
+
+    assert store.duty_cycle("LED_1", 4, 8) == 0.5
+    assert store.duty_cycle("LED_1", 6, 7) == 1.0
+    assert np.isnan(store.duty_cycle("LED_1", 0, 4))
+
+    snapshot = store.snapshot()
+    assert snapshot["LED_1"]["time"] == 11 and snapshot["LED_2"]["time"] == 5
+
+
+def test_snapshot_is_not_changed_by_inserts():
+    store = StateStore()
+    store.insert(entry("LED_1", "on", 1))
+    snapshot = store.snapshot()
+    version = store.version
+    store.insert(entry("LED_1", "off", 2))
+    store.insert(entry("LED_2", "on", 2))
+    assert snapshot["LED_1"]["state"] == "on" and "LED_2" not in snapshot
+    assert store.snapshot()["LED_1"]["state"] == "off"
+    assert store.version == version + 2
+
+
+def test_update_frequency_replaces_snapshot_only():
+    store = StateStore()
+    assert store.update_frequency("LED_1", 2.0) is None
+    store.insert(entry("LED_1", "on", 1))
+    snapshot = store.snapshot()
+
+    assert store.update_frequency("LED_1", 2.0)["frequency"] == 2.0
+    assert store.snapshot() is not snapshot and snapshot["LED_1"]["frequency"] == 0
+    assert store.get_last_entry("LED_1")["frequency"] == 2.0
+    assert len(store) == 1
@@ -1,37 +1,50 @@
 import pytest
 
 from BSP.frame_anotations.frame_anotator import plot_all_led_time_series, draw_plot
+from BSP.state_handler.state_store import StateStore
 from BSP.state_handler.state_table import *
 import time
 
 
-@pytest.fixture(autouse=True)
-def run_around_tests():
-    clear_state_table()
+@pytest.fixture
+def store():
+    return StateStore()
 
 
-def test_init_state_table():
-    table = load_state_table("resources/example_log.csv")
+def test_init_state_table(store):
+    table = load_state_table(store, "resources/example_log.csv")
     led_ids = table["led_id"].unique()
     assert np.all(led_ids == ["LED_1", "LED_2", "LED_3"])
 
 
-def test_insert():
+def test_insert(store):
     timestamp = time.time_ns()
-    insert_state_entry("LED_1", "off", "red", timestamp)
-    last_entry = get_last_entry("LED_1")
+    insert_state_entry(store, "LED_1", "off", "red", timestamp)
+    last_entry = get_last_entry(store, "LED_1")
     assert timestamp == last_entry["time"]
 
 
-def test_plot():
-    load_state_table("resources/example_log.csv")
-    draw_plot()
+def test_plot(store):
+    load_state_table(store, "resources/example_log.csv")
+    draw_plot(store)
 
 
-def test_insert_in_new():
+def test_insert_in_new(store):
     timestamp = time.time_ns()
-    insert_state_entry("LED_1", "on", "red", timestamp)
-    assert np.all(get_led_ids() == np.array(["LED_1"]))
-    insert_state_entry("LED_1", "off", "green", timestamp + 1)
-    entry = get_last_entry("LED_1")
+    insert_state_entry(store, "LED_1", "on", "red", timestamp)
+    assert np.all(get_led_ids(store) == np.array(["LED_1"]))
+    insert_state_entry(store, "LED_1", "off", "green", timestamp + 1)
+    entry = get_last_entry(store, "LED_1")
     assert entry["last_time_on"] == timestamp
+
+
+def test_save_and_load(store, tmp_path):
+    insert_state_entry(store, "LED_1", "on", "red", 1)
+    insert_state_entry(store, "LED_1", "off", "", 2)
+    file_name = str(tmp_path / "state_table.csv")
+    save_state_table(store, file_name)
+    clear_state_table(store)
+
+    table = load_state_table(store, file_name)
+    assert list(table["state"]) == ["on", "off"]
+    assert get_last_entry(store, "LED_1")["last_time_on"] == 1
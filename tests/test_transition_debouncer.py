@@ -0,0 +1,39 @@
+import numpy as np
+
+from BSP.LED.StateDetection.TransitionDebouncer import TransitionDebouncer
+
+
+def test_first_state_is_confirmed_immediately():
+    debouncer = TransitionDebouncer(2, confirm_frames=3)
+    confirmed, since = debouncer.update([1, -1], [-1, -1], 1.0)
+    assert list(confirmed) == [True, False]
+    assert since[0] == 1.0
+
+
+def test_single_noisy_frame_is_suppressed():
+    debouncer = TransitionDebouncer(2, confirm_frames=2)
+    reported = np.array([1, 0])
+    confirmed, _ = debouncer.update([0, 0], reported, 1.0)
+    assert not confirmed.any()
+    confirmed, _ = debouncer.update([1, 0], reported, 2.0)
+    assert not confirmed.any()
+    assert debouncer.suppressed == 1 and debouncer.confirmed == 0
+
+
+def test_confirm_by_frames_reports_first_detection_time():
+    debouncer = TransitionDebouncer(1, confirm_frames=3)
+    reported = np.array([0])
+    assert not debouncer.update([1], reported, 1.0)[0][0]
+    assert debouncer.is_pending(0)
+    assert not debouncer.update([1], reported, 2.0)[0][0]
+    confirmed, since = debouncer.update([1], reported, 3.0)
+    assert confirmed[0] and since[0] == 1.0
+    assert not debouncer.is_pending(0)
+
+
+def test_confirm_seconds_bounds_latency():
+    debouncer = TransitionDebouncer(1, confirm_frames=10, confirm_seconds=0.5)
+    reported = np.array([0])
+    assert not debouncer.update([1], reported, 1.0)[0][0]
+    assert debouncer.update([1], reported, 1.5)[0][0]
+    assert debouncer.max_latency == 0.5
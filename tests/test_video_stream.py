@@ -1,5 +1,12 @@
+import socket
+import time
+import urllib.request
+
+import cv2
+import numpy as np
+
 from MockVideoCapture import MockVideoCapture
-from publisher.connection.video import VideoStream
+from publisher.connection.video import MjpegStream, VideoStream
 
 
 def test_stream():
@@ -14,3 +21,116 @@ def test_stream():
     vs.stop_streaming()
 
 
+
+
+class FakeProcess:
+    def __init__(self):
+        self.stdin = self
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(data)
+
+    def kill(self):
+        pass
+
+
+class RecordingStream(VideoStream):
+    def start_streaming(self, width, height, fps=30):
+        self.size = (width, height)
+        self.process = FakeProcess()
+
+
+def test_scaled_and_rate_limited():
+
+    vs = RecordingStream("rtmp://localhost:8080", True, width=320, max_fps=10, on_demand=False)
+    frame = np.zeros((481, 641, 3), dtype=np.uint8)
+    start = time.monotonic()
+    while time.monotonic() - start < 0.5:
+        vs.write(frame)
+        time.sleep(0.005)
+    process = vs.process
+    vs.stop_streaming()
+
+    assert vs.size == (320, 240)
+    assert len(process.frames[0]) == 320 * 240 * 3
+    assert 3 <= len(process.frames) <= 7
+    assert vs.frame_slot.dropped > 50
+
+
+def test_on_demand():
+
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    vs = RecordingStream("rtmp://localhost:{}".format(server.getsockname()[1]), True, on_demand=True)
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+
+    assert not vs.has_client()
+    assert vs.wants_frames()
+    for i in range(5):
+        vs.write_frame(frame)
+    # ffmpeg is started to listen, but no frame is written, which would block until a client connects
+    assert vs.process is not None
+    assert vs.frames_written == 0
+    assert not vs.wants_frames()
+
+    client = socket.create_connection(server.getsockname())
+    connection, _ = server.accept()
+    assert vs.has_client()
+    assert vs.wants_frames()
+    for i in range(5):
+        vs.write_frame(frame)
+    assert vs.frames_written == 5
+    client.close()
+    connection.close()
+    server.close()
+
+
+def read_part(response):
+    headers = {}
+    assert response.readline().strip() == b"--frame"
+    line = response.readline().strip()
+    while line:
+        key, value = line.decode().split(": ")
+        headers[key] = value
+        line = response.readline().strip()
+    jpeg = response.read(int(headers["Content-Length"]))
+    response.readline()
+    return headers, jpeg
+
+
+def test_mjpeg_stream():
+
+    stream = MjpegStream("http://127.0.0.1:0", True, width=64, quality=50)
+    frame = np.full((96, 128, 3), 200, dtype=np.uint8)
+    stream.write(frame)
+    time.sleep(0.1)
+    # no client, nothing is encoded
+    assert stream.frames_encoded == 0
+
+    url = "http://127.0.0.1:{}/".format(stream.port)
+    first = urllib.request.urlopen(url, timeout=5)
+    second = urllib.request.urlopen(url, timeout=5)
+    assert first.headers["Content-Type"] == "multipart/x-mixed-replace; boundary=frame"
+    start = time.monotonic()
+    while stream.clients < 2 and time.monotonic() - start < 5:
+        time.sleep(0.01)
+
+    stream.write(frame)
+    headers, jpeg = read_part(first)
+    assert headers["Content-Type"] == "image/jpeg"
+    assert read_part(second)[1] == jpeg
+    assert stream.frames_encoded == 1
+    image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape == (48, 64, 3)
+
+    try:
+        urllib.request.urlopen(url + "missing", timeout=5)
+        assert False
+    except urllib.error.HTTPError as e:
+        assert e.code == 404
+
+    first.close()
+    second.close()
+    stream.stop_streaming()